@@ -2,10 +2,18 @@ from __future__ import annotations
 
 import hashlib
 import os
+import sqlite3
+import tempfile
+import threading
+from array import array
+from contextlib import closing
+from dataclasses import dataclass
+from functools import lru_cache
 from itertools import chain
-from typing import Literal, Optional
+from typing import Any, Iterable, Literal, Optional
 
 from django.conf import settings
+from django.core.cache import cache
 from pydantic import BaseModel, HttpUrl
 import requests
 from typing_extensions import TypedDict
@@ -25,6 +33,12 @@ ANIME_WEBSITES = {
 
 ANIME_PICTURE_DIR = os.path.join(settings.MEDIA_ROOT, 'ap')
 
+ANIME_DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+ANIME_DATABASE_PATH = os.path.join(
+    ANIME_DATA_DIR, 'mpaod', 'anime-offline-database.json'
+)
+ANIME_INDEX_PATH = settings.ANIME_INDEX_PATH
+
 
 class Season(TypedDict):
     year: Optional[int]
@@ -112,52 +126,261 @@ class Anime(BaseModel):
         )
 
     def related_anime(self) -> list[str]:
-        from .models import Track
-
-        return [
-            title
-            for title, anime in sorted(
-                (
-                    (title, anime)
-                    for title, anime in (
-                        (anime_title, get_anime(anime_title))
-                        for anime_title in Track.all_anime_titles()
-                    )
-                    if anime is not None
-                    and any((source in self.relations for source in anime.sources))
-                ),
-                key=lambda ta: ta[1].quarter,
+        relations = anime_relations()
+        return sorted(
+            {
+                title
+                for relation in self.relations
+                for title in relations.titles_by_source.get(str(relation), ())
+            },
+            key=lambda title: (relations.quarters[title], title),
+        )
+
+
+def _anime_kwargs(entry: dict[str, Any]) -> dict[str, Any]:
+    """
+    Convert an entry from the anime offline database into keyword arguments
+    for :class:`Anime`.
+    """
+
+    entry = dict(entry)
+    return {
+        'sources': [],
+        'relations': entry.pop('relatedAnime'),
+        **{camel_to_snake(k): v for k, v in entry.items()},
+    }
+
+
+def build_anime_index(
+    source: str = ANIME_DATABASE_PATH, destination: str = ANIME_INDEX_PATH
+) -> None:
+    """
+    Compile the anime offline database at `source` into an SQLite index at
+    `destination`, which maps every title and synonym to the entry we'd most
+    likely want for it.
+
+    The index is written to a temporary file and then moved into place, so
+    other processes will only ever see a complete one.
+    """
+
+    stat = os.stat(source)
+
+    with open(source, 'rt') as aodf:
+        entries = ujson.load(aodf)['data']
+
+    by_title: dict[str, tuple[tuple[int, float], int]] = {}
+    rows: list[tuple[int, str]] = []
+
+    for anime_id, entry in enumerate(entries):
+        kwargs = _anime_kwargs(entry)
+        ranking = Anime(**kwargs).inclusion_ranking()
+        rows.append((anime_id, ujson.dumps(kwargs)))
+
+        for title in chain([kwargs['title']], kwargs['synonyms']):
+            if (title not in by_title) or (by_title[title][0] > ranking):
+                by_title[title] = (ranking, anime_id)
+
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(destination) or '.', suffix='.tmp'
+    )
+    os.close(fd)
+
+    try:
+        with closing(sqlite3.connect(temp_path)) as db:
+            with db:
+                db.execute('CREATE TABLE anime (id INTEGER PRIMARY KEY, data TEXT)')
+                db.execute(
+                    'CREATE TABLE title '
+                    '(title TEXT PRIMARY KEY, anime_id INTEGER) WITHOUT ROWID'
+                )
+                db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+                db.executemany('INSERT INTO anime VALUES (?, ?)', rows)
+                db.executemany(
+                    'INSERT INTO title VALUES (?, ?)',
+                    ((title, anime_id) for title, (_, anime_id) in by_title.items()),
+                )
+                db.execute(
+                    'INSERT INTO meta VALUES (?, ?)',
+                    ('source', _source_signature(stat)),
+                )
+
+        os.replace(temp_path, destination)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _source_signature(stat: os.stat_result) -> str:
+    return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def _index_is_current(
+    source: str = ANIME_DATABASE_PATH, destination: str = ANIME_INDEX_PATH
+) -> bool:
+    if not os.path.exists(destination):
+        return False
+
+    try:
+        source_stat = os.stat(source)
+    except FileNotFoundError:
+        # we have an index but nothing to build one from; use what we've got
+        return True
+
+    try:
+        with closing(sqlite3.connect(f'file:{destination}?mode=ro', uri=True)) as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+    except sqlite3.DatabaseError:
+        return False
+
+    return row is not None and row[0] == _source_signature(source_stat)
+
+
+_index_lock = threading.Lock()
+_index_version: Optional[str] = None
+_local = threading.local()
+
+
+def _ensure_index() -> str:
+    """
+    (Re)build the anime index if this process hasn't yet made sure it reflects
+    the current anime offline database, and return the signature of the
+    database it was built from.
+    """
+
+    global _index_version
+
+    if _index_version is None:
+        with _index_lock:
+            if _index_version is None:
+                if not _index_is_current():
+                    build_anime_index()
+
+                with closing(
+                    sqlite3.connect(f'file:{ANIME_INDEX_PATH}?mode=ro', uri=True)
+                ) as db:
+                    (_index_version,) = db.execute(
+                        "SELECT value FROM meta WHERE key = 'source'"
+                    ).fetchone()
+
+    return _index_version
+
+
+def _anime_index() -> sqlite3.Connection:
+    """
+    Return this thread's connection to the anime index.
+    """
+
+    _ensure_index()
+    db = getattr(_local, 'db', None)
+
+    if db is None:
+        db = _local.db = sqlite3.connect(
+            f'file:{ANIME_INDEX_PATH}?mode=ro', uri=True, check_same_thread=False
+        )
+
+    return db
+
+
+class AnimeCatalog:
+    """
+    The whole anime index, packed into a handful of flat buffers.
+
+    A process can load this before it forks its workers and they'll all share
+    the same physical copy of it, since there are no per-entry Python objects
+    whose reference counts would be touched (and pages therefore copied) when
+    they're used. Entries are only decoded when they're looked up.
+    """
+
+    def __init__(
+        self,
+        titles: bytes,
+        title_offsets: array[int],
+        title_entries: array[int],
+        data: bytes,
+        data_offsets: array[int],
+    ) -> None:
+        self.titles = titles
+        self.title_offsets = title_offsets
+        self.title_entries = title_entries
+        self.data = data
+        self.data_offsets = data_offsets
+
+    @classmethod
+    def load(cls, path: str = ANIME_INDEX_PATH) -> AnimeCatalog:
+        with closing(sqlite3.connect(f'file:{path}?mode=ro', uri=True)) as db:
+            entries = db.execute('SELECT id, data FROM anime ORDER BY id').fetchall()
+            positions = {anime_id: i for i, (anime_id, _) in enumerate(entries)}
+            titles = sorted(
+                (title.encode(), positions[anime_id])
+                for title, anime_id in db.execute('SELECT title, anime_id FROM title')
             )
-        ]
-
-
-by_title: dict[str, Anime] = {}
-
-with open(
-    os.path.join(
-        os.path.dirname(__file__),
-        'data',
-        'mpaod',
-        'anime-offline-database.json',
-    ),
-    'rt',
-) as aodf:
-    for d in ujson.load(aodf)['data']:
-        a = Anime(
-            **{
-                'sources': [],
-                'relations': d.pop('relatedAnime'),
-                **{camel_to_snake(k): v for k, v in d.items()},
-            }
+
+        title_offsets = array('Q', [0])
+        title_entries = array('L')
+        for title, position in titles:
+            title_offsets.append(title_offsets[-1] + len(title))
+            title_entries.append(position)
+
+        encoded_entries = [data.encode() for _, data in entries]
+        data_offsets = array('Q', [0])
+        for data in encoded_entries:
+            data_offsets.append(data_offsets[-1] + len(data))
+
+        return cls(
+            titles=b''.join(title for title, _ in titles),
+            title_offsets=title_offsets,
+            title_entries=title_entries,
+            data=b''.join(encoded_entries),
+            data_offsets=data_offsets,
         )
 
-        for title in chain([a.title], a.synonyms):
-            if (title not in by_title) or (
-                by_title[title].inclusion_ranking() > a.inclusion_ranking()
-            ):
-                by_title[title] = a
+    def _title(self, index: int) -> bytes:
+        return self.titles[self.title_offsets[index] : self.title_offsets[index + 1]]
+
+    def data_for(self, title: str) -> Optional[str]:
+        """
+        Return the serialised :class:`Anime` for `title`, if we have one.
+        """
+
+        key = title.encode()
+        low, high = 0, len(self.title_entries)
+
+        # titles are sorted by their UTF-8 encoding, which we can compare
+        # without decoding anything
+        while low < high:
+            middle = (low + high) // 2
+            if self._title(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == len(self.title_entries) or self._title(low) != key:
+            return None
+
+        entry = self.title_entries[low]
+        return self.data[
+            self.data_offsets[entry] : self.data_offsets[entry + 1]
+        ].decode()
+
+
+_catalog: Optional[AnimeCatalog] = None
+
+
+def preload_anime_catalog() -> None:
+    """
+    Load the whole anime index into memory as an :class:`AnimeCatalog`, which
+    :func:`get_anime` will use from then on. Call this in a server's master
+    process before it forks, if :data:`settings.ANIME_CATALOG_PRELOAD` is set.
+    """
+
+    global _catalog
+
+    _ensure_index()
+    _catalog = AnimeCatalog.load()
+    get_anime.cache_clear()
 
 
+@lru_cache(maxsize=settings.ANIME_CACHE_SIZE)
 def get_anime(title: str) -> Optional[Anime]:
     """
     >>> get_anime('Machikado Mazoku').title
@@ -167,7 +390,21 @@ def get_anime(title: str) -> Optional[Anime]:
     >>> get_anime('shamiko')
     """
 
-    return by_title.get(title)
+    if _catalog is not None:
+        data = _catalog.data_for(title)
+        return None if data is None else Anime(**ujson.loads(data))
+
+    row = (
+        _anime_index()
+        .execute(
+            'SELECT anime.data FROM title JOIN anime ON anime.id = title.anime_id '
+            'WHERE title.title = ?',
+            (title,),
+        )
+        .fetchone()
+    )
+
+    return None if row is None else Anime(**ujson.loads(row[0]))
 
 
 def fuzzy_nkdsu_aliases() -> dict[str, str]:
@@ -201,25 +438,170 @@ def fuzzy_nkdsu_aliases() -> dict[str, str]:
      'エイジ': 'Eiji'}
     """
 
-    from .models import Track
+    return dict(_alias_index().aliases)
 
+
+TRIGRAM_LENGTH = 3
+
+
+def _trigrams(string: str) -> set[str]:
     return {
-        alt_title.lower(): title
-        for anime, title in map(lambda t: (get_anime(t), t), Track.all_anime_titles())
-        if anime is not None
-        for alt_title in anime.titles()
+        string[i : i + TRIGRAM_LENGTH] for i in range(len(string) - TRIGRAM_LENGTH + 1)
     }
 
 
-def suggest_anime(query: str) -> set[str]:
-    lower_query = query.lower()
-    suggestions: set[str] = set()
+class AliasIndex:
+    """
+    A trigram index over the aliases returned by :func:`fuzzy_nkdsu_aliases`,
+    for finding the aliases that contain a given substring without looking
+    at every one of them.
+    """
+
+    def __init__(self, aliases: dict[str, str]) -> None:
+        self.aliases = aliases
+        self.by_trigram: dict[str, set[str]] = {}
+
+        for alias in aliases:
+            for trigram in _trigrams(alias):
+                self.by_trigram.setdefault(trigram, set()).add(alias)
+
+    def search(self, lower_query: str) -> set[str]:
+        """
+        Return the titles of the anime that have an alias containing
+        `lower_query`.
+        """
+
+        trigrams = _trigrams(lower_query)
+
+        if trigrams:
+            # every alias containing the query contains all of its trigrams;
+            # start with the rarest, since that's the fewest aliases to check
+            candidates: Iterable[str] = min(
+                (self.by_trigram.get(trigram, set()) for trigram in trigrams),
+                key=len,
+            )
+        else:
+            candidates = self.aliases
+
+        return {self.aliases[alias] for alias in candidates if lower_query in alias}
+
+
+@dataclass(frozen=True)
+class AnimeRelations:
+    """
+    Which anime in the library are related to which other anime in the
+    library, according to the anime offline database and to their names.
+    """
+
+    #: in-library titles, keyed by each of the source URLs of their anime
+    titles_by_source: dict[str, list[str]]
+
+    #: in-library titles, keyed by the in-library titles with similar names
+    related_by_name: dict[str, list[str]]
+
+    #: the quarter each in-library title with anime data aired in
+    quarters: dict[str, str]
+
+    @classmethod
+    def build(cls, titles: Iterable[str]) -> AnimeRelations:
+        from .models import anime_names_are_related
+
+        titles = sorted(titles)
+        titles_by_source: dict[str, list[str]] = {}
+        quarters: dict[str, str] = {}
+
+        for title in titles:
+            anime = get_anime(title)
 
-    for alias, canonical_title in fuzzy_nkdsu_aliases().items():
-        if lower_query in alias:
-            suggestions.add(canonical_title)
+            if anime is None:
+                continue
+
+            quarters[title] = anime.quarter
+            for source in anime.sources:
+                titles_by_source.setdefault(str(source), []).append(title)
+
+        related_by_name: dict[str, list[str]] = {title: [] for title in titles}
+
+        for i, a in enumerate(titles):
+            for b in titles[i + 1 :]:
+                if anime_names_are_related(a, b):
+                    related_by_name[a].append(b)
+                    related_by_name[b].append(a)
+
+        return cls(
+            titles_by_source=titles_by_source,
+            related_by_name=related_by_name,
+            quarters=quarters,
+        )
+
+
+_relations_cache: Optional[tuple[str, AnimeRelations]] = None
+
+
+def anime_relations() -> AnimeRelations:
+    """
+    Return the :class:`AnimeRelations` for the current library and anime
+    offline database, building it only if neither this process nor the cache
+    has one for this combination already.
+    """
+
+    from .models import Track
+
+    global _relations_cache
+
+    titles = sorted(Track.all_anime_titles())
+    version = hashlib.md5('\n'.join([_ensure_index(), *titles]).encode()).hexdigest()
+    cached = _relations_cache
+
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    cache_key = f'vote:anime:relations:{version}'
+    relations = cache.get(cache_key)
+
+    if relations is None:
+        relations = AnimeRelations.build(titles)
+        cache.set(cache_key, relations, 60 * 60 * 24)
+
+    _relations_cache = (version, relations)
+    return relations
+
+
+_alias_index_cache: Optional[tuple[frozenset[str], AliasIndex]] = None
+
+
+def _alias_index() -> AliasIndex:
+    """
+    Return an :class:`AliasIndex` for the anime currently in the library,
+    reusing the last one we built unless the set of anime has changed since.
+    """
+
+    from .models import Track
+
+    global _alias_index_cache
+
+    titles = frozenset(Track.all_anime_titles())
+    cached = _alias_index_cache
+
+    if cached is not None and cached[0] == titles:
+        return cached[1]
+
+    index = AliasIndex(
+        {
+            alt_title.lower(): title
+            for anime, title in map(lambda t: (get_anime(t), t), titles)
+            if anime is not None
+            for alt_title in anime.titles()
+        }
+    )
+    _alias_index_cache = (titles, index)
+    return index
+
+
+def suggest_anime(query: str) -> set[str]:
+    suggestions = _alias_index().search(query.lower())
 
-            if len(suggestions) > MAX_ANIME_SUGGESTIONS:
-                return set()
+    if len(suggestions) > MAX_ANIME_SUGGESTIONS:
+        return set()
 
     return suggestions
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate, post_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 
 
 class VoteConfig(AppConfig):
@@ -7,6 +14,39 @@ class VoteConfig(AppConfig):
 
     def ready(self) -> None:
         from . import signals
+        from .models import Block, Discard, Play, Shortlist, Show, Track, Vote
 
         post_save.connect(signals.create_profile_on_user_creation)
+        post_save.connect(signals.sync_track_metadata, sender=Track)
         post_migrate.connect(signals.make_elfs)
+
+        for signal in (post_save, post_delete):
+            signal.connect(signals.invalidate_pk_cached_for_show, sender=Show)
+            signal.connect(signals.forget_registered_shows, sender=Show)
+            signal.connect(signals.invalidate_pk_cached_for_track, sender=Track)
+            signal.connect(signals.forget_linkable_artists, sender=Track)
+            signal.connect(signals.invalidate_pk_cached_for_vote, sender=Vote)
+            signal.connect(signals.invalidate_pk_cached_for_play, sender=Play)
+            signal.connect(signals.refresh_stats_for_vote, sender=Vote)
+            signal.connect(signals.refresh_stats_for_play, sender=Play)
+
+            for model in (Block, Discard, Shortlist):
+                signal.connect(
+                    signals.invalidate_pk_cached_for_show_and_track, sender=model
+                )
+
+        pre_delete.connect(
+            signals.invalidate_pk_cached_for_tracks_of_deleted_vote, sender=Vote
+        )
+        m2m_changed.connect(
+            signals.invalidate_pk_cached_for_vote_tracks, sender=Vote.tracks.through
+        )
+
+        pre_save.connect(signals.remember_previous_stats_for_vote, sender=Vote)
+        post_save.connect(signals.finalize_vote, sender=Vote)
+        pre_save.connect(signals.remember_previous_show_for_play, sender=Play)
+        pre_delete.connect(signals.remember_votes_for_track, sender=Track)
+        post_delete.connect(signals.refresh_stats_for_track, sender=Track)
+        m2m_changed.connect(
+            signals.refresh_stats_for_vote_tracks, sender=Vote.tracks.through
+        )
@@ -0,0 +1,223 @@
+"""
+Blurry background art for tracks, made from whatever artwork last.fm has for
+them, and a way of fetching it for lots of tracks at once.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+from concurrent.futures import (
+    Executor,
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextvars import copy_context
+from dataclasses import dataclass
+from io import BytesIO
+from itertools import islice
+from typing import Callable, Iterable, Mapping, Optional, TYPE_CHECKING
+
+from PIL import Image, ImageFilter
+from django.conf import settings
+
+from . import external_lookups
+from .external_lookups import LookupCache, RateLimiter, lookup_cache
+
+if TYPE_CHECKING:
+    from .models import Track
+
+
+logger = logging.getLogger(__name__)
+
+#: how many tracks per lookup thread to have on the go at once; the rest wait
+#: in the iterable we were given, rather than in memory
+TRACKS_IN_FLIGHT_PER_THREAD = 4
+
+#: how many pieces of blurred art to keep around for other tracks with the
+#: same artwork to use
+ART_CACHE_SIZE = 64
+
+
+def blur_background_art(image_data: bytes) -> bytes:
+    """
+    Turn an image into a blurred JPEG to use as background art.
+
+    :raises OSError: if `image_data` isn't an image that we can read
+    """
+
+    input_image = Image.open(BytesIO(image_data))
+
+    if input_image.mode not in ['L', 'RGB']:
+        input_image = input_image.convert('RGB')
+
+    # in almost all circumstances, it will be width that determines display
+    # size, so we should set our blur radius relative to that.
+    radius = input_image.size[0] / 130
+
+    blurred = input_image.filter(ImageFilter.GaussianBlur(radius=radius))
+
+    output = BytesIO()
+    blurred.save(output, 'JPEG', quality=60)
+    return output.getvalue()
+
+
+@dataclass
+class FetchedArt:
+    track: Track
+    source: Optional[str]
+    jpeg: Optional[bytes] = None
+    unchanged: bool = False
+
+
+@dataclass
+class BackgroundArtResults:
+    updated: int = 0
+    unchanged: int = 0
+    missing: int = 0
+    failed: int = 0
+
+    @property
+    def has_art(self) -> int:
+        return self.updated + self.unchanged
+
+
+class BackgroundArtFetcher:
+    """
+    Fetch background art for lots of tracks at once.
+
+    Looking tracks up and downloading their artwork happens in a pool of
+    `threads`, sharing a :class:`.LookupCache` so that tracks from the same
+    album or by the same artist don't look the same things up again, and
+    spacing requests to each host out according to `rate_limits` (by default,
+    :data:`~nkdsu.settings.BACKGROUND_ART_RATE_LIMITS`). Blurring happens in
+    a pool of `processes`, or in the lookup threads if that's 0. Tracks whose
+    artwork comes from the same place it did last time are left alone.
+
+    Only a few tracks per thread are worked on at once, and only the most
+    recent art is kept around for other tracks to use, so fetching art for
+    the whole library doesn't mean holding all of it in memory.
+
+    Saving happens in the calling thread, since that's the one with the
+    database connection (and transaction) that the tracks came from.
+    """
+
+    def __init__(
+        self,
+        threads: int = 8,
+        processes: Optional[int] = None,
+        rate_limits: Optional[Mapping[str, float]] = None,
+    ) -> None:
+        self.threads = threads
+        self.processes = processes
+        self.rate_limiter = RateLimiter(
+            settings.BACKGROUND_ART_RATE_LIMITS if rate_limits is None else rate_limits
+        )
+        self.lookups = LookupCache(self.rate_limiter)
+        self.art = LookupCache(max_size=ART_CACHE_SIZE)
+
+    def _fetch(self, track: Track, blur_pool: Optional[Executor]) -> FetchedArt:
+        source = track.get_biggest_lastfm_image_url()
+
+        if source is None:
+            return FetchedArt(track, None)
+
+        if source == track.background_art_source and track.background_art:
+            return FetchedArt(track, source, unchanged=True)
+
+        # tracks from the same album often have the same art
+        jpeg = self.art.lookup(source, lambda: self._download(source, blur_pool))
+        return FetchedArt(track, source, jpeg=jpeg)
+
+    def _download(self, source: str, blur_pool: Optional[Executor]) -> Optional[bytes]:
+        response = external_lookups.get(source)
+        response.raise_for_status()
+
+        try:
+            if blur_pool is None:
+                return blur_background_art(response.content)
+            else:
+                return blur_pool.submit(blur_background_art, response.content).result()
+        except OSError as e:
+            logger.warning('could not read art from %s: %s', source, e)
+            return None
+
+    def fetch(
+        self,
+        tracks: Iterable[Track],
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> BackgroundArtResults:
+        """
+        Fetch and save background art for `tracks`, calling `progress` with
+        the number of tracks we've finished with each time we finish with
+        one.
+        """
+
+        results = BackgroundArtResults()
+        blur_pool: Optional[Executor] = None
+
+        if self.processes != 0:
+            # forking once the lookup threads have started would be asking
+            # for trouble, so start the blurring processes from scratch
+            blur_pool = ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context('spawn')
+            )
+
+        try:
+            with lookup_cache(self.lookups), ThreadPoolExecutor(self.threads) as pool:
+                remaining = iter(tracks)
+                in_flight: dict[Future[FetchedArt], Track] = {}
+                done = 0
+
+                def submit_more() -> None:
+                    for track in islice(
+                        remaining,
+                        self.threads * TRACKS_IN_FLIGHT_PER_THREAD - len(in_flight),
+                    ):
+                        future = pool.submit(
+                            copy_context().run, self._fetch, track, blur_pool
+                        )
+                        in_flight[future] = track
+
+                submit_more()
+
+                while in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                    for future in finished:
+                        # once it's saved, let go of the art
+                        track = in_flight.pop(future)
+
+                        try:
+                            fetched = future.result()
+                        except Exception:
+                            logger.exception('could not fetch art for %s', track)
+                            results.failed += 1
+                        else:
+                            self._save(fetched, results)
+
+                        done += 1
+                        if progress is not None:
+                            progress(done)
+
+                    submit_more()
+        finally:
+            if blur_pool is not None:
+                blur_pool.shutdown()
+
+        return results
+
+    def _save(self, fetched: FetchedArt, results: BackgroundArtResults) -> None:
+        if fetched.unchanged:
+            results.unchanged += 1
+            return
+
+        fetched.track.set_background_art(fetched.source, fetched.jpeg)
+
+        if fetched.jpeg is None:
+            results.missing += 1
+        else:
+            results.updated += 1
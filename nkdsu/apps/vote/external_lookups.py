@@ -0,0 +1,270 @@
+"""
+Lookups against external services like last.fm and MusicBrainz.
+
+Requests made with :func:`get` share a pooled :class:`requests.Session` per
+thread and time out after :data:`~nkdsu.settings.LOOKUP_TIMEOUT` seconds.
+Lookups made through :func:`cached_lookup` are remembered in the ``lookups``
+cache for :data:`~nkdsu.settings.LOOKUP_CACHE_TTL` seconds, or, if the
+service didn't know what we were talking about,
+:data:`~nkdsu.settings.LOOKUP_NOT_FOUND_TTL` seconds.
+
+For when we're about to make a lot of lookups at once, from several threads,
+there's also a :class:`LookupCache`. While one is active (see
+:func:`lookup_cache`), each distinct lookup is only made once, no matter how
+many tracks or threads ask for it, and requests to each host are spaced out
+according to a :class:`RateLimiter`.
+"""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import md5
+from time import monotonic, sleep
+from typing import Any, Callable, Hashable, Iterator, Mapping, Optional, TypeVar
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+T = TypeVar('T')
+
+#: the alias of the cache that :func:`cached_lookup` remembers things in, if
+#: it's configured
+CACHE_ALIAS = 'lookups'
+
+_MISSING = object()
+_local = threading.local()
+
+
+class RateLimiter:
+    """
+    Space requests out so that we make no more than a given number of them
+    per second to each host. Hosts we don't have a limit for are not limited.
+
+    >>> limiter = RateLimiter({'example.com': 20})
+    >>> start = monotonic()
+    >>> for i in range(3):
+    ...     limiter.wait('https://example.com/')
+    >>> monotonic() - start >= 0.1
+    True
+    >>> start = monotonic()
+    >>> for i in range(3):
+    ...     limiter.wait('https://example.org/')
+    >>> monotonic() - start < 0.1
+    True
+    """
+
+    def __init__(self, per_second: Mapping[str, float]) -> None:
+        self.intervals = {host: 1 / rate for host, rate in per_second.items()}
+        self.next_slots: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        """
+        Block until it's okay to make a request to `url`.
+        """
+
+        host = urlparse(url).hostname or url
+        interval = self.intervals.get(host)
+
+        if interval is None:
+            return
+
+        with self._lock:
+            now = monotonic()
+            slot = max(now, self.next_slots.get(host, now))
+            self.next_slots[host] = slot + interval
+
+        if slot > now:
+            sleep(slot - now)
+
+
+class LookupCache:
+    """
+    Remembers lookups, and spaces requests out according to `rate_limiter`.
+    If `max_size` is given, only that many finished lookups are remembered;
+    the oldest are forgotten first.
+
+    >>> lookups = LookupCache(max_size=1)
+    >>> lookups.lookup('a', lambda: 1), lookups.lookup('a', lambda: 2)
+    (1, 1)
+    >>> lookups.lookup('b', lambda: 3), lookups.lookup('a', lambda: 4)
+    (3, 4)
+    """
+
+    def __init__(
+        self,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_size: Optional[int] = None,
+    ) -> None:
+        self.rate_limiter = rate_limiter or RateLimiter({})
+        self.max_size = max_size
+        self._lookups: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _forget_old_lookups(self) -> None:
+        if self.max_size is None:
+            return
+
+        # dicts remember what order things were added in, so this goes from
+        # oldest to newest
+        for key, future in list(self._lookups.items()):
+            if len(self._lookups) <= self.max_size:
+                return
+
+            if future.done():
+                del self._lookups[key]
+
+    def lookup(self, key: Hashable, func: Callable[[], T]) -> T:
+        """
+        Return what `func` returns, calling it only if nobody has asked for
+        `key` before. If another thread is already calling it, wait for that
+        call to finish rather than making another one.
+        """
+
+        with self._lock:
+            future = self._lookups.get(key)
+            is_ours = future is None
+
+            if future is None:
+                future = self._lookups[key] = Future()
+                self._forget_old_lookups()
+
+        if not is_ours:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+
+
+_active_cache: ContextVar[Optional[LookupCache]] = ContextVar(
+    'lookup_cache', default=None
+)
+
+
+def active_lookup_cache() -> Optional[LookupCache]:
+    return _active_cache.get()
+
+
+@contextmanager
+def lookup_cache(cache: LookupCache) -> Iterator[LookupCache]:
+    """
+    Activate `cache` for the duration of the block. Threads don't inherit
+    this, so work handed to a thread pool should be run within a copy of the
+    current :mod:`contextvars` context.
+    """
+
+    token = _active_cache.set(cache)
+
+    try:
+        yield cache
+    finally:
+        _active_cache.reset(token)
+
+
+def session() -> requests.Session:
+    """
+    Return this thread's :class:`requests.Session`, which retries requests
+    that fail in ways that might be temporary.
+    """
+
+    session = getattr(_local, 'session', None)
+
+    if session is None:
+        session = _local.session = requests.Session()
+        adapter = HTTPAdapter(
+            max_retries=Retry(
+                total=2, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504]
+            )
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    return session
+
+
+def throttle(url: str) -> None:
+    """
+    Wait until the active :class:`LookupCache`'s :class:`RateLimiter` says we
+    can make a request to `url`.
+    """
+
+    cache = _active_cache.get()
+
+    if cache is not None:
+        cache.rate_limiter.wait(url)
+
+
+def get(url: str, params: Optional[Mapping[str, Any]] = None) -> requests.Response:
+    throttle(url)
+    return session().get(url, params=params, timeout=settings.LOOKUP_TIMEOUT)
+
+
+def lookup_cache_key(service: str, params: Mapping[str, Any]) -> str:
+    """
+    >>> lookup_cache_key('lastfm', {'b': 2, 'a': 1}) == lookup_cache_key(
+    ...     'lastfm', {'a': 1, 'b': 2}
+    ... )
+    True
+    """
+
+    digest = md5(repr(sorted(params.items())).encode()).hexdigest()
+    return f'lookup:{service}:{digest}'
+
+
+def cached_lookup(
+    service: str,
+    params: Mapping[str, Any],
+    fetch: Callable[[], tuple[T, Optional[bool]]],
+) -> T:
+    """
+    Look something up with `fetch`, unless we already know the answer.
+    `service` and `params` say what's being looked up.
+
+    `fetch` should return what it found, along with :data:`True` if it was
+    found, :data:`False` if the service told us there was nothing to find, or
+    :data:`None` if the answer isn't worth remembering (because the service
+    had some temporary problem, for instance).
+    """
+
+    key = lookup_cache_key(service, params)
+
+    def fetch_or_remember() -> T:
+        store = caches[
+            CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else DEFAULT_CACHE_ALIAS
+        ]
+        hit = store.get(key, _MISSING)
+
+        if hit is not _MISSING:
+            return hit
+
+        value, found = fetch()
+
+        if found is not None:
+            store.set(
+                key,
+                value,
+                settings.LOOKUP_CACHE_TTL if found else settings.LOOKUP_NOT_FOUND_TTL,
+            )
+
+        return value
+
+    cache = _active_cache.get()
+
+    if cache is None:
+        return fetch_or_remember()
+
+    return cache.lookup(key, fetch_or_remember)
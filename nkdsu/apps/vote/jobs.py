@@ -0,0 +1,330 @@
+"""
+A small, database-backed queue for admin operations that take too long to do
+within a web request, like updating the library or fetching background art.
+
+Views :func:`enqueue` a :class:`.Job` by name, and the ``run_jobs`` management
+command picks it up and calls the function registered under that name with
+:func:`job`. Each function gets its :class:`.Job` as its first argument, so
+that it can :meth:`~.Job.report_progress`, followed by the arguments the job
+was queued with, and can return a message to show once it's done.
+
+Files that a job needs, like uploaded libraries, are written to
+:data:`~nkdsu.settings.JOB_FILE_DIR` with :func:`job_file` and passed around
+by path, so the worker has to run on the same machine as the website and see
+the same directory. :func:`discard_abandoned_files` cleans up the ones that
+nothing is waiting for any more.
+"""
+
+from __future__ import annotations
+
+import datetime
+import os
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, IO, Iterator, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import AbstractBaseUser, AnonymousUser
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from .background_art import BackgroundArtFetcher
+from .models import Job, Track
+from .myriad_export import entries_for_file, update_matched_tracks
+from .update_library import discard_library_file, update_library_file
+
+
+#: How often, in seconds, :func:`run_job` tells everyone that a job is still
+#: running. This should be well under :data:`~nkdsu.settings.JOB_STALE_AFTER`.
+HEARTBEAT_INTERVAL: float = 60
+
+JobFunction = Callable[..., Optional[str]]
+
+_jobs: dict[str, JobFunction] = {}
+
+
+def job(name: str) -> Callable[[JobFunction], JobFunction]:
+    """
+    Register the decorated function as the job called `name`.
+    """
+
+    def register(func: JobFunction) -> JobFunction:
+        _jobs[name] = func
+        return func
+
+    return register
+
+
+def enqueue(
+    name: str,
+    created_by: Optional[AbstractBaseUser | AnonymousUser] = None,
+    **arguments: Any,
+) -> Job:
+    """
+    Queue up the job called `name`, to be called with `arguments`, which must
+    be serialisable as JSON.
+    """
+
+    if name not in _jobs:
+        raise ValueError(f'there is no job called {name!r}')
+
+    return Job.objects.create(
+        name=name,
+        arguments=arguments,
+        created_by=(
+            created_by
+            if created_by is not None and created_by.is_authenticated
+            else None
+        ),
+    )
+
+
+def job_file(prefix: str, suffix: str) -> IO[bytes]:
+    """
+    Open a new file in :data:`~nkdsu.settings.JOB_FILE_DIR` for a job to pick
+    up later. It isn't deleted when it's closed; the job should do that once
+    it's done with it.
+    """
+
+    os.makedirs(settings.JOB_FILE_DIR, exist_ok=True)
+    return tempfile.NamedTemporaryFile(
+        prefix=prefix, suffix=suffix, dir=settings.JOB_FILE_DIR, delete=False
+    )
+
+
+def discard_abandoned_files() -> int:
+    """
+    Delete files in :data:`~nkdsu.settings.JOB_FILE_DIR` that are older than
+    :data:`~nkdsu.settings.JOB_FILE_MAX_AGE` seconds and that no unfinished
+    job is waiting for, like libraries that were uploaded but never confirmed
+    and the plans saved alongside them, and return how many we deleted.
+    """
+
+    if not os.path.isdir(settings.JOB_FILE_DIR):
+        return 0
+
+    in_use = {
+        value
+        for arguments in Job.objects.filter(
+            status__in=(Job.QUEUED, Job.RUNNING)
+        ).values_list('arguments', flat=True)
+        for value in arguments.values()
+        if isinstance(value, str)
+    }
+    cutoff = time.time() - settings.JOB_FILE_MAX_AGE
+    deleted = 0
+
+    with os.scandir(settings.JOB_FILE_DIR) as entries:
+        for entry in entries:
+            if (
+                not entry.is_file()
+                or entry.stat().st_mtime >= cutoff
+                or any(
+                    entry.path == path or entry.path.startswith(f'{path}.')
+                    for path in in_use
+                )
+            ):
+                continue
+
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                # another worker got to it first
+                continue
+
+            deleted += 1
+
+    return deleted
+
+
+def requeue_stale_jobs() -> int:
+    """
+    Put jobs whose heartbeat hasn't been bumped for more than
+    :data:`~nkdsu.settings.JOB_STALE_AFTER` seconds back in the queue, on the
+    assumption that whatever was running them has died, and return how many
+    there were.
+    """
+
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.JOB_STALE_AFTER)
+
+    return (
+        Job.objects.filter(status=Job.RUNNING)
+        .filter(
+            Q(heartbeat_at__lt=cutoff)
+            # jobs that were claimed before we kept track of this
+            | Q(heartbeat_at=None, started_at__lt=cutoff)
+        )
+        .update(status=Job.QUEUED, started_at=None, heartbeat_at=None, progress=0)
+    )
+
+
+def claim_job() -> Optional[Job]:
+    """
+    Mark the oldest queued job as running and return it, or return
+    :data:`None` if there's nothing to do. Several workers can safely call
+    this at once; only one of them will get any given job.
+    """
+
+    requeue_stale_jobs()
+    queued = Job.objects.filter(status=Job.QUEUED).order_by('created_at', 'pk')
+
+    while True:
+        pk = queued.values_list('pk', flat=True).first()
+
+        if pk is None:
+            return None
+
+        now = timezone.now()
+
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, heartbeat_at=now
+        ):
+            return Job.objects.get(pk=pk)
+
+
+def _this_run(job: Job) -> QuerySet[Job]:
+    """
+    Return a queryset of `job`, as long as it's still running and hasn't been
+    claimed again since we claimed it.
+    """
+
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, started_at=job.started_at)
+
+
+@contextmanager
+def _heartbeat(job: Job) -> Iterator[None]:
+    """
+    Keep bumping `job`'s heartbeat every :data:`HEARTBEAT_INTERVAL` seconds,
+    so that it isn't mistaken for a stale one however long it takes and
+    however rarely it reports its progress.
+    """
+
+    stopped = threading.Event()
+
+    def beat() -> None:
+        try:
+            while not stopped.wait(HEARTBEAT_INTERVAL):
+                _this_run(job).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job {job.pk} heartbeat')
+    thread.start()
+
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job: Job) -> Job:
+    """
+    Run a job that has been claimed with :func:`claim_job`, and record how it
+    went, unless it was queued up again and claimed by someone else while we
+    were running it, in which case it's theirs to record.
+    """
+
+    try:
+        func = _jobs.get(job.name)
+        if func is None:
+            raise LookupError(f'there is no job called {job.name!r}')
+        with _heartbeat(job):
+            message = func(job, **job.arguments)
+    except Exception:
+        job.status = Job.FAILED
+        job.message = traceback.format_exc()
+    else:
+        job.status = Job.SUCCEEDED
+        job.message = message or ''
+
+    job.finished_at = timezone.now()
+    _this_run(job).update(
+        status=job.status, message=job.message, finished_at=job.finished_at
+    )
+    return job
+
+
+def run_queued_jobs() -> int:
+    """
+    Run jobs until there are none left in the queue, and return how many we
+    ran.
+    """
+
+    count = 0
+
+    while (claimed := claim_job()) is not None:
+        run_job(claimed)
+        count += 1
+
+    return count
+
+
+@job('plan_library_update')
+def plan_library_update(job: Job, library_path: str, inudesu: bool) -> str:
+    # the plan is saved alongside the library, for the confirmation page to
+    # show and for update_library to use
+    changes = update_library_file(library_path, dry_run=True, inudesu=inudesu)
+    return f'library update planned; {len(changes)} changes to make'
+
+
+# jobs that work on files only delete them once they've succeeded, so that
+# failed ones can be tried again; discard_abandoned_files() gets the rest
+
+
+@job('update_library')
+def update_library(job: Job, library_path: str, inudesu: bool) -> str:
+    changes = update_library_file(library_path, dry_run=False, inudesu=inudesu)
+    discard_library_file(library_path)
+    return f'library updated; {len(changes)} changes made'
+
+
+@job('import_myriad_export')
+def import_myriad_export(job: Job, csv_path: str) -> str:
+    with open(csv_path, encoding='utf-8', newline='') as csv_file:
+        entries = list(entries_for_file(csv_file))
+
+    job.report_progress(0, len(entries))
+    matched, unmatched = update_matched_tracks(entries)
+    job.report_progress(len(entries))
+    os.remove(csv_path)
+
+    return (
+        'myriad export imported. '
+        f'{matched} entries matched to tracks; {unmatched} entries unmatched.'
+    )
+
+
+@job('migrate_away_from')
+def migrate_away_from(job: Job, to_remove_id: str, target_id: str) -> str:
+    call_command('migrate_away_from', to_remove_id, target_id)
+    return f'migrated {to_remove_id} to {target_id}'
+
+
+@job('update_background_art')
+def update_background_art(
+    job: Job, track_id: Optional[str] = None, quick: bool = False
+) -> str:
+    tracks = Track.objects.all()
+
+    if track_id is not None:
+        tracks = tracks.filter(pk=track_id)
+
+    if quick:
+        tracks = tracks.filter(background_art='')
+
+    job.report_progress(0, tracks.count())
+    results = BackgroundArtFetcher().fetch(
+        tracks.iterator(), progress=job.report_progress
+    )
+
+    return (
+        f'art found for {results.has_art} tracks '
+        f'({results.unchanged} unchanged); '
+        f'{results.missing} tracks have none, and {results.failed} failed'
+    )
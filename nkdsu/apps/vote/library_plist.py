@@ -0,0 +1,105 @@
+"""
+An incremental reader for the XML property lists that iTunes exports its
+library as, for when we only need to look at one track at a time and would
+rather not hold a whole library's worth of :mod:`plistlib` tree in memory.
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime
+from typing import Any, BinaryIO, Iterator
+from xml.etree.ElementTree import Element, iterparse
+
+
+def _value(element: Element) -> Any:
+    """
+    Convert a plist value element into the same Python object that
+    :func:`plistlib.loads` would have made of it.
+    """
+
+    tag = element.tag
+
+    if tag == 'dict':
+        children = list(element)
+        return {
+            key.text or '': _value(value)
+            for key, value in zip(children[::2], children[1::2])
+        }
+    elif tag == 'array':
+        return [_value(child) for child in element]
+    elif tag == 'string':
+        return element.text or ''
+    elif tag == 'integer':
+        return int(element.text or '')
+    elif tag == 'real':
+        return float(element.text or '')
+    elif tag == 'true':
+        return True
+    elif tag == 'false':
+        return False
+    elif tag == 'date':
+        return datetime.datetime.strptime(element.text or '', '%Y-%m-%dT%H:%M:%SZ')
+    elif tag == 'data':
+        return base64.b64decode(element.text or '')
+    else:
+        raise ValueError(f'unexpected plist element <{tag}>')
+
+
+def iter_library_tracks(file: BinaryIO) -> Iterator[dict[str, Any]]:
+    """
+    Yield the track dicts from the ``Tracks`` dict of the iTunes library in
+    `file`, one at a time, discarding each one's XML once it's been read.
+
+    >>> from io import BytesIO
+    >>> library = BytesIO(b'''<?xml version="1.0" encoding="UTF-8"?>
+    ... <plist version="1.0"><dict>
+    ...   <key>Major Version</key><integer>1</integer>
+    ...   <key>Tracks</key>
+    ...   <dict>
+    ...     <key>1</key>
+    ...     <dict>
+    ...       <key>Name</key><string>song</string>
+    ...       <key>Total Time</key><integer>1000</integer>
+    ...       <key>Date Added</key><date>2020-01-02T03:04:05Z</date>
+    ...     </dict>
+    ...   </dict>
+    ...   <key>Playlists</key><array/>
+    ... </dict></plist>''')
+    >>> list(iter_library_tracks(library))
+    [{'Name': 'song', 'Total Time': 1000, 'Date Added': datetime.datetime(2020, 1, 2, 3, 4, 5)}]
+    """
+
+    # where we are: <plist> is at depth 1, the library dict at 2, the tracks
+    # dict at 3, and each track's dict at 4
+    depth = 0
+    last_library_key = None
+    library: Element | None = None
+    tracks: Element | None = None
+
+    for event, element in iterparse(file, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+
+            if depth == 2:
+                library = element
+            elif depth == 3 and element.tag == 'dict' and last_library_key == 'Tracks':
+                tracks = element
+
+            continue
+
+        depth -= 1
+
+        if depth == 3 and tracks is not None and element.tag == 'dict':
+            yield _value(element)
+
+            # we're done with this track and the key that came before it
+            tracks.clear()
+        elif depth == 2 and library is not None:
+            if element.tag == 'key':
+                last_library_key = element.text
+            else:
+                # we're done with this value (the tracks, or something we
+                # don't care about, like the playlists) and its key
+                tracks = None
+                library.clear()
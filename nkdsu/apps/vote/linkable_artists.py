@@ -0,0 +1,61 @@
+"""
+The set of artist names that are worth linking to, because they have public
+tracks, so that rendering a list of tracks doesn't need a query for every
+artist on it.
+
+Like :mod:`.show_index`, each process keeps its own copy, kept up to date as
+described in :mod:`.shared_snapshot`. A thread with uncommitted changes to
+tracks asks the database instead, since nobody else can see them yet.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from .shared_snapshot import SharedSnapshot
+
+
+class LinkableArtists(SharedSnapshot[frozenset[str]]):
+    version_key = 'vote:linkable_artists:version'
+
+    def build(self) -> frozenset[str]:
+        from .models import Track
+
+        return frozenset(Track.all_artists())
+
+    def __contains__(self, name: str) -> bool:
+        return bool(self.resolve([name]))
+
+    def resolve(self, names: Iterable[str]) -> set[str]:
+        """
+        Return those of `names` that are the names of artists of public
+        tracks, in at most one query.
+        """
+
+        from .models import Track, TrackArtist
+
+        names = set(names)
+
+        if not names:
+            return set()
+
+        if self.has_uncommitted_changes():
+            return set(
+                TrackArtist.objects.filter(
+                    track__in=Track.objects.public(),
+                    role=TrackArtist.ARTIST,
+                    name__in=names,
+                ).values_list('name', flat=True)
+            )
+
+        return names & self.shared()
+
+    def tracks_changed(self) -> None:
+        """
+        Note that a track has been saved or deleted on the default connection.
+        """
+
+        self.changed()
+
+
+linkable_artists = LinkableArtists()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ...anime import ANIME_INDEX_PATH, build_anime_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the anime offline database into the index that get_anime() "
+        "reads from. This happens automatically the first time anime are "
+        "looked up after the database changes, but you can run this as part "
+        "of a deployment so that no request has to wait for it."
+    )
+
+    def handle(self, **options) -> None:
+        build_anime_index()
+
+        if options['verbosity'] > 0:
+            self.stdout.write(f'built {ANIME_INDEX_PATH}')
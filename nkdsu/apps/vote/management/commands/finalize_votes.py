@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+from ...models import Vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Record how successful each vote for a show that has ended was, so "
+        "that we don't have to work it out every time we need it. Run this "
+        "after each show ends; changes to votes and plays for shows that have "
+        "already ended are taken care of as they happen."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            default=False,
+            help='Recalculate votes that have already been finalized, too',
+        )
+
+    def handle(self, *args, **options) -> None:
+        votes = Vote.objects.filter(show__end__lt=timezone.now())
+
+        if not options['all']:
+            votes = votes.filter(final_weight=None)
+
+        total = votes.count()
+        Vote.finalize(votes)
+
+        if int(options['verbosity']) > 0:
+            self.stdout.write(f'{total} votes finalized')
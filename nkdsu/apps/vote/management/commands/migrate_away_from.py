@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from ...models import Track
+from ...models import Track, Vote, VoterShowStats
 
 
 class Command(BaseCommand):
@@ -22,6 +22,7 @@ class Command(BaseCommand):
             rm.add(target)
             vote.save()
 
+        played_during = set(to_remove.play_set.values_list('show_id', flat=True))
         to_remove.play_set.all().update(track=target)
         to_remove.note_set.all().update(track=target)
         to_remove.shortlist_set.all().update(track=target)
@@ -30,6 +31,10 @@ class Command(BaseCommand):
         to_remove.proroulettecommitment_set.all().update(track=target)
         to_remove.block_set.all().update(track=target)
 
+        # update() doesn't send post_save, so do what our Play handlers would
+        VoterShowStats.refresh_shows(played_during)
+        Vote.finalize(Vote.objects.filter(show_id__in=played_during))
+
         target.revealed = to_remove.revealed
         target.hidden = False
 
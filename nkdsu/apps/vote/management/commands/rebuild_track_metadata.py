@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import Track
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the metadata we derive from each track's ID3 tags, like the "
+        "roles and artists we use to find tracks by anime or artist. This "
+        "happens automatically when tracks are saved, but you'll need to run "
+        "this if the way we parse metadata changes."
+    )
+
+    def handle(self, *args, **options) -> None:
+        tracks = Track.objects.all()
+        total = tracks.count()
+
+        with transaction.atomic():
+            for covered, track in enumerate(tracks.iterator(), start=1):
+                if int(options['verbosity']) > 1:
+                    print(f'{covered}/{total} - {track}')
+
+                track.sync_metadata(force=True)
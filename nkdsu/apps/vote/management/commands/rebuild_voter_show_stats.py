@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ...models import VoterShowStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-show stats we keep for each voter, which batting "
+        "averages and streaks are worked out from. These are kept up to date "
+        "as votes and plays change, so you should only need to run this if "
+        "the votes or plays were changed without going through Django."
+    )
+
+    def handle(self, *args, **options) -> None:
+        VoterShowStats.rebuild()
+
+        if int(options['verbosity']) > 0:
+            self.stdout.write(f'{VoterShowStats.objects.count()} rows')
@@ -0,0 +1,58 @@
+from time import monotonic, sleep
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ...jobs import claim_job, discard_abandoned_files, run_job, run_queued_jobs
+
+
+#: how often to look for abandoned files while the queue is empty, in seconds
+CLEANUP_INTERVAL = 60 * 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs, like library updates, as they come in. '
+        'Several of these can safely run at once.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            default=False,
+            help='Exit once the queue is empty, rather than waiting for more jobs',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='How many seconds to wait between checks of an empty queue',
+        )
+
+    def handle(self, *args, **options) -> None:
+        if options['once']:
+            run_queued_jobs()
+            discard_abandoned_files()
+            return
+
+        last_cleanup: Optional[float] = None
+
+        while True:
+            job = claim_job()
+
+            if job is None:
+                if (
+                    last_cleanup is None
+                    or monotonic() - last_cleanup > CLEANUP_INTERVAL
+                ):
+                    discard_abandoned_files()
+                    last_cleanup = monotonic()
+
+                sleep(options['interval'])
+                continue
+
+            run_job(job)
+
+            if int(options['verbosity']) > 1:
+                self.stdout.write(f'{job.pk}: {job}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from ... import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Work out the numbers on the stats page and save them as a snapshot "
+        "for visitors to see, if the last snapshot is from before the current "
+        "show or more than STATS_SNAPSHOT_INTERVAL seconds old. Run this from "
+        "cron every few minutes."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            default=False,
+            help='Take a snapshot even if the last one is recent enough',
+        )
+
+    def handle(self, *args, **options) -> None:
+        if not (options['force'] or stats.snapshot_is_due()):
+            return
+
+        snapshot = stats.take_snapshot()
+
+        if int(options['verbosity']) > 1:
+            self.stdout.write(str(snapshot))
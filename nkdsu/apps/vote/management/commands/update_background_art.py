@@ -1,7 +1,8 @@
-from typing import Iterable, Optional
+from typing import Optional
 
 from django.core.management.base import BaseCommand, CommandParser
 
+from ...background_art import BackgroundArtFetcher
 from ...models import Track
 
 
@@ -12,40 +13,50 @@ class Command(BaseCommand):
     )
 
     def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('track_id', nargs='?')
         parser.add_argument(
             '--quick',
             action='store_true',
             default=False,
             help="Don't get art for tracks that already have art",
         )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='How many tracks to look up at once',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help=(
+                'How many processes to blur images in; 0 to blur them in the '
+                'lookup threads. Defaults to one per CPU'
+            ),
+        )
 
     def handle(self, track_id: Optional[str] = None, *args, **options) -> None:
-        tracks: Iterable[Track]
-
-        if track_id is None:
-            tracks = Track.objects.all()
-            total = tracks.count()
-        else:
-            tracks = [Track.objects.get(pk=track_id)]
-            total = len(tracks)
+        tracks = Track.objects.all()
 
-        has_art = 0
-        missing_art = 0
-        covered = 0
+        if track_id is not None:
+            tracks = tracks.filter(pk=track_id)
 
-        for track in tracks:
-            covered += 1
+        if options.get('quick'):
+            tracks = tracks.filter(background_art='')
 
-            if track.background_art and options.get('quick'):
-                has_art += 1
-                continue
+        total = tracks.count()
 
+        def progress(done: int) -> None:
             if int(options['verbosity']) > 1:
-                print(f'{covered}/{total} - {track}')
+                self.stdout.write(f'{done}/{total}')
 
-            track.update_background_art()
+        results = BackgroundArtFetcher(
+            threads=options['threads'], processes=options['processes']
+        ).fetch(tracks.iterator(), progress=progress)
 
-            if track.background_art:
-                has_art += 1
-            else:
-                missing_art += 1
+        if int(options['verbosity']) > 0:
+            self.stdout.write(
+                f'{results.updated} updated, {results.unchanged} unchanged, '
+                f'{results.missing} without art, {results.failed} failed'
+            )
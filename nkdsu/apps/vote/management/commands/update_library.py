@@ -1,7 +1,7 @@
-import plistlib
 from django.core.management.base import BaseCommand
 
-from ...update_library import update_library
+from ...library_plist import iter_library_tracks
+from ...update_library import apply_library_update, plan_library_update
 
 
 class Command(BaseCommand):
@@ -9,19 +9,16 @@ class Command(BaseCommand):
     help = 'manually update library from songlibrary.xml'
 
     def handle(self, *args, **options):
-        plistfile = open('songlibrary.xml')
-        plist = plistlib.readPlistFromString(plistfile.read())
-
         if 'commit' in args:
             dry_run = False
         else:
             dry_run = True
             print("Performing dry run; 'commit' to confirm")
 
-        self.stdout.write(
-            '\n'.join(
-                [track['item'] for track in update_library(plist, dry_run=dry_run)]
-            )
-            + '\n'
-        )
-        plistfile.close()
+        with open('songlibrary.xml', 'rb') as plistfile:
+            plan = plan_library_update(iter_library_tracks(plistfile))
+
+        if not dry_run:
+            apply_library_update(plan)
+
+        self.stdout.write('\n'.join([track['item'] for track in plan.changes]) + '\n')
@@ -28,21 +28,27 @@ class TrackQuerySet(models.QuerySet["Track"]):
     def public(self) -> TrackQuerySet:
         return self.filter(hidden=False, inudesu=False, archived=False)
 
+    def _by_track_artist(
+        self, name: str, role: str, show_secret_tracks: bool
+    ) -> list[Track]:
+        base_qs = self._everything(show_secret_tracks)
+        return list(
+            base_qs.filter(trackartist__role=role, trackartist__name=name)
+            .distinct()
+            .order_by('id3_title')
+        )
+
     def by_artist(self, artist: str, show_secret_tracks: bool = False) -> list[Track]:
         """
-        Filters with Python, so does not return a queryset and is not lazy.
+        Returns a list rather than a queryset, so is not lazy.
         """
 
-        base_qs = self._everything(show_secret_tracks)
-        qs = base_qs.filter(id3_artist__contains=artist).order_by('id3_title')
-        return [t for t in qs if artist in t.artist_names()]
+        return self._by_track_artist(artist, 'artist', show_secret_tracks)
 
     def by_composer(
         self, composer: str, show_secret_tracks: bool = False
     ) -> list[Track]:
-        base_qs = self._everything(show_secret_tracks)
-        qs = base_qs.filter(composer__contains=composer).order_by('id3_title')
-        return [t for t in qs if composer in t.composer_names()]
+        return self._by_track_artist(composer, 'composer', show_secret_tracks)
 
     def by_anime(self, anime: str, show_secret_tracks: bool = False) -> list[Track]:
         """
@@ -50,8 +56,12 @@ class TrackQuerySet(models.QuerySet["Track"]):
         """
 
         base_qs = self._everything(show_secret_tracks)
-        qs = base_qs.filter(id3_title__contains=anime).order_by('id3_title')
-        return [t for t in qs if t.has_anime(anime)]
+        return list(
+            base_qs.filter(trackrole__anime=anime)
+            .distinct()
+            .order_by('id3_title')
+            .prefetch_related('trackrole_set')
+        )
 
     def search(self, query: str, show_secret_tracks: bool = False) -> TrackQuerySet:
         keywords = split_query_into_keywords(query)
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vote', '0024_proroulettecommitment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackRole',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('position', models.PositiveIntegerField()),
+                ('full_tag', models.CharField(max_length=500)),
+                (
+                    'anime',
+                    models.CharField(
+                        blank=True, db_index=True, max_length=500, null=True
+                    ),
+                ),
+                ('full_role', models.CharField(max_length=500)),
+                ('caveat', models.CharField(blank=True, max_length=500, null=True)),
+                ('kind', models.CharField(blank=True, max_length=500)),
+                ('specifics', models.CharField(blank=True, max_length=500)),
+                ('sortkey_group', models.FloatField()),
+                (
+                    'track',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to='vote.track'
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['track', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trackrole',
+            constraint=models.UniqueConstraint(
+                fields=('track', 'position'), name='unique_track_role_position'
+            ),
+        ),
+    ]
@@ -0,0 +1,136 @@
+import re
+from typing import Any, Optional
+
+from django.db import migrations
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+
+# frozen copies of utils.split_id3_title() and models.Role as they were when
+# this migration was written, so that changing how we parse roles later
+# doesn't change what this does; rebuild_track_metadata takes care of that
+
+SORTABLE_KINDS = {
+    'op': 0,
+    'ed': 1,
+    'insert song': 2,
+    'character song': 3,
+}
+
+EP = r'(ep\d+(-\d+)?\b.*)'
+ROLE_PATTERN = re.compile(
+    r'^(?P<anime>.*?) ?\b('
+    r'(?P<caveat>(rebroadcast|tv broadcast|netflix) )?\b(?P<role>'
+    r'(('
+    r'((ED|OP))|'
+    r'(insert (track|song)\b)|'
+    + EP
+    + r')(?P<specifics>\d*\b\W*\w* ?('
+    + EP
+    + r'|b-side)?)?)|'
+    r'((character|image) song\b.*)|'
+    r'(ins)|'
+    r'((main )?theme ?\d*)|'
+    r'(bgm\b.*)|'
+    r'(ost)|'
+    r'()))$',
+    flags=re.IGNORECASE,
+)
+
+
+def split_id3_title(id3_title: str) -> tuple[str, Optional[str]]:
+    role = None
+
+    bracket_depth = 0
+    for i in range(1, len(id3_title) + 1):
+        char = id3_title[-i]
+        if char == ')':
+            bracket_depth += 1
+        elif char == '(':
+            bracket_depth -= 1
+
+        if bracket_depth == 0:
+            if i != 1:
+                role = id3_title[len(id3_title) - i :]
+            break
+
+    if role:
+        title = id3_title.replace(role, '').strip()
+        role = role[1:-1]  # strip brackets
+    else:
+        title = id3_title
+
+    return title, role
+
+
+def parse_role(full_tag: str) -> dict[str, Any]:
+    anime: Optional[str] = None
+    full_role = full_tag
+    caveat: Optional[str] = None
+    specifics = ''
+    kind = ''
+
+    result = ROLE_PATTERN.match(full_tag)
+
+    if result and result.groupdict()['role'] and result.groupdict()['anime']:
+        deets = result.groupdict()
+        anime = deets['anime']
+        full_role = deets['role']
+        caveat = deets['caveat']
+        specifics = (deets['specifics'] or '').strip()
+
+    if specifics:
+        kind = full_role.removesuffix(specifics).strip()
+    elif ' - ' in full_role:
+        kind, specifics = full_role.split(' - ', 1)
+    elif full_role.lower() in ('character song', 'insert song'):
+        kind, specifics = (full_role, '')
+    elif full_role.lower() in SORTABLE_KINDS.keys():
+        kind = full_role
+    else:
+        kind, specifics = ('', full_role)
+
+    sortkey_group: float = SORTABLE_KINDS.get(kind.lower(), 99)
+    if caveat and caveat.lower().strip() == 'rebroadcast':
+        sortkey_group += 0.5
+
+    return {
+        'full_tag': full_tag,
+        'anime': anime,
+        'full_role': full_role,
+        'caveat': caveat,
+        'kind': kind,
+        'specifics': specifics,
+        'sortkey_group': sortkey_group,
+    }
+
+
+def populate_track_roles(
+    apps: StateApps, schema_editor: BaseDatabaseSchemaEditor
+) -> None:
+    Track = apps.get_model('vote', 'Track')
+    TrackRole = apps.get_model('vote', 'TrackRole')
+
+    track_roles = []
+
+    for track_id, id3_title in Track.objects.values_list('id', 'id3_title'):
+        role = split_id3_title(id3_title)[1]
+
+        for position, full_tag in enumerate(role.split('|') if role else []):
+            track_roles.append(
+                TrackRole(track_id=track_id, position=position, **parse_role(full_tag))
+            )
+
+    TrackRole.objects.bulk_create(track_roles, batch_size=1000)
+
+
+def do_nothing(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('vote', '0025_trackrole'),
+    ]
+
+    operations = [migrations.RunPython(populate_track_roles, do_nothing)]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vote', '0026_populate_track_roles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackArtist',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'role',
+                    models.CharField(
+                        choices=[('artist', 'artist'), ('composer', 'composer')],
+                        max_length=8,
+                    ),
+                ),
+                ('position', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=5000)),
+                (
+                    'track',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to='vote.track'
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['track', 'role', 'position'],
+                'indexes': [
+                    models.Index(
+                        fields=['role', 'name'], name='vote_tracka_role_e96f15_idx'
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trackartist',
+            constraint=models.UniqueConstraint(
+                fields=('track', 'role', 'position'),
+                name='unique_track_artist_position',
+            ),
+        ),
+    ]
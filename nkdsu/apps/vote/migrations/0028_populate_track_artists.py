@@ -0,0 +1,207 @@
+from typing import Iterable, Optional
+
+from django.db import migrations
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+from sly import Lexer
+from sly.lex import LexError
+
+
+# a frozen copy of the artist lexer and chunking from parsers.py as they were
+# when this migration was written, so that changing how we parse artists later
+# doesn't change what this does; rebuild_track_metadata takes care of that
+
+
+class ArtistLexer(Lexer):
+    tokens = {
+        SPECIAL_CASE,  # type: ignore  # noqa
+        ARTIST_COMPONENT,  # type: ignore  # noqa
+        SPACE,  # type: ignore  # noqa
+        COMMA,  # type: ignore  # noqa
+        VIA,  # type: ignore  # noqa
+        LPAREN,  # type: ignore  # noqa
+        RPAREN,  # type: ignore  # noqa
+        CV,  # type: ignore  # noqa
+    }
+
+    SPECIAL_CASE = r'^(' r'FLOWxGRANRODEO|' r'SawanoHiroyuki\[nZk\]:.*' r')$'
+    VIA = (
+        r'\s+('
+        r'from|'
+        r'ft\.|'
+        r'feat(\.|uring)?\.?|'
+        r'[Ss]tarring|'
+        r'and|'
+        r'with|'
+        r'meets|'
+        r'adding|'
+        r'hugs|'
+        r'inspi\'|'
+        r'a\.k\.a|'
+        r'x|'
+        r'×|'
+        r'n\'|'
+        r'vs\.?|'
+        r'/|'
+        r'\+|'
+        r'&'
+        r')\s+'
+    )
+    LPAREN = r'(?<=\s)\('
+    RPAREN = r'\)(?=\s|,|\)|$)'
+    CV = (
+        r'('
+        r'CV[.:]|'
+        r'[Vv]ocals?:|'
+        r'[Mm]ain\svocals?:|'
+        r'[Cc]omposed\sby|'
+        r'[Ff]rom|'
+        r'[Ff]eat(\.|uring)?|'
+        r'[Pp]erformed\sby|'
+        r'Vo\.'
+        r')\s+|='
+    )
+    COMMA = r',(\sand)?\s+'
+    SPACE = r'\s+'
+    ARTIST_COMPONENT = (
+        r'('
+        r'\(K\)NoW_NAME|'
+        r'AKIMA & NEOS|'
+        r'ANNA TSUCHIYA inspi\' NANA\(BLACK STONES\)|'
+        r'Bird Bear Hare and Fish|'
+        r'Bread & Butter|'
+        r'Carole\s&\sTuesday|'
+        r'Daisy x Daisy|'
+        r'Dejo & Bon|'
+        r'Digz, Inc. Group|'
+        r'Dimitri From Paris|'
+        r'Eunsol\(1008\)|'
+        r'Fear,\sand\sLoathing\sin\sLas\sVegas|'
+        r'GENERATIONS from EXILE TRIBE|'
+        r'HIGH and MIGHTY COLOR|'
+        r'Hello, Happy World!|'
+        r'Hifumi,inc\.|'
+        r'Kamisama, Boku wa Kizuite shimatta|'
+        r'Kevin & Cherry|'
+        r'King & Queen|'
+        r'Kisida Kyodan & The Akebosi Rockets|'
+        r'Konya, Anomachikara|'
+        r'Louis Armstrong and His Orchestra|'
+        r'MYTH\s&\sROID|'
+        r'OLIVIA inspi\' REIRA\(TRAPNEST\)|'
+        r'Oranges\s(and|&)\sLemons|'
+        r'Rough & Ready|'
+        r'Run Girls, Run!|'
+        r'Simon & Garfunkel|'
+        r'THE RAMPAGE from EXILE TRIBE|'
+        r'Tackey & Tsubasa|'
+        r'Takako & The Crazy Boys|'
+        r'Voices From Mars|'
+        r'Wake Up, [^\s]+!|'
+        r'Yamagami Lucy \(…\)|'
+        r'devils and realist|'
+        r'＊\(Asterisk\)|'
+        r'[^\s=,()]+'
+        r')'
+    )
+
+
+artist_lexer = ArtistLexer()
+
+
+def handle_special_case(token) -> Iterable[tuple[str, bool]]:
+    if token.value == "FLOWxGRANRODEO":
+        yield ('FLOW', True)
+        yield ('x', False)
+        yield ('GRANRODEO', True)
+    elif token.value.startswith('SawanoHiroyuki[nZk]:'):
+        sawano, collaborators = token.value.split(':', 1)
+        yield (sawano, True)
+        yield (':', False)
+        for i, collaborator in enumerate(collaborators.split('&')):
+            if i != 0:
+                yield ('&', False)
+            yield (collaborator, True)
+
+    else:
+        raise NotImplementedError(token.value)
+
+
+def chunk_artist(string: str) -> Iterable[tuple[str, bool]]:
+    """
+    Yield (text, is_artist) pairs which, when combined, reform `string`.
+    """
+
+    try:
+        tokens = list(artist_lexer.tokenize(string))
+    except LexError:
+        yield (string, True)
+        return
+
+    artist_parts = ('ARTIST_COMPONENT', 'SPACE')
+
+    fragment: Optional[tuple[bool, str]] = None
+
+    for ti, token in enumerate(tokens):
+        if token.type == 'SPECIAL_CASE':
+            yield from handle_special_case(token)
+            continue
+
+        is_part_of_artist_name = (token.type in artist_parts) and (
+            (token.type != 'SPACE')
+            or (
+                ((ti + 1 < len(tokens)) and (tokens[ti + 1].type == 'ARTIST_COMPONENT'))
+                and ((ti > 0) and (tokens[ti - 1].type == 'ARTIST_COMPONENT'))
+            )
+        )
+
+        if fragment:
+            if is_part_of_artist_name == fragment[0]:
+                fragment = (fragment[0], fragment[1] + token.value)
+                continue
+
+            yield (fragment[1], fragment[0])
+
+        fragment = (is_part_of_artist_name, token.value)
+
+    if fragment:
+        yield (fragment[1], fragment[0])
+
+
+def populate_track_artists(
+    apps: StateApps, schema_editor: BaseDatabaseSchemaEditor
+) -> None:
+    Track = apps.get_model('vote', 'Track')
+    TrackArtist = apps.get_model('vote', 'TrackArtist')
+
+    track_artists = []
+
+    for track_id, id3_artist, composer in Track.objects.values_list(
+        'id', 'id3_artist', 'composer'
+    ):
+        for role, string in (('artist', id3_artist), ('composer', composer)):
+            names = (
+                text for text, is_artist in chunk_artist(string or '') if is_artist
+            )
+
+            for position, name in enumerate(names):
+                track_artists.append(
+                    TrackArtist(
+                        track_id=track_id, role=role, position=position, name=name
+                    )
+                )
+
+    TrackArtist.objects.bulk_create(track_artists, batch_size=1000)
+
+
+def do_nothing(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('vote', '0027_trackartist'),
+    ]
+
+    operations = [migrations.RunPython(populate_track_artists, do_nothing)]
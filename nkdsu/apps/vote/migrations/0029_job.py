@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import nkdsu.apps.vote.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('vote', '0028_populate_track_artists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=100)),
+                ('arguments', models.JSONField(blank=True, default=dict)),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('queued', 'queued'),
+                            ('running', 'running'),
+                            ('succeeded', 'succeeded'),
+                            ('failed', 'failed'),
+                        ],
+                        db_index=True,
+                        default='queued',
+                        max_length=10,
+                    ),
+                ),
+                ('progress', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    'message',
+                    models.TextField(
+                        blank=True,
+                        help_text='what happened, or the traceback if it failed',
+                    ),
+                ),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                (
+                    'created_by',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['-created_at', '-pk'],
+            },
+            bases=(nkdsu.apps.vote.models.CleanOnSaveMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vote', '0029_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='background_art_source',
+            field=models.URLField(
+                blank=True,
+                help_text='where the image that background_art was made from came from',
+                max_length=2000,
+            ),
+        ),
+    ]
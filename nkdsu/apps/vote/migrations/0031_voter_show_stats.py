@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('vote', '0030_track_background_art_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterShowStats',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('votes', models.PositiveIntegerField()),
+                (
+                    'weight',
+                    models.PositiveIntegerField(
+                        help_text='the number of tracks asked for, counting each vote separately'
+                    ),
+                ),
+                (
+                    'successes',
+                    models.PositiveIntegerField(
+                        help_text='how many of the tracks asked for got played'
+                    ),
+                ),
+                (
+                    'show',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to='vote.show'
+                    ),
+                ),
+                (
+                    'twitter_user',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='vote.twitteruser',
+                    ),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name_plural': 'voter show stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='votershowstats',
+            constraint=models.CheckConstraint(
+                check=models.Q(
+                    models.Q(('twitter_user__isnull', False), ('user__isnull', True)),
+                    models.Q(('twitter_user__isnull', True), ('user__isnull', False)),
+                    _connector='OR',
+                ),
+                name='voter_show_stats_must_have_voter',
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='votershowstats',
+            constraint=models.UniqueConstraint(
+                models.F('show'),
+                models.F('user'),
+                condition=models.Q(('user__isnull', False)),
+                name='voter_show_stats_unique_user',
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='votershowstats',
+            constraint=models.UniqueConstraint(
+                models.F('show'),
+                models.F('twitter_user'),
+                condition=models.Q(('twitter_user__isnull', False)),
+                name='voter_show_stats_unique_twitter_user',
+            ),
+        ),
+    ]
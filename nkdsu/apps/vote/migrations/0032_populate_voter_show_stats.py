@@ -0,0 +1,53 @@
+from django.db import migrations
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+from django.db.models import Count, Exists, OuterRef, Q
+
+
+def populate_voter_show_stats(
+    apps: StateApps, schema_editor: BaseDatabaseSchemaEditor
+) -> None:
+    Play = apps.get_model('vote', 'Play')
+    Vote = apps.get_model('vote', 'Vote')
+    VoterShowStats = apps.get_model('vote', 'VoterShowStats')
+
+    played = Play.objects.filter(
+        show_id=OuterRef('vote__show_id'), track_id=OuterRef('track_id')
+    )
+    rows = (
+        Vote.tracks.through.objects.exclude(vote__user=None, vote__twitter_user=None)
+        .values('vote__show_id', 'vote__user_id', 'vote__twitter_user_id')
+        .annotate(
+            vote_count=Count('vote_id', distinct=True),
+            weight=Count('pk'),
+            successes=Count('pk', filter=Q(Exists(played))),
+        )
+        .order_by()
+    )
+
+    VoterShowStats.objects.bulk_create(
+        (
+            VoterShowStats(
+                show_id=row['vote__show_id'],
+                user_id=row['vote__user_id'],
+                twitter_user_id=row['vote__twitter_user_id'],
+                votes=row['vote_count'],
+                weight=row['weight'],
+                successes=row['successes'],
+            )
+            for row in rows
+        ),
+        batch_size=1000,
+    )
+
+
+def do_nothing(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('vote', '0031_voter_show_stats'),
+    ]
+
+    operations = [migrations.RunPython(populate_voter_show_stats, do_nothing)]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vote', '0032_populate_voter_show_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='final_success',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='final_weight',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
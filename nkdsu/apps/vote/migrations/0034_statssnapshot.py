@@ -0,0 +1,42 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import nkdsu.apps.vote.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vote', '0033_vote_final_success'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsSnapshot',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('payload', models.JSONField()),
+                (
+                    'show',
+                    models.ForeignKey(
+                        help_text='the show that was current when this was taken',
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='vote.show',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['-created_at', '-pk'],
+                'get_latest_by': 'created_at',
+            },
+            bases=(nkdsu.apps.vote.models.CleanOnSaveMixin, models.Model),
+        ),
+    ]
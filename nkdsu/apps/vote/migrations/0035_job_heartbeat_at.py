@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vote', '0034_statssnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(
+                blank=True,
+                help_text='when the worker running this last told us it was still going',
+                null=True,
+            ),
+        ),
+    ]
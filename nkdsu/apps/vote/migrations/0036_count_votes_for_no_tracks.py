@@ -0,0 +1,62 @@
+from django.db import migrations
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+from django.db.models import Count, Exists, OuterRef, Q
+
+
+def populate_voter_show_stats(
+    apps: StateApps, schema_editor: BaseDatabaseSchemaEditor
+) -> None:
+    # 0032 only counted votes for tracks, so voters whose only vote during a
+    # show was for no tracks at all have no row for it, which breaks their
+    # streak; work everything out again, counting every vote
+    Play = apps.get_model('vote', 'Play')
+    Vote = apps.get_model('vote', 'Vote')
+    VoterShowStats = apps.get_model('vote', 'VoterShowStats')
+
+    votes = Vote.objects.exclude(user=None, twitter_user=None)
+    key_fields = ('show_id', 'user_id', 'twitter_user_id')
+    rows = {
+        tuple(row[f] for f in key_fields): row
+        for row in votes.values(*key_fields).annotate(vote_count=Count('pk')).order_by()
+    }
+
+    played = Play.objects.filter(
+        show_id=OuterRef('vote__show_id'), track_id=OuterRef('track_id')
+    )
+    for tracks in (
+        Vote.tracks.through.objects.filter(vote__in=votes)
+        .values(*(f'vote__{f}' for f in key_fields))
+        .annotate(weight=Count('pk'), successes=Count('pk', filter=Q(Exists(played))))
+        .order_by()
+    ):
+        key = tuple(tracks[f'vote__{f}'] for f in key_fields)
+        rows[key].update(weight=tracks['weight'], successes=tracks['successes'])
+
+    VoterShowStats.objects.all().delete()
+    VoterShowStats.objects.bulk_create(
+        (
+            VoterShowStats(
+                show_id=row['show_id'],
+                user_id=row['user_id'],
+                twitter_user_id=row['twitter_user_id'],
+                votes=row['vote_count'],
+                weight=row.get('weight', 0),
+                successes=row.get('successes', 0),
+            )
+            for row in rows.values()
+        ),
+        batch_size=1000,
+    )
+
+
+def do_nothing(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('vote', '0035_job_heartbeat_at'),
+    ]
+
+    operations = [migrations.RunPython(populate_voter_show_stats, do_nothing)]
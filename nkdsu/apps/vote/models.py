@@ -3,25 +3,22 @@ from __future__ import annotations
 import datetime
 import json
 import re
+from bisect import bisect_right
 from dataclasses import asdict, dataclass
 from enum import Enum, auto
 from functools import cached_property
-from io import BytesIO
 from string import ascii_letters
-from typing import Any, Iterable, Literal, Optional, TYPE_CHECKING, TypedDict, cast
+from typing import Any, Iterable, Literal, Optional, TYPE_CHECKING, TypedDict
 from urllib.parse import quote, urlparse
 from uuid import uuid4
 
 from Levenshtein import ratio
-from PIL import Image, ImageFilter
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
-from django.db import models
-from django.db.models import Q
+from django.core.files.base import ContentFile
+from django.db import models, transaction
+from django.db.models import Count, Exists, OuterRef, Q, Subquery
 from django.db.models.constraints import CheckConstraint, UniqueConstraint
 from django.template.defaultfilters import slugify
 from django.templatetags.static import static
@@ -30,23 +27,34 @@ from django.utils import timezone
 from django.utils.timezone import get_default_timezone
 from django_resized import ResizedImageField
 from markdown import markdown
-import requests
 
-from .anime import Anime, get_anime
-from .api_utils import JsonDict, Serializable
+from .anime import Anime, anime_relations, get_anime
+from .api_utils import JsonDict, JsonList, Serializable
+from .background_art import blur_background_art
+from .external_lookups import get as external_get
 from .managers import NoteQuerySet, TrackQuerySet
 from .mastodon_instances import MASTODON_INSTANCES
 from .parsers import ParsedArtist, parse_artist
 from .placeholder_avatars import placeholder_avatar_for
+from .show_index import show_index
+from .show_registry import (
+    active_registry,
+    canonical_show,
+    forget_shows,
+    show_registry,
+)
 from .utils import (
+    MEMOIZED_ATTRIBUTE,
     READING_USERNAME,
     assert_never,
     cached,
+    clear_memoized,
     indefinitely,
+    invalidate_pk_cached_model,
     lastfm,
     length_str,
     memoize,
-    musicbrainzngs,
+    musicbrainz_releases,
     pk_cached,
     split_id3_title,
     vote_edit_cutoff,
@@ -71,6 +79,28 @@ class CleanOnSaveMixin:
         return super().save(*args, **kwargs)
 
 
+class ForgetMemoizedMixin:
+    """
+    Forget anything :func:`.memoize` has remembered about an instance when it
+    is saved or refreshed from the database, and never pickle it.
+    """
+
+    def save(self, *args, **kwargs):
+        rv = super().save(*args, **kwargs)
+        clear_memoized(self)
+        return rv
+
+    def refresh_from_db(self, *args, **kwargs):
+        rv = super().refresh_from_db(*args, **kwargs)
+        clear_memoized(self)
+        return rv
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop(MEMOIZED_ATTRIBUTE, None)
+        return state
+
+
 class SetShowBasedOnDateMixin:
     show: models.ForeignKey[Show | models.expressions.Combinable, Show]
 
@@ -79,7 +109,7 @@ class SetShowBasedOnDateMixin:
         return super().save(*args, **kwargs)
 
 
-class Show(CleanOnSaveMixin, Serializable, models.Model):
+class Show(ForgetMemoizedMixin, CleanOnSaveMixin, Serializable, models.Model):
     """
     A broadcast of the show and, by extention, the week leading up to it.
     """
@@ -122,12 +152,24 @@ class Show(CleanOnSaveMixin, Serializable, models.Model):
             )
 
     @classmethod
-    @cached(2, 'vote:models:Show:current')
     def current(cls) -> Show:
         """
         Get (or create, if necessary) the show that will next end.
         """
 
+        registry = active_registry()
+
+        if registry is None:
+            return cls._current()
+
+        if registry.current is not None:
+            return registry.current
+
+        return registry.remember_current(cls._current())
+
+    @classmethod
+    @cached(2, 'vote:models:Show:current')
+    def _current(cls) -> Show:
         return cls.at(timezone.now())
 
     @classmethod
@@ -136,37 +178,108 @@ class Show(CleanOnSaveMixin, Serializable, models.Model):
         Get (or create, if necessary) the show for `time`. Use .at() instead.
         """
 
-        existing_show = cls.objects.filter(end__gt=time).order_by('showtime').first()
+        existing_show = show_index.at(time)
+
+        if existing_show is None:
+            existing_show = (
+                cls.objects.filter(end__gt=time).order_by('showtime').first()
+            )
 
         if existing_show is not None:
             return existing_show
         elif not create:
             return None
         else:
-            # We have to switch to naive and back to make relativedelta
-            # look for the local showtime. If we did not, showtime would be
-            # calculated against UTC.
-            naive_time = timezone.make_naive(time, timezone.get_current_timezone())
+            show = cls._new_show_for(time)
+            show.save()
+            return show
+
+    @classmethod
+    def _new_show_for(cls, time: datetime.datetime) -> Show:
+        """
+        Make, but do not save, the show that would be the next one to end after
+        `time` if there were no shows after `time` already.
+        """
+
+        # We have to switch to naive and back to make relativedelta
+        # look for the local showtime. If we did not, showtime would be
+        # calculated against UTC.
+        naive_time = timezone.make_naive(time, timezone.get_current_timezone())
+        naive_end = naive_time + settings.SHOW_END
+
+        # Work around an unfortunate shortcoming of dateutil where
+        # specifying a time on a weekday won't increment the weekday even
+        # if our initial time is after that time.
+        while naive_end < naive_time:
+            naive_time += datetime.timedelta(hours=1)
             naive_end = naive_time + settings.SHOW_END
 
-            # Work around an unfortunate shortcoming of dateutil where
-            # specifying a time on a weekday won't increment the weekday even
-            # if our initial time is after that time.
-            while naive_end < naive_time:
-                naive_time += datetime.timedelta(hours=1)
-                naive_end = naive_time + settings.SHOW_END
+        naive_showtime = naive_end - settings.SHOWTIME
 
-            naive_showtime = naive_end - settings.SHOWTIME
+        our_end = timezone.make_aware(naive_end, timezone.get_current_timezone())
+        our_showtime = timezone.make_aware(
+            naive_showtime, timezone.get_current_timezone()
+        )
+        show = cls()
+        show.end = our_end
+        show.showtime = our_showtime
+        return show
 
-            our_end = timezone.make_aware(naive_end, timezone.get_current_timezone())
-            our_showtime = timezone.make_aware(
-                naive_showtime, timezone.get_current_timezone()
-            )
-            show = cls()
-            show.end = our_end
-            show.showtime = our_showtime
-            show.save()
-            return show
+    @classmethod
+    def _create_shows_until(cls, time: datetime.datetime) -> Optional[Show]:
+        """
+        Make sure there is a show that ends after `time`, creating every
+        intervening show at once if necessary. If there were no shows at all,
+        return the one we created, since it is now the show for every time up
+        to `time`.
+        """
+
+        last_show = cls.objects.order_by('-end').first()
+
+        if last_show is None:
+            first_show = cls._new_show_for(time)
+            first_show.save()
+            return first_show
+
+        new_shows: list[Show] = []
+        end = last_show.end
+
+        while end <= time:
+            show = cls._new_show_for(end + datetime.timedelta(microseconds=1))
+            new_shows.append(show)
+            end = show.end
+
+        if not new_shows:
+            return None
+
+        # another process might be doing the same thing, so let the unique
+        # showtime constraint sort out which of us actually gets to create
+        # each one
+        cls.objects.bulk_create(new_shows, ignore_conflicts=True)
+
+        # bulk_create() doesn't send post_save, so do what our handlers would
+        invalidate_pk_cached_model(cls)
+        forget_shows()
+        show_index.show_changed()
+        return None
+
+    @classmethod
+    def _shows_covering(
+        cls, start: datetime.datetime, finish: datetime.datetime
+    ) -> list[Show]:
+        """
+        Return every show from the one for `start` to the one for `finish`,
+        in order, as long as there is a show for `finish`.
+        """
+
+        following_end = (
+            cls.objects.filter(end__gt=finish).order_by('end').values('end')[:1]
+        )
+        return list(
+            cls.objects.filter(
+                end__gt=start, end__lte=Subquery(following_end)
+            ).order_by('end')
+        )
 
     @classmethod
     def at(cls, time: datetime.datetime) -> Show:
@@ -175,27 +288,57 @@ class Show(CleanOnSaveMixin, Serializable, models.Model):
         in the process if necessary.
         """
 
-        all_shows = cls.objects.all()
-        if cache.get('all_shows:exists') or all_shows.exists():
-            cache.set('all_shows:exists', True, None)
-            last_show = all_shows.order_by('-end')[0]
-        else:
-            this_show = cls._at(time)  # this is the first show!
-            assert this_show is not None
-            return this_show
+        return cls.at_many([time])[time]
 
-        if time <= last_show.end:
-            this_show = cls._at(time)
-            assert this_show is not None
-            return this_show
+    @classmethod
+    def at_many(
+        cls, times: Iterable[datetime.datetime]
+    ) -> dict[datetime.datetime, Show]:
+        """
+        Get the show for each of `times`, as a :class:`dict` keyed by time,
+        creating every intervening show in the process if necessary.
 
-        show = last_show
+        Any shows we don't already know about are fetched in a single query,
+        so this is much cheaper than calling :meth:`at` for each time.
+        """
 
-        while show.end < time:
-            # if create=True, show.next will never return None
-            show = cast(Show, show.next(create=True))
+        registry = active_registry()
+        shows: dict[datetime.datetime, Show] = {}
+        unresolved: list[datetime.datetime] = []
 
-        return show
+        for time in set(times):
+            show = registry.at(time) if registry is not None else None
+
+            if show is None:
+                show = show_index.at(time)
+
+            if show is None:
+                unresolved.append(time)
+            else:
+                shows[time] = show
+
+        if unresolved:
+            unresolved.sort()
+            candidates = cls._shows_covering(unresolved[0], unresolved[-1])
+
+            if not candidates or candidates[-1].end <= unresolved[-1]:
+                first_show = cls._create_shows_until(unresolved[-1])
+                candidates = (
+                    [first_show]
+                    if first_show is not None
+                    else cls._shows_covering(unresolved[0], unresolved[-1])
+                )
+
+            ends = [show.end for show in candidates]
+
+            for time in unresolved:
+                shows[time] = candidates[bisect_right(ends, time)]
+
+        if registry is not None:
+            for time, show in shows.items():
+                shows[time] = registry.remember_at(time, show)
+
+        return shows
 
     @memoize
     def broadcasting(self, time: Optional[datetime.datetime] = None) -> bool:
@@ -209,21 +352,27 @@ class Show(CleanOnSaveMixin, Serializable, models.Model):
         return (time >= self.showtime) and (time < self.end)
 
     @memoize
-    @pk_cached(indefinitely)
     def next(self, create: bool = False) -> Optional[Show]:
         """
         Return the :class:`Show` chronologically after that one.
         """
 
+        return canonical_show(self._next(create))
+
+    @pk_cached(indefinitely)
+    def _next(self, create: bool = False) -> Optional[Show]:
         return Show._at(self.end + datetime.timedelta(microseconds=1), create)
 
     @memoize
-    @pk_cached(indefinitely)
     def prev(self) -> Optional[Show]:
         """
         Return the :class:`Show` chronologically before that one.
         """
 
+        return canonical_show(self._prev())
+
+    @pk_cached(indefinitely)
+    def _prev(self) -> Optional[Show]:
         qs = Show.objects.filter(end__lt=self.end)
 
         try:
@@ -299,16 +448,29 @@ class Show(CleanOnSaveMixin, Serializable, models.Model):
 
         return tracks
 
-    @memoize
     @pk_cached(60)
+    def _revealed_pks(self) -> list[str]:
+        return list(
+            Track.objects.filter(**self._date_kwargs('revealed')).values_list(
+                'pk', flat=True
+            )
+        )
+
+    @memoize
     def revealed(self, show_hidden: bool = False) -> TrackQuerySet:
         """
         Return all public (unhidden, non-inudesu) tracks revealed in the
         library this week.
         """
 
+        # tracks get hidden in bulk by library updates, which we don't hear
+        # about, so only which tracks were revealed is cached, and whether
+        # they're still public is checked every time
         return Track.objects.filter(
-            hidden=False, inudesu=False, **self._date_kwargs('revealed')
+            pk__in=self._revealed_pks(),
+            hidden=False,
+            inudesu=False,
+            **self._date_kwargs('revealed'),
         )
 
     @memoize
@@ -347,7 +509,7 @@ class Show(CleanOnSaveMixin, Serializable, models.Model):
     def api_dict(self, verbose: bool = False) -> JsonDict:
         return {
             'playlist': [p.api_dict() for p in self.plays()],
-            'added': [t.api_dict() for t in self.revealed()],
+            'added': Track.api_dicts(self.revealed()),
             'votes': [v.api_dict() for v in self.votes()],
             'showtime': self.showtime,
             'finish': self.end,
@@ -359,7 +521,7 @@ class Show(CleanOnSaveMixin, Serializable, models.Model):
         }
 
 
-class TwitterUser(Voter, CleanOnSaveMixin, models.Model):
+class TwitterUser(Voter, ForgetMemoizedMixin, CleanOnSaveMixin, models.Model):
     class Meta:
         ordering = ['screen_name']
 
@@ -431,7 +593,7 @@ def avatar_upload_path(instance: Profile, filename: str) -> str:
 AVATAR_SIZE = 500
 
 
-class Profile(Voter, CleanOnSaveMixin, models.Model):
+class Profile(Voter, ForgetMemoizedMixin, CleanOnSaveMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     twitter_user = models.OneToOneField(
         TwitterUser,
@@ -605,6 +767,10 @@ class UserWebsite(CleanOnSaveMixin, models.Model):
         return '_website'
 
 
+#: how many rows to write at a time when syncing metadata for lots of tracks
+METADATA_BATCH_SIZE = 1000
+
+
 def art_path(i: Track, f: str) -> str:
     return 'art/bg/%s.%s' % (i.pk, f.split('.')[-1])
 
@@ -626,6 +792,12 @@ def _name_is_related(a: str, b: str) -> bool:
     )
 
 
+def anime_names_are_related(a: str, b: str) -> bool:
+    return (len(a) > 1 and len(b) > 1) and (
+        _name_is_related(a, b) or _name_is_related(b, a)
+    )
+
+
 class Role:
     anime: Optional[str]
     sortkey_group: float
@@ -634,6 +806,13 @@ class Role:
     kind: str = ''
     specifics: str = ''
 
+    sortable_kinds: dict[str, tuple[int, str, str]] = {
+        'op': (0, 'Opening theme', 'Opening themes'),
+        'ed': (1, 'Ending theme', 'Ending themes'),
+        'insert song': (2, 'Insert song', 'Insert songs'),
+        'character song': (3, 'Character song', 'Character songs'),
+    }
+
     def __init__(self, full_tag: str):
         self.full_tag = full_tag
 
@@ -668,25 +847,38 @@ class Role:
             self.anime = None
             self.full_role = self.full_tag
 
-        sortable_kinds: dict[str, tuple[int, str, str]] = {
-            'op': (0, 'Opening theme', 'Opening themes'),
-            'ed': (1, 'Ending theme', 'Ending themes'),
-            'insert song': (2, 'Insert song', 'Insert songs'),
-            'character song': (3, 'Character song', 'Character songs'),
-        }
-
         if self.specifics:
             self.kind = self.full_role.removesuffix(self.specifics).strip()
         elif ' - ' in self.full_role:
             self.kind, self.specifics = self.full_role.split(' - ', 1)
         elif self.full_role.lower() in ('character song', 'insert song'):
             self.kind, self.specifics = (self.full_role, '')
-        elif self.full_role.lower() in sortable_kinds.keys():
+        elif self.full_role.lower() in self.sortable_kinds.keys():
             self.kind = self.full_role
         else:
             self.kind, self.specifics = ('', self.full_role)
 
-        self.sortkey_group, self.verbose, self.plural = sortable_kinds.get(
+        self._sort()
+
+    @classmethod
+    def from_track_role(cls, track_role: TrackRole) -> Role:
+        """
+        Rebuild a :class:`Role` from the parts of it we stored in a
+        :class:`TrackRole`, without parsing it again.
+        """
+
+        role = cls.__new__(cls)
+        role.full_tag = track_role.full_tag
+        role.anime = track_role.anime
+        role.full_role = track_role.full_role
+        role.caveat = track_role.caveat
+        role.kind = track_role.kind
+        role.specifics = track_role.specifics
+        role._sort()
+        return role
+
+    def _sort(self) -> None:
+        self.sortkey_group, self.verbose, self.plural = self.sortable_kinds.get(
             self.kind.lower(), (99, 'Other', 'Others')
         )
 
@@ -723,11 +915,18 @@ class Role:
         if anime is None or self.anime is None:
             return False
 
-        return (len(self.anime) > 1 and len(anime) > 1) and (
-            _name_is_related(anime, self.anime) or _name_is_related(self.anime, anime)
-        )
+        return anime_names_are_related(self.anime, anime)
 
     def related_anime(self) -> list[str]:
+        if self.anime is None:
+            return []
+
+        related = anime_relations().related_by_name.get(self.anime)
+
+        if related is not None:
+            return related
+
+        # we're not in the library (yet?), so we're not in the graph
         return [
             a
             for a in Track.all_anime_titles()
@@ -735,7 +934,7 @@ class Role:
         ]
 
 
-class Track(CleanOnSaveMixin, Serializable, models.Model):
+class Track(ForgetMemoizedMixin, CleanOnSaveMixin, Serializable, models.Model):
     class Meta:
         constraints = [
             CheckConstraint(
@@ -754,8 +953,15 @@ class Track(CleanOnSaveMixin, Serializable, models.Model):
 
     note_set: RelatedManager[Note]
     play_set: RelatedManager[Play]
+    trackartist_set: RelatedManager[TrackArtist]
+    trackrole_set: RelatedManager[TrackRole]
     vote_set: RelatedManager[Vote]
 
+    # the votes this track was part of, remembered by our signal handlers
+    # while it's being deleted, so that their stats can be refreshed once
+    # it's gone
+    _previous_vote_ids: set[Any]
+
     # derived from iTunes
     id = models.CharField(max_length=16, primary_key=True)
     id3_title = models.CharField(max_length=500)
@@ -792,6 +998,11 @@ class Track(CleanOnSaveMixin, Serializable, models.Model):
     )
     inudesu = models.BooleanField()
     background_art = models.ImageField(blank=True, upload_to=art_path)
+    background_art_source = models.URLField(
+        blank=True,
+        max_length=2000,
+        help_text='where the image that background_art was made from came from',
+    )
     metadata_locked = models.BooleanField(default=False)
 
     def __str__(self) -> str:
@@ -827,20 +1038,27 @@ class Track(CleanOnSaveMixin, Serializable, models.Model):
 
     @classmethod
     def all_anime_titles(cls) -> set[str]:
-        return {
-            rd.anime
-            for t in cls.objects.public()
-            for rd in t.role_details
-            if rd.anime is not None
-        }
+        return set(
+            TrackRole.objects.filter(
+                track__in=cls.objects.public(), anime__isnull=False
+            ).values_list('anime', flat=True)
+        )
 
     @classmethod
     def all_artists(cls) -> set[str]:
-        return {a for t in cls.objects.public() for a in t.artist_names()}
+        return set(
+            TrackArtist.objects.filter(
+                track__in=cls.objects.public(), role=TrackArtist.ARTIST
+            ).values_list('name', flat=True)
+        )
 
     @classmethod
     def all_composers(cls) -> set[str]:
-        return {c for t in cls.objects.public() for c in t.composer_names()}
+        return set(
+            TrackArtist.objects.filter(
+                track__in=cls.objects.public(), role=TrackArtist.COMPOSER
+            ).values_list('name', flat=True)
+        )
 
     @classmethod
     def all_years(cls) -> list[int]:
@@ -879,12 +1097,12 @@ class Track(CleanOnSaveMixin, Serializable, models.Model):
 
     @classmethod
     def suggest_artists(cls, string: str) -> set[str]:
-        artist_names = set()
-        for track in Track.objects.public().filter(id3_artist__icontains=string):
-            for artist_name in track.artist_names():
-                artist_names.add(artist_name)
-
-        return artist_names
+        return set(
+            TrackArtist.objects.filter(
+                track__in=cls.objects.public().filter(id3_artist__icontains=string),
+                role=TrackArtist.ARTIST,
+            ).values_list('name', flat=True)
+        )
 
     @classmethod
     def all_roles(cls, qs: Optional[models.QuerySet[Track]] = None) -> set[str]:
@@ -973,8 +1191,112 @@ class Track(CleanOnSaveMixin, Serializable, models.Model):
         def quarter(anime_data: Optional[Anime]) -> str:
             return '_' if anime_data is None else anime_data.quarter
 
-        return sorted(
-            (Role(role) for role in self.roles), key=lambda r: quarter(r.anime_data())
+        roles: Iterable[Role]
+
+        if 'trackrole_set' in getattr(self, '_prefetched_objects_cache', {}):
+            roles = (Role.from_track_role(tr) for tr in self.trackrole_set.all())
+        else:
+            roles = (Role(role) for role in self.roles)
+
+        return sorted(roles, key=lambda r: quarter(r.anime_data()))
+
+    def sync_metadata(self, force: bool = False) -> None:
+        """
+        Bring everything we derive from this track's ID3 tags and store
+        elsewhere up to date.
+        """
+
+        self.sync_roles(force=force)
+        self.sync_artists(force=force)
+
+    @classmethod
+    def sync_metadata_in_bulk(cls, tracks: Iterable[Track]) -> None:
+        """
+        Like :meth:`sync_metadata` with `force` set, but for lots of tracks at
+        once, in a handful of queries. For use alongside
+        :meth:`~django.db.models.query.QuerySet.bulk_create` and
+        :meth:`~django.db.models.query.QuerySet.bulk_update`, which don't
+        send the signals that would usually take care of this.
+        """
+
+        tracks = list(tracks)
+
+        for i in range(0, len(tracks), METADATA_BATCH_SIZE):
+            pks = [track.pk for track in tracks[i : i + METADATA_BATCH_SIZE]]
+            TrackRole.objects.filter(track_id__in=pks).delete()
+            TrackArtist.objects.filter(track_id__in=pks).delete()
+
+        TrackRole.objects.bulk_create(
+            (
+                TrackRole.for_role(track, position, Role(full_tag))
+                for track in tracks
+                for position, full_tag in enumerate(track._full_tags())
+            ),
+            batch_size=METADATA_BATCH_SIZE,
+        )
+        TrackArtist.objects.bulk_create(
+            (
+                TrackArtist(track=track, role=role, position=position, name=name)
+                for track in tracks
+                for role, position, name in track._artist_rows()
+            ),
+            batch_size=METADATA_BATCH_SIZE,
+        )
+
+    def _full_tags(self) -> list[str]:
+        role = split_id3_title(self.id3_title)[1]
+        return role.split('|') if role else []
+
+    def _artist_rows(self) -> list[tuple[str, int, str]]:
+        return [
+            (role, position, name)
+            for role, string in (
+                (TrackArtist.ARTIST, self.id3_artist),
+                (TrackArtist.COMPOSER, self.composer),
+            )
+            for position, name in enumerate(
+                chunk.text for chunk in parse_artist(string).chunks if chunk.is_artist
+            )
+        ]
+
+    def sync_roles(self, force: bool = False) -> None:
+        """
+        Make the :class:`TrackRole` objects for this track match its title,
+        unless they already seem to.
+        """
+
+        full_tags = self._full_tags()
+
+        if not force and full_tags == list(
+            self.trackrole_set.order_by('position').values_list('full_tag', flat=True)
+        ):
+            return
+
+        self.trackrole_set.all().delete()
+        TrackRole.objects.bulk_create(
+            TrackRole.for_role(self, position, Role(full_tag))
+            for position, full_tag in enumerate(full_tags)
+        )
+
+    def sync_artists(self, force: bool = False) -> None:
+        """
+        Make the :class:`TrackArtist` objects for this track match its artist
+        and composer, unless they already seem to.
+        """
+
+        names = self._artist_rows()
+
+        if not force and names == list(
+            self.trackartist_set.order_by('role', 'position').values_list(
+                'role', 'position', 'name'
+            )
+        ):
+            return
+
+        self.trackartist_set.all().delete()
+        TrackArtist.objects.bulk_create(
+            TrackArtist(track=self, role=role, position=position, name=name)
+            for role, position, name in names
         )
 
     def role_details_for_anime(self, anime: str) -> list[Role]:
@@ -1205,11 +1527,11 @@ class Track(CleanOnSaveMixin, Serializable, models.Model):
     @memoize
     @pk_cached(3600)
     def musicbrainz_release(self) -> Optional[dict[str, Any]]:
-        releases = musicbrainzngs.search_releases(
+        releases = musicbrainz_releases(
             tracks=self.title,
             release=self.album,
             artist=self.artist,
-        ).get('release-list')
+        )
 
         official_releases = [r for r in releases if r.get('status') == 'Official']
 
@@ -1284,34 +1606,49 @@ class Track(CleanOnSaveMixin, Serializable, models.Model):
         image_url = self.get_biggest_lastfm_image_url()
 
         if image_url is None:
-            self.background_art = None
-            self.save()
+            self.set_background_art(None, None)
+            return
+
+        if image_url == self.background_art_source and self.background_art:
             return
 
         try:
-            input_image = Image.open(BytesIO(requests.get(image_url).content))
+            blurred = blur_background_art(external_get(image_url).content)
         except IOError as e:
             print('{}:\n - {}'.format(self, e))
-            self.background_art = None
-            self.save()
+            self.set_background_art(image_url, None)
             return
 
-        if input_image.mode not in ['L', 'RGB']:
-            input_image = input_image.convert('RGB')
+        self.set_background_art(image_url, blurred)
 
-        # in almost all circumstances, it will be width that determines display
-        # size, so we should set our blur radius relative to that.
-        radius = input_image.size[0] / 130
+    def set_background_art(self, source: Optional[str], jpeg: Optional[bytes]) -> None:
+        """
+        Save `jpeg` as this track's background art, noting that it was made
+        from the image at `source`, or remove this track's background art if
+        we don't have any.
+        """
 
-        blurred = input_image.filter(ImageFilter.GaussianBlur(radius=radius))
+        if source is None or jpeg is None:
+            self.background_art = None
+            self.background_art_source = ''
+            self.save()
+            return
 
-        suffix = '.jpg'
-        temp_file = NamedTemporaryFile(delete=True, suffix=suffix)
-        blurred.save(temp_file, 'JPEG', quality=60)
+        self.background_art_source = source
+        self.background_art.save(source.split('/')[-1] + '.jpg', ContentFile(jpeg))
 
-        temp_file.flush()
+    @classmethod
+    def api_dicts(cls, tracks: Iterable[Track]) -> JsonList:
+        """
+        Return :meth:`api_dict` for each of `tracks`, looking up the shows
+        they were revealed in all at once.
+        """
+
+        tracks = list(tracks)
 
-        self.background_art.save(image_url.split('/')[-1] + suffix, File(temp_file))
+        with show_registry():
+            Show.at_many(t.revealed for t in tracks if t.revealed is not None)
+            return [t.api_dict() for t in tracks]
 
     def api_dict(self, verbose: bool = False) -> JsonDict:
         show_revealed = self.show_revealed()
@@ -1362,6 +1699,81 @@ MANUAL_VOTE_KINDS = (
 )
 
 
+class TrackRole(models.Model):
+    """
+    One of the roles of a :class:`Track`, as parsed into a :class:`Role`, kept
+    in sync with the track's title by :meth:`Track.sync_roles` so that we can
+    find tracks by anime without parsing the whole library.
+    """
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['track', 'position'], name='unique_track_role_position'
+            ),
+        ]
+        ordering = ['track', 'position']
+
+    track = models.ForeignKey(Track, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+    full_tag = models.CharField(max_length=500)
+    anime = models.CharField(max_length=500, blank=True, null=True, db_index=True)
+    full_role = models.CharField(max_length=500)
+    caveat = models.CharField(max_length=500, blank=True, null=True)
+    kind = models.CharField(max_length=500, blank=True)
+    specifics = models.CharField(max_length=500, blank=True)
+    sortkey_group = models.FloatField()
+
+    def __str__(self) -> str:
+        return self.full_tag
+
+    @classmethod
+    def for_role(cls, track: Track, position: int, role: Role) -> TrackRole:
+        return cls(
+            track=track,
+            position=position,
+            full_tag=role.full_tag,
+            anime=role.anime,
+            full_role=role.full_role,
+            caveat=role.caveat,
+            kind=role.kind,
+            specifics=role.specifics,
+            sortkey_group=role.sortkey_group,
+        )
+
+
+class TrackArtist(models.Model):
+    """
+    The name of one of the artists or composers of a :class:`Track`, as parsed
+    by :func:`.parse_artist`, kept in sync with the track by
+    :meth:`Track.sync_artists` so that we can find tracks by artist without
+    parsing the whole library.
+    """
+
+    ARTIST = 'artist'
+    COMPOSER = 'composer'
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['track', 'role', 'position'],
+                name='unique_track_artist_position',
+            ),
+        ]
+        indexes = [models.Index(fields=['role', 'name'])]
+        ordering = ['track', 'role', 'position']
+
+    track = models.ForeignKey(Track, on_delete=models.CASCADE)
+    role = models.CharField(
+        max_length=8, choices=[(ARTIST, 'artist'), (COMPOSER, 'composer')]
+    )
+    position = models.PositiveIntegerField()
+    name = models.CharField(max_length=5000)
+
+    def __str__(self) -> str:
+        return self.name
+
+
 class VoteKind(Enum):
     #: A request made using the website's built-in requesting machinery.
     local = auto()
@@ -1373,7 +1785,13 @@ class VoteKind(Enum):
     manual = auto()
 
 
-class Vote(SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model):
+class Vote(
+    ForgetMemoizedMixin, SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model
+):
+    # the stats this vote counted towards before it was changed, remembered by
+    # our signal handlers while it's being saved
+    _previous_stats_keys: set[VoterShowStatsKey]
+
     # universal
     tracks: models.ManyToManyField[Track, Any] = models.ManyToManyField(
         Track, db_index=True
@@ -1401,6 +1819,10 @@ class Vote(SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model):
     name = models.CharField(max_length=40, blank=True)
     kind = models.CharField(max_length=10, choices=MANUAL_VOTE_KINDS, blank=True)
 
+    # recorded by finalize() once the show has ended
+    final_success = models.FloatField(blank=True, null=True, editable=False)
+    final_weight = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
     def __hash__(self) -> int:
         return hash((type(self), self.id))
 
@@ -1557,16 +1979,24 @@ class Vote(SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model):
         return None
 
     @memoize
-    @pk_cached(indefinitely)
     def success(self) -> Optional[float]:
         """
         Return how successful this :class:`Vote` is, as a :class:`float`
         between 0 and 1, or :data:`None` if we don't know yet.
         """
 
+        if self.final_success is not None:
+            return self.final_success
+
         if not self.show.has_ended():
             return None
 
+        return self._success()
+
+    @pk_cached(indefinitely)
+    def _success(self) -> float:
+        # kept separate from .success() so that we never cache the None that
+        # we return for shows that haven't finished yet
         successes = 0
         for track in self.tracks.all():
             if track in self.show.playlist():
@@ -1575,15 +2005,60 @@ class Vote(SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model):
         return successes / self.weight()
 
     @memoize
-    @pk_cached(indefinitely)
     def weight(self) -> float:
         """
         Return how much we should take this vote into account when calculating
         a user's batting average.
         """
 
+        if self.final_weight is not None:
+            return float(self.final_weight)
+
+        return self._weight()
+
+    @pk_cached(indefinitely)
+    def _weight(self) -> float:
         return float(self.tracks.all().count())
 
+    @classmethod
+    def finalize(cls, votes: models.QuerySet[Vote]) -> None:
+        """
+        Record the success and weight of each of `votes` whose show has
+        ended, so that :meth:`success` and :meth:`weight` don't have to work
+        them out again, and forget them for the rest, and for votes that
+        aren't for any tracks.
+        """
+
+        now = timezone.now()
+        played = Play.objects.filter(
+            show_id=OuterRef('vote__show_id'), track_id=OuterRef('track_id')
+        )
+        rows = (
+            cls.tracks.through.objects.filter(vote__in=votes.filter(show__end__lt=now))
+            .values('vote_id')
+            .annotate(
+                weight=Count('pk'), successes=Count('pk', filter=Q(Exists(played)))
+            )
+            .order_by()
+        )
+
+        with transaction.atomic():
+            cls.objects.bulk_update(
+                [
+                    cls(
+                        pk=row['vote_id'],
+                        final_weight=row['weight'],
+                        final_success=row['successes'] / row['weight'],
+                    )
+                    for row in rows
+                ],
+                ['final_weight', 'final_success'],
+                batch_size=1000,
+            )
+            votes.filter(Q(show__end__gte=now) | Q(tracks=None)).exclude(
+                final_weight=None
+            ).update(final_weight=None, final_success=None)
+
     def api_dict(self, verbose: bool = False) -> JsonDict:
         tracks = self.tracks.all()
         the_vote: dict[str, Any] = {
@@ -1591,7 +2066,7 @@ class Vote(SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model):
             'kind': self.vote_kind.name,
             'time': self.date,
             'track_ids': [t.id for t in tracks],
-            'tracks': [t.api_dict() for t in tracks],
+            'tracks': Track.api_dicts(tracks),
         }
 
         if self.vote_kind == VoteKind.twitter:
@@ -1623,6 +2098,10 @@ class Play(SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model):
     A record that a :class:`Track` was played on the show.
     """
 
+    # the show this was played during before it was changed, remembered by our
+    # signal handlers while it's being saved
+    _previous_show_ids: set[int]
+
     date = models.DateTimeField(db_index=True)
     show = models.ForeignKey(Show, on_delete=models.CASCADE)
     track = models.ForeignKey(Track, db_index=True, on_delete=models.CASCADE)
@@ -1655,6 +2134,165 @@ class Play(SetShowBasedOnDateMixin, CleanOnSaveMixin, models.Model):
         }
 
 
+#: the show, user and twitter user that a :class:`VoterShowStats` row is for
+VoterShowStatsKey = tuple[int, Optional[int], Optional[int]]
+
+
+class VoterShowStats(models.Model):
+    """
+    How many votes a voter made during a show, how many tracks they asked
+    for, and how many of those got played; kept up to date by signal
+    handlers whenever a :class:`Vote` or :class:`Play` changes, so that
+    batting averages and streaks don't have to look at individual votes.
+
+    Rows are per local user or per Twitter user rather than per
+    :class:`.Voter`, since a :class:`Profile` can have votes from both. Manual
+    votes aren't counted. Votes for no tracks at all are, but add nothing to
+    the weight.
+    """
+
+    show = models.ForeignKey(Show, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, blank=True, null=True, on_delete=models.CASCADE)
+    twitter_user = models.ForeignKey(
+        TwitterUser, blank=True, null=True, on_delete=models.CASCADE
+    )
+
+    votes = models.PositiveIntegerField()
+    weight = models.PositiveIntegerField(
+        help_text='the number of tracks asked for, counting each vote separately'
+    )
+    successes = models.PositiveIntegerField(
+        help_text='how many of the tracks asked for got played'
+    )
+
+    class Meta:
+        verbose_name_plural = 'voter show stats'
+        constraints = [
+            CheckConstraint(
+                check=Q(user__isnull=True, twitter_user__isnull=False)
+                | Q(user__isnull=False, twitter_user__isnull=True),
+                name='voter_show_stats_must_have_voter',
+            ),
+            UniqueConstraint(
+                *('show', 'user'),
+                condition=Q(user__isnull=False),
+                name='voter_show_stats_unique_user',
+            ),
+            UniqueConstraint(
+                *('show', 'twitter_user'),
+                condition=Q(twitter_user__isnull=False),
+                name='voter_show_stats_unique_twitter_user',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user or self.twitter_user} during {self.show}'
+
+    @classmethod
+    def for_voter(cls, voter: Voter) -> models.QuerySet[VoterShowStats]:
+        """
+        Return stats for every show `voter` voted during, matching the votes
+        in :meth:`.Voter.unordered_votes`.
+        """
+
+        twu, prf = voter._twitter_user_and_profile()
+        voter_q = Q(pk__in=[])
+
+        if prf is not None:
+            voter_q |= Q(user_id=prf.user_id)
+
+        if twu is not None:
+            voter_q |= Q(twitter_user=twu)
+
+        return cls.objects.filter(voter_q)
+
+    @classmethod
+    def refresh(cls, keys: Iterable[VoterShowStatsKey]) -> None:
+        """
+        Recalculate the stats for each of `keys`.
+        """
+
+        matching = Q(pk__in=[])
+
+        for show_id, user_id, twitter_user_id in set(keys):
+            if user_id is None and twitter_user_id is None:
+                continue
+
+            matching |= Q(
+                show_id=show_id, user_id=user_id, twitter_user_id=twitter_user_id
+            )
+
+        cls._replace(matching)
+
+    @classmethod
+    def refresh_shows(cls, show_ids: Iterable[int]) -> None:
+        """
+        Recalculate the stats for everyone who voted during each of
+        `show_ids`.
+        """
+
+        cls._replace(Q(show_id__in=set(show_ids)))
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """
+        Recalculate every voter's stats for every show.
+        """
+
+        cls._replace(Q())
+
+    @classmethod
+    def _replace(cls, matching: Q) -> None:
+        """
+        Replace the stats rows matching `matching` with ones calculated from
+        the votes it matches. It should only refer to the show, user and
+        twitter user, which stats rows and votes both have.
+        """
+
+        votes = Vote.objects.filter(matching).exclude(user=None, twitter_user=None)
+        key_fields = ('show_id', 'user_id', 'twitter_user_id')
+
+        # every vote counts towards a streak, even one for no tracks, so the
+        # rows come from the votes, and the tracks they asked for are added in
+        rows = {
+            tuple(row[f] for f in key_fields): row
+            for row in (
+                votes.values(*key_fields).annotate(vote_count=Count('pk')).order_by()
+            )
+        }
+
+        played = Play.objects.filter(
+            show_id=OuterRef('vote__show_id'), track_id=OuterRef('track_id')
+        )
+        for tracks in (
+            Vote.tracks.through.objects.filter(vote__in=votes)
+            .values(*(f'vote__{f}' for f in key_fields))
+            .annotate(
+                weight=Count('pk'), successes=Count('pk', filter=Q(Exists(played)))
+            )
+            .order_by()
+        ):
+            key = tuple(tracks[f'vote__{f}'] for f in key_fields)
+            rows[key].update(weight=tracks['weight'], successes=tracks['successes'])
+
+        with transaction.atomic():
+            cls.objects.filter(matching).delete()
+            cls.objects.bulk_create(
+                (
+                    cls(
+                        show_id=row['show_id'],
+                        user_id=row['user_id'],
+                        twitter_user_id=row['twitter_user_id'],
+                        votes=row['vote_count'],
+                        weight=row.get('weight', 0),
+                        successes=row.get('successes', 0),
+                    )
+                    for row in rows.values()
+                ),
+                batch_size=1000,
+            )
+
+
 class Block(CleanOnSaveMixin, models.Model):
     """
     A particular track that we are not going to allow to be voted for on
@@ -1860,6 +2498,114 @@ class ProRouletteCommitment(CleanOnSaveMixin, models.Model):
         ]
 
 
+class Job(CleanOnSaveMixin, models.Model):
+    """
+    An admin operation that takes too long to do within a web request, queued
+    up for the ``run_jobs`` worker. See :mod:`.jobs` for the operations we
+    know how to do.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    name = models.CharField(max_length=100)
+    arguments = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (QUEUED, 'queued'),
+            (RUNNING, 'running'),
+            (SUCCEEDED, 'succeeded'),
+            (FAILED, 'failed'),
+        ],
+        default=QUEUED,
+        db_index=True,
+    )
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(blank=True, null=True)
+    message = models.TextField(
+        blank=True, help_text='what happened, or the traceback if it failed'
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(
+        User, blank=True, null=True, on_delete=models.SET_NULL
+    )
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text='when the worker running this last told us it was still going',
+    )
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at', '-pk']
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.status})'
+
+    def get_absolute_url(self) -> str:
+        return reverse('vote:admin:job', kwargs={'pk': self.pk})
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def percent_complete(self) -> Optional[int]:
+        """
+        >>> Job(progress=3, total=4).percent_complete()
+        75
+        >>> Job(progress=3).percent_complete() is None
+        True
+        """
+
+        if not self.total:
+            return None
+
+        return int(100 * self.progress / self.total)
+
+    def report_progress(self, progress: int, total: Optional[int] = None) -> None:
+        """
+        Record how far through this job we are, and that we're still working
+        on it, without touching anything else about it.
+        """
+
+        self.progress = progress
+        if total is not None:
+            self.total = total
+        self.heartbeat_at = timezone.now()
+
+        Job.objects.filter(pk=self.pk).update(
+            progress=self.progress, total=self.total, heartbeat_at=self.heartbeat_at
+        )
+
+
+class StatsSnapshot(CleanOnSaveMixin, models.Model):
+    """
+    Everything on the stats page, as worked out by the ``snapshot_stats``
+    command, so that visitors don't have to wait for it. See :mod:`.stats`
+    for what's in :attr:`payload`.
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    show = models.ForeignKey(
+        Show,
+        on_delete=models.CASCADE,
+        help_text='the show that was current when this was taken',
+    )
+    payload = models.JSONField()
+
+    class Meta:
+        get_latest_by = 'created_at'
+        ordering = ['-created_at', '-pk']
+
+    def __str__(self) -> str:
+        return f'stats as of {self.created_at}'
+
+
 class BadgeInfoForUser(TypedDict):
     slug: str
     description: str
@@ -1881,14 +2627,23 @@ class Badge:
     finish: Optional[datetime.datetime]
 
     def info(self, user: Voter) -> BadgeInfoForUser:
+        # badges tend to get shown together, so look up every badge's shows at
+        # once; later calls will then find them in the show registry
+        shows = Show.at_many(
+            time
+            for badge in BADGES
+            for time in (badge.start, badge.finish)
+            if time is not None
+        )
+
         return {
             'slug': self.slug,
             'description': self.description_fmt.format(name=user.name),
             'summary': self.summary,
             'icon': self.icon,
             'url': self.url,
-            'start': Show.at(self.start).showtime if self.start is not None else None,
-            'finish': Show.at(self.finish).end if self.finish is not None else None,
+            'start': shows[self.start].showtime if self.start is not None else None,
+            'finish': shows[self.finish].end if self.finish is not None else None,
         }
 
 
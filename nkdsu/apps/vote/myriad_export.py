@@ -2,11 +2,23 @@
 Tools for interacting with CSV exports of the library from Myriad Playout.
 """
 
+from collections import defaultdict
 from csv import DictReader
 from dataclasses import dataclass
-from typing import Callable, Iterable, Optional
+from string import ascii_lowercase, ascii_uppercase
+from typing import Callable, Iterable, Optional, Sequence
+
+from django.db import connection, transaction
+from django.db.models import Q
 
 from .models import Track
+from .utils import invalidate_pk_cached
+
+
+#: how many tracks to look up or write to the database at a time
+BATCH_SIZE = 500
+
+_ASCII_LOWER = str.maketrans(ascii_uppercase, ascii_lowercase)
 
 
 def has_hook(entry: dict[str, str]) -> bool:
@@ -84,3 +96,167 @@ def entries_for_file(file: Iterable[str]) -> Iterable[PlayoutEntry]:
     reader = DictReader(file)
     for csv_entry in reader:
         yield PlayoutEntry.from_csv(csv_entry)
+
+
+class TrackMatcher:
+    """
+    Everything :meth:`PlayoutEntry.matched_track` would look at for a
+    particular set of entries, loaded in a handful of queries, so that we can
+    match a whole export without a query per entry.
+
+    Matching an entry changes the track's media id, which changes what later
+    entries match against, so :meth:`match` keeps the index of media ids up to
+    date as it goes, just as saving each track in turn would have done.
+    """
+
+    def __init__(self, entries: Sequence[PlayoutEntry]) -> None:
+        self.tracks: dict[str, Track] = {}
+
+        media_ids = sorted({entry.media_id for entry in entries})
+        titles = sorted({entry.title for entry in entries})
+        fields = [
+            'media_id',
+            'has_hook',
+            'id3_title',
+            'id3_artist',
+            'revealed',
+            'hidden',
+        ]
+
+        for i in range(0, len(media_ids), BATCH_SIZE):
+            self._load(Q(media_id__in=media_ids[i : i + BATCH_SIZE]), fields)
+
+        for i in range(0, len(titles), BATCH_SIZE):
+            self._load(
+                Q(
+                    revealed__isnull=False,
+                    hidden=False,
+                    id3_title__in=titles[i : i + BATCH_SIZE],
+                ),
+                fields,
+            )
+
+        self.by_media_id: dict[int, Track] = {
+            track.media_id: track
+            for track in self.tracks.values()
+            if track.media_id is not None
+        }
+        self.by_title: defaultdict[str, list[Track]] = defaultdict(list)
+
+        for track in self.tracks.values():
+            if track.revealed is not None and not track.hidden:
+                self.by_title[track.id3_title].append(track)
+
+        self.original_media_ids = {
+            pk: track.media_id for pk, track in self.tracks.items()
+        }
+
+    def _load(self, query: Q, fields: list[str]) -> None:
+        for track in Track.objects.filter(query).only(*fields):
+            self.tracks.setdefault(track.pk, track)
+
+    @staticmethod
+    def _startswith(value: str, prefix: str) -> bool:
+        # SQLite's LIKE, which is what the database uses for startswith
+        # lookups, ignores the case of ASCII letters
+        if connection.vendor == 'sqlite':
+            return value.translate(_ASCII_LOWER).startswith(
+                prefix.translate(_ASCII_LOWER)
+            )
+
+        return value.startswith(prefix)
+
+    def matched_track(self, entry: PlayoutEntry) -> Optional[Track]:
+        """
+        Return the same thing :meth:`PlayoutEntry.matched_track` would, given
+        the entries we've already matched.
+        """
+
+        track = self.by_media_id.get(entry.media_id)
+
+        if track is not None:
+            return track
+
+        candidates = [
+            track
+            for track in self.by_title.get(entry.title, [])
+            if self._startswith(track.id3_artist, entry.artists)
+        ]
+
+        if len(candidates) == 1:
+            return candidates[0]
+
+        return None
+
+    def match(self, entry: PlayoutEntry) -> Optional[Track]:
+        """
+        Find the :class:`.Track` that matches `entry` and update it, but don't
+        save it.
+        """
+
+        track = self.matched_track(entry)
+
+        if track is None:
+            return None
+
+        if self.by_media_id.get(track.media_id) is track:
+            del self.by_media_id[track.media_id]
+
+        track.media_id = entry.media_id
+        track.has_hook = entry.has_hook
+        self.by_media_id[track.media_id] = track
+
+        return track
+
+    def save(self, tracks: Iterable[Track]) -> None:
+        """
+        Write the changes :meth:`match` made to `tracks` to the database.
+        """
+
+        tracks = list(tracks)
+        moved = [
+            track.pk
+            for track in tracks
+            if track.media_id != self.original_media_ids[track.pk]
+        ]
+
+        with transaction.atomic():
+            # media ids are unique, and the database checks that as it
+            # updates each row, so if two tracks swapped media ids, one of
+            # them would briefly clash with the other
+            for i in range(0, len(moved), BATCH_SIZE):
+                Track.objects.filter(pk__in=moved[i : i + BATCH_SIZE]).update(
+                    media_id=None
+                )
+
+            Track.objects.bulk_update(
+                tracks, ['media_id', 'has_hook'], batch_size=BATCH_SIZE
+            )
+            invalidate_pk_cached(Track, *(track.pk for track in tracks))
+
+
+def update_matched_tracks(entries: Iterable[PlayoutEntry]) -> tuple[int, int]:
+    """
+    Do :meth:`PlayoutEntry.update_matched_track` for each of `entries`, in a
+    handful of queries rather than a few per entry.
+
+    :returns: how many entries we matched against a track, and how many we
+        didn't.
+    """
+
+    entries = list(entries)
+    matcher = TrackMatcher(entries)
+    matched: dict[str, Track] = {}
+    unmatched = 0
+
+    for entry in entries:
+        track = matcher.match(entry)
+
+        if track is None:
+            unmatched += 1
+        else:
+            matched[track.pk] = track
+
+    matcher.save(matched.values())
+
+    return len(entries) - unmatched, unmatched
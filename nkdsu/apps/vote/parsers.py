@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Iterable, Optional
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
 
 from django.conf import settings
 from django.urls import reverse
@@ -7,6 +8,8 @@ from django.urls import reverse
 from sly import Lexer
 from sly.lex import LexError
 
+from .linkable_artists import linkable_artists
+
 
 @dataclass(frozen=True)
 class ArtistChunk:
@@ -23,14 +26,12 @@ class ArtistChunk:
 
     @property
     def worth_linking_to(self) -> bool:
-        from .models import Track
-
-        return bool(self.is_artist and Track.objects.by_artist(self.text))
+        return self.is_artist and self.text in linkable_artists
 
 
 @dataclass(frozen=True)
 class ParsedArtist:
-    chunks: list[ArtistChunk]
+    chunks: tuple[ArtistChunk, ...]
     should_collapse: bool
 
     def __iter__(self) -> Iterable[ArtistChunk]:
@@ -232,14 +233,44 @@ def chunk_artist(string: str, fail_silently: bool = True) -> Iterable[ArtistChun
         yield ArtistChunk(fragment[1], is_artist=fragment[0])
 
 
-def parse_artist(string: str, fail_silently: bool = True) -> ParsedArtist:
+@lru_cache(maxsize=settings.PARSE_ARTIST_CACHE_SIZE)
+def _parse_artist(string: str, fail_silently: bool) -> ParsedArtist:
     if not string:
-        return ParsedArtist(chunks=[], should_collapse=False)
+        return ParsedArtist(chunks=(), should_collapse=False)
 
-    chunks = list(chunk_artist(string, fail_silently=fail_silently))
+    chunks = tuple(chunk_artist(string, fail_silently=fail_silently))
     naive_is_group = check_for_group(string, chunks[0].text)
     return ParsedArtist(
         chunks=chunks,
         should_collapse=naive_is_group
         and len([chunk for chunk in chunks if chunk.is_artist]) > 2,
     )
+
+
+def parse_artist(string: str, fail_silently: bool = True) -> ParsedArtist:
+    """
+    Parse `string` into a :class:`ParsedArtist`.
+
+    We see the same few thousand artist strings over and over, so results are
+    kept in an LRU cache of :data:`settings.PARSE_ARTIST_CACHE_SIZE` entries.
+    :class:`ParsedArtist` is immutable, so it's safe to hand the same one out
+    to everyone who asks.
+    """
+
+    return _parse_artist(string, fail_silently)
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+
+
+def parse_artist_cache_info() -> CacheInfo:
+    """
+    Return the hits, misses and size of the cache in front of
+    :func:`parse_artist`.
+    """
+
+    return CacheInfo(*_parse_artist.cache_info())
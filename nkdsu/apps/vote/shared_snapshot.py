@@ -0,0 +1,159 @@
+"""
+A base for process-wide copies of things that we'd otherwise have to ask the
+database for over and over again, like :mod:`.show_index` and
+:mod:`.linkable_artists`.
+
+Each process builds its own copy, and finds out about changes made elsewhere
+through a version token in the cache, which it checks at most every
+:data:`CHECK_INTERVAL` seconds.
+
+Changes made inside a transaction are only visible to the connection that
+made them until it commits, so the token is only replaced once they are, and
+until then, the thread that made them is told that it can't trust the shared
+copy.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Callable, Generic, Optional, TypeVar
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+CHECK_INTERVAL: float = 2
+
+T = TypeVar('T')
+
+
+@dataclass
+class _Versioned(Generic[T]):
+    value: T
+    version: str
+    checked_at: float = field(default_factory=monotonic)
+
+
+class SharedSnapshot(Generic[T]):
+    """
+    Subclasses set :attr:`version_key` and implement :meth:`build`.
+    """
+
+    version_key: str
+
+    def __init__(self) -> None:
+        self._snapshot: Optional[_Versioned[T]] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def build(self) -> T:
+        """
+        Return a new copy of whatever we're keeping, as the database currently
+        has it.
+        """
+
+        raise NotImplementedError()
+
+    def invalidate(self) -> None:
+        """
+        Forget the shared copy, in this process and in every other one.
+        """
+
+        self._snapshot = None
+        cache.set(self.version_key, uuid4().hex, None)
+
+    def changed(self) -> None:
+        """
+        Note that something we keep a copy of has been changed on the default
+        connection, and invalidate the shared copy once that change has been
+        committed.
+        """
+
+        if not connection.in_atomic_block:
+            self.invalidate()
+            return
+
+        self.forget_uncommitted()
+        savepoint_ids = set(connection.savepoint_ids)
+        pending = self._pending()
+
+        if savepoint_ids in pending.values():
+            # we'll find out what happens to this savepoint anyway
+            return
+
+        def invalidate() -> None:
+            self.invalidate()
+
+        transaction.on_commit(invalidate)
+        pending[invalidate] = savepoint_ids
+
+    def forget_uncommitted(self) -> None:
+        """
+        Called whenever this thread makes a change that hasn't been committed
+        yet, or one of those changes is undone. Subclasses that keep a private
+        copy reflecting those changes should throw it away here.
+        """
+
+    def has_uncommitted_changes(self) -> bool:
+        """
+        Return :data:`True` if this thread has made changes that nobody else
+        can see yet, and so shouldn't use the shared copy.
+        """
+
+        return bool(self._pending())
+
+    def _pending(self) -> dict[Callable[[], None], set[Optional[str]]]:
+        """
+        Return the callbacks registered by :meth:`changed` that are still
+        waiting for this thread's transaction to be committed, along with the
+        savepoints they were registered within. Once a transaction (or
+        savepoint) is rolled back, Django forgets about the callbacks
+        registered within it, so this is empty once every change we know
+        about has either been committed or undone.
+        """
+
+        pending = getattr(self._local, 'pending', {})
+
+        if pending:
+            waiting = {func for sids, func, *rest in connection.run_on_commit}
+            still_pending = {
+                func: sids for func, sids in pending.items() if func in waiting
+            }
+
+            if len(still_pending) < len(pending):
+                self.forget_uncommitted()
+
+            pending = still_pending
+
+        self._local.pending = pending
+        return pending
+
+    def shared(self) -> T:
+        """
+        Return the copy shared by every thread in this process, building it
+        first if it's missing or out of date.
+        """
+
+        snapshot = self._snapshot
+
+        if snapshot is not None and monotonic() - snapshot.checked_at > CHECK_INTERVAL:
+            if cache.get(self.version_key) != snapshot.version:
+                snapshot = None
+            else:
+                snapshot.checked_at = monotonic()
+
+        if snapshot is None:
+            with self._lock:
+                version = cache.get(self.version_key)
+
+                if version is None:
+                    version = uuid4().hex
+                    if not cache.add(self.version_key, version, None):
+                        version = cache.get(self.version_key, version)
+
+                snapshot = self._snapshot = _Versioned(self.build(), version)
+
+        return snapshot.value
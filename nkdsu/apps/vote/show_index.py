@@ -0,0 +1,122 @@
+"""
+A process-wide, sorted index of show boundaries, so that working out which
+show a given time belongs to doesn't need a database query.
+
+Shows are few and are almost only ever appended, so we keep every show in
+memory and rebuild the whole index whenever one is saved or deleted. Other
+processes find out about changes as described in :mod:`.shared_snapshot`; in
+the meantime they may serve slightly stale show details, but never a wrong
+show for a time that is past the end of their index, since those lookups fall
+back to the database.
+
+A thread with uncommitted changes to shows uses a private index until they're
+committed, and everyone else keeps using the shared one.
+"""
+
+from __future__ import annotations
+
+import datetime
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, Optional, TYPE_CHECKING
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .shared_snapshot import SharedSnapshot
+
+if TYPE_CHECKING:
+    from .models import Show
+
+
+@dataclass
+class _Snapshot:
+    field_names: list[str]
+    rows: list[tuple[Any, ...]]
+    ends: list[datetime.datetime]
+
+    @classmethod
+    def build(cls) -> _Snapshot:
+        from .models import Show
+
+        field_names = [f.attname for f in Show._meta.concrete_fields]
+        rows = list(Show.objects.order_by('end').values_list(*field_names))
+        end_index = field_names.index('end')
+
+        return cls(
+            field_names=field_names,
+            rows=rows,
+            ends=[row[end_index] for row in rows],
+        )
+
+    def at(self, time: datetime.datetime) -> Optional[Show]:
+        from .models import Show
+
+        # the first show that ends after `time`
+        index = bisect_right(self.ends, time)
+
+        if index >= len(self.rows):
+            return None
+
+        return Show.from_db(DEFAULT_DB_ALIAS, self.field_names, self.rows[index])
+
+
+class ShowIndex(SharedSnapshot[_Snapshot]):
+    version_key = 'vote:show_index:version'
+
+    def build(self) -> _Snapshot:
+        return _Snapshot.build()
+
+    def at(self, time: datetime.datetime) -> Optional[Show]:
+        """
+        Return the first show that ends after `time`, or :data:`None` if we
+        don't know of one, in which case you should ask the database.
+        """
+
+        snapshot = self._current_snapshot()
+
+        if snapshot is None:
+            return None
+
+        return snapshot.at(time)
+
+    def show_changed(self) -> None:
+        """
+        Note that a show has been saved or deleted on the default connection.
+        """
+
+        self.changed()
+
+    def forget_uncommitted(self) -> None:
+        self._local.snapshot = None
+        self._local.looked_up = False
+
+    def _private_snapshot(self) -> Optional[_Snapshot]:
+        """
+        Return an index of what this thread's transaction can see, if it has
+        made changes to shows that haven't been committed yet.
+
+        Rebuilding the index costs about as much as looking a single show up
+        in the database, so we only bother once something has been looked up
+        twice since the last change.
+        """
+
+        snapshot = getattr(self._local, 'snapshot', None)
+
+        if snapshot is None and not getattr(self._local, 'looked_up', False):
+            self._local.looked_up = True
+            return None
+
+        if snapshot is None:
+            snapshot = self._local.snapshot = _Snapshot.build()
+
+        return snapshot
+
+    def _current_snapshot(self) -> Optional[_Snapshot]:
+        if self.has_uncommitted_changes():
+            return self._private_snapshot()
+
+        self._local.snapshot = None
+        return self.shared()
+
+
+show_index = ShowIndex()
@@ -0,0 +1,117 @@
+"""
+A per-request identity map for :class:`.Show` instances.
+
+Lots of things on a page (every track in a list, for instance) ask for
+:meth:`.Show.current`, :meth:`.Show.at` or a show's neighbours. While a
+registry is active, each of those is resolved once and every caller gets the
+same :class:`.Show` instance back, so anything memoized on that instance is
+shared, too.
+"""
+
+from __future__ import annotations
+
+import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .models import Show
+
+
+class ShowRegistry:
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.shows: dict[int, Show] = {}
+        self.current: Optional[Show] = None
+        self.shows_at: dict[datetime.datetime, Show] = {}
+
+    def canonical(self, show: Show) -> Show:
+        """
+        Return the instance of `show` that this registry has already handed
+        out, registering `show` as that instance if there isn't one yet.
+        """
+
+        if show.pk is None:
+            return show
+        return self.shows.setdefault(show.pk, show)
+
+    def at(self, time: datetime.datetime) -> Optional[Show]:
+        show = self.shows_at.get(time)
+
+        if show is not None:
+            return show
+
+        # shows never overlap, so a show that is on air at `time` is
+        # definitely the show for `time`
+        for show in self.shows.values():
+            if show.showtime <= time < show.end:
+                return show
+
+        return None
+
+    def remember_at(self, time: datetime.datetime, show: Show) -> Show:
+        show = self.shows_at[time] = self.canonical(show)
+        return show
+
+    def remember_current(self, show: Show) -> Show:
+        show = self.current = self.canonical(show)
+        return show
+
+
+_active_registry: ContextVar[Optional[ShowRegistry]] = ContextVar(
+    'show_registry', default=None
+)
+
+
+def active_registry() -> Optional[ShowRegistry]:
+    return _active_registry.get()
+
+
+@contextmanager
+def show_registry() -> Iterator[ShowRegistry]:
+    """
+    Activate a :class:`ShowRegistry` for the duration of the block. If one is
+    already active, it is reused.
+    """
+
+    registry = _active_registry.get()
+
+    if registry is not None:
+        yield registry
+        return
+
+    registry = ShowRegistry()
+    token = _active_registry.set(registry)
+
+    try:
+        yield registry
+    finally:
+        _active_registry.reset(token)
+
+
+def canonical_show(show: Optional[Show]) -> Optional[Show]:
+    """
+    Return the registered instance of `show`, if there's an active registry.
+    """
+
+    registry = _active_registry.get()
+
+    if registry is None or show is None:
+        return show
+
+    return registry.canonical(show)
+
+
+def forget_shows() -> None:
+    """
+    Clear the active registry, if there is one. Called whenever a show is
+    saved or deleted, since that might change the answers it has recorded.
+    """
+
+    registry = _active_registry.get()
+
+    if registry is not None:
+        registry.clear()
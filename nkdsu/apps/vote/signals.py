@@ -1,11 +1,26 @@
-from typing import Optional, Sequence
+from typing import Any, Iterable, Optional, Sequence
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.db.models import Model
+from django.db.models import Model, QuerySet
 
 from .elfs import ELFS_NAME
-from .models import Profile
+from .linkable_artists import linkable_artists
+from .models import (
+    Block,
+    Discard,
+    Play,
+    Profile,
+    Shortlist,
+    Show,
+    Track,
+    Vote,
+    VoterShowStats,
+    VoterShowStatsKey,
+)
+from .show_index import show_index
+from .show_registry import forget_shows
+from .utils import clear_memoized, invalidate_pk_cached, invalidate_pk_cached_model
 
 User = get_user_model()
 
@@ -25,3 +40,210 @@ def create_profile_on_user_creation(
 
 def make_elfs(**kwargs) -> None:
     Group.objects.get_or_create(name=ELFS_NAME)
+
+
+def _invalidate_for_votes(vote_pks: Iterable[Any]) -> None:
+    votes = list(Vote.objects.filter(pk__in=vote_pks).values_list('pk', 'show_id'))
+    invalidate_pk_cached(Vote, *(vote_pk for vote_pk, show_pk in votes))
+    invalidate_pk_cached(Show, *{show_pk for vote_pk, show_pk in votes})
+
+
+def invalidate_pk_cached_for_show(sender: type[Show], **kwargs) -> None:
+    # the creation or modification of any show can change the results of
+    # .next() and .prev() on its neighbours, so forget about every show
+    invalidate_pk_cached_model(Show)
+
+
+def forget_registered_shows(sender: type[Show], **kwargs) -> None:
+    forget_shows()
+    show_index.show_changed()
+
+
+def sync_track_metadata(sender: type[Track], instance: Track, **kwargs) -> None:
+    instance.sync_metadata()
+
+
+def forget_linkable_artists(sender: type[Track], **kwargs) -> None:
+    linkable_artists.tracks_changed()
+
+
+def invalidate_pk_cached_for_track(
+    sender: type[Track], instance: Track, **kwargs
+) -> None:
+    invalidate_pk_cached(Track, instance.pk)
+
+    # this might have just been revealed
+    if instance.revealed is not None:
+        revealed_during = Show._at(instance.revealed, create=False)
+        if revealed_during is not None:
+            invalidate_pk_cached(Show, revealed_during.pk)
+
+
+def invalidate_pk_cached_for_vote(sender: type[Vote], instance: Vote, **kwargs) -> None:
+    invalidate_pk_cached(Vote, instance.pk)
+    invalidate_pk_cached(Show, instance.show_id)
+
+
+def invalidate_pk_cached_for_tracks_of_deleted_vote(
+    sender: type[Vote], instance: Vote, **kwargs
+) -> None:
+    # by the time post_delete is sent, the tracks this vote was for have
+    # already been detached from it, so we have to do this beforehand
+    invalidate_pk_cached(Track, *instance.tracks.values_list('pk', flat=True))
+
+
+def invalidate_pk_cached_for_vote_tracks(
+    sender: type[Model],
+    instance: Vote | Track,
+    action: str,
+    reverse: bool,
+    pk_set: Optional[set[Any]],
+    **kwargs,
+) -> None:
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    clear_memoized(instance)
+
+    if reverse:
+        assert isinstance(instance, Track)
+        invalidate_pk_cached(Track, instance.pk)
+        _invalidate_for_votes(
+            instance.vote_set.values_list('pk', flat=True) if pk_set is None else pk_set
+        )
+    else:
+        assert isinstance(instance, Vote)
+        invalidate_pk_cached(Vote, instance.pk)
+        invalidate_pk_cached(Show, instance.show_id)
+        invalidate_pk_cached(
+            Track,
+            *(
+                instance.tracks.values_list('pk', flat=True)
+                if pk_set is None
+                else pk_set
+            ),
+        )
+
+
+def invalidate_pk_cached_for_play(sender: type[Play], instance: Play, **kwargs) -> None:
+    invalidate_pk_cached(Track, instance.track_id)
+    invalidate_pk_cached(Show, instance.show_id)
+
+    # the success of every vote for this show depends on what got played
+    invalidate_pk_cached(
+        Vote,
+        *Vote.objects.filter(show_id=instance.show_id).values_list('pk', flat=True),
+    )
+
+
+def invalidate_pk_cached_for_show_and_track(
+    sender: type[Block | Discard | Shortlist],
+    instance: Block | Discard | Shortlist,
+    **kwargs,
+) -> None:
+    invalidate_pk_cached(Track, instance.track_id)
+    invalidate_pk_cached(Show, instance.show_id)
+
+
+# the pre_* handlers below note what the votes, plays and tracks we're in the
+# middle of saving or deleting affected beforehand, on the instances
+# themselves, so that the post_* ones can refresh those stats too once
+# they've moved to another show or voter or are gone
+
+
+def _stats_keys(votes: QuerySet[Vote]) -> set[VoterShowStatsKey]:
+    return set(votes.values_list('show_id', 'user_id', 'twitter_user_id'))
+
+
+def _refresh_stats_for_votes(vote_pks: Iterable[Any]) -> None:
+    votes = Vote.objects.filter(pk__in=vote_pks)
+    VoterShowStats.refresh(_stats_keys(votes))
+    Vote.finalize(votes)
+
+
+def _vote_is_final(vote: Vote) -> bool:
+    return vote.final_weight is not None or vote.show.has_ended()
+
+
+def remember_previous_stats_for_vote(
+    sender: type[Vote], instance: Vote, raw: bool = False, **kwargs
+) -> None:
+    if instance.pk is not None and not raw:
+        instance._previous_stats_keys = _stats_keys(Vote.objects.filter(pk=instance.pk))
+
+
+def refresh_stats_for_vote(
+    sender: type[Vote], instance: Vote, raw: bool = False, **kwargs
+) -> None:
+    if not raw:
+        VoterShowStats.refresh(
+            {
+                (instance.show_id, instance.user_id, instance.twitter_user_id),
+                *instance.__dict__.pop('_previous_stats_keys', ()),
+            }
+        )
+
+
+def finalize_vote(
+    sender: type[Vote], instance: Vote, raw: bool = False, **kwargs
+) -> None:
+    # votes can be added to shows that have already ended, and moved to or
+    # from them
+    if not raw and _vote_is_final(instance):
+        Vote.finalize(Vote.objects.filter(pk=instance.pk))
+
+
+def remember_votes_for_track(sender: type[Track], instance: Track, **kwargs) -> None:
+    # deleting a track changes the weight of every vote it was part of
+    instance._previous_vote_ids = set(instance.vote_set.values_list('pk', flat=True))
+
+
+def refresh_stats_for_track(sender: type[Track], instance: Track, **kwargs) -> None:
+    _refresh_stats_for_votes(instance.__dict__.pop('_previous_vote_ids', ()))
+
+
+def refresh_stats_for_vote_tracks(
+    sender: type[Model],
+    instance: Vote | Track,
+    action: str,
+    reverse: bool,
+    pk_set: Optional[set[Any]],
+    **kwargs,
+) -> None:
+    if not reverse:
+        assert isinstance(instance, Vote)
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            VoterShowStats.refresh(
+                [(instance.show_id, instance.user_id, instance.twitter_user_id)]
+            )
+            if _vote_is_final(instance):
+                Vote.finalize(Vote.objects.filter(pk=instance.pk))
+        return
+
+    assert isinstance(instance, Track)
+
+    if action == 'pre_clear':
+        remember_votes_for_track(type(instance), instance)
+    elif action == 'post_clear':
+        refresh_stats_for_track(type(instance), instance)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        _refresh_stats_for_votes(pk_set)
+
+
+def remember_previous_show_for_play(
+    sender: type[Play], instance: Play, raw: bool = False, **kwargs
+) -> None:
+    if instance.pk is not None and not raw:
+        instance._previous_show_ids = set(
+            Play.objects.filter(pk=instance.pk).values_list('show_id', flat=True)
+        )
+
+
+def refresh_stats_for_play(
+    sender: type[Play], instance: Play, raw: bool = False, **kwargs
+) -> None:
+    # what got played changes the success of every vote for the show
+    if not raw:
+        show_ids = {instance.show_id, *instance.__dict__.pop('_previous_show_ids', ())}
+        VoterShowStats.refresh_shows(show_ids)
+        Vote.finalize(Vote.objects.filter(show_id__in=show_ids))
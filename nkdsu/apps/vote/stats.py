@@ -0,0 +1,395 @@
+"""
+The numbers on the stats page, worked out for every voter and track at once
+from a handful of aggregate queries, rather than with a few queries for each
+of them.
+
+The results are saved as a :class:`.StatsSnapshot` by the ``snapshot_stats``
+management command once each show ends and every
+:data:`~nkdsu.settings.STATS_SNAPSHOT_INTERVAL` seconds in between, and the
+stats page shows the latest snapshot, even if it's from before the current
+show. Voters and tracks are stored in the snapshot's payload by pk, like
+this::
+
+    {
+        "streaks": [["profile", 1, 12], ["twitter_user", 4, 3], ...],
+        "batting_averages": [["profile", 1, 0.75], ...],
+        "popular_tracks": [["0007C3F2760E0541", 20], ...]
+    }
+
+so showing one costs a query for each kind of thing in it. What we get out of
+it is cached under :data:`CACHE_KEY` too, so usually it costs nothing.
+"""
+
+from __future__ import annotations
+
+import datetime
+from collections import defaultdict
+from typing import Any, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .api_utils import JsonDict, JsonEncodable
+from .models import (
+    Profile,
+    Show,
+    StatsSnapshot,
+    Track,
+    TwitterUser,
+    VoterShowStats,
+)
+from .voter import Voter
+
+
+CACHE_KEY = 'stats:context'
+LOCK_KEY = 'stats:snapshotting'
+
+#: how many tracks someone has to have asked for before we rank their batting
+#: average
+MINIMUM_WEIGHT = 4
+
+#: how many shows' worth of stats to look at at a time when working out
+#: streaks
+STREAK_CHUNK_SIZE = 20
+
+#: how many of the most popular tracks to list
+POPULAR_TRACK_COUNT = 10
+
+#: how many old snapshots to keep around
+SNAPSHOTS_TO_KEEP = 10
+
+
+class _Voters:
+    """
+    The voters that :class:`.VoterShowStats` rows belong to, looked up all at
+    once. Rows for a local user and a Twitter user that share a
+    :class:`.Profile` belong to the same voter. Local users without a
+    :class:`.Profile` aren't voters we can show, so rows for them belong to
+    nobody.
+    """
+
+    def __init__(
+        self,
+        user_ids: Iterable[Optional[int]],
+        twitter_user_ids: Iterable[Optional[int]],
+    ) -> None:
+        users = {pk for pk in user_ids if pk is not None}
+        twitter_users = {pk for pk in twitter_user_ids if pk is not None}
+        profiles = list(
+            Profile.objects.filter(
+                Q(user_id__in=users) | Q(twitter_user_id__in=twitter_users)
+            ).select_related('user', 'twitter_user')
+        )
+
+        self.by_user: dict[int, Voter] = {p.user_id: p for p in profiles}
+        self.by_twitter_user: dict[int, Voter] = {
+            p.twitter_user_id: p for p in profiles if p.twitter_user_id is not None
+        }
+        self.by_twitter_user.update(
+            (twu.pk, twu)
+            for twu in TwitterUser.objects.filter(
+                pk__in=twitter_users - self.by_twitter_user.keys()
+            )
+        )
+
+    def get(self, key: tuple[Optional[int], Optional[int]]) -> Optional[Voter]:
+        user_id, twitter_user_id = key
+
+        if user_id is not None:
+            return self.by_user.get(user_id)
+
+        assert twitter_user_id is not None
+        return self.by_twitter_user.get(twitter_user_id)
+
+
+def cutoffs() -> dict[str, datetime.datetime]:
+    """
+    Return the end of the show before which votes are ignored, for each of
+    the stats that only consider recent votes.
+    """
+
+    now = timezone.now()
+    times = {
+        # who we rank by batting average
+        'active_voters': now - datetime.timedelta(days=7 * 5),
+        # what we work out batting averages and popularity from
+        'six_months': now - datetime.timedelta(days=31 * 6),
+    }
+    shows = Show.at_many(times.values())
+    return {stat: shows[time].end for stat, time in times.items()}
+
+
+def batting_averages(
+    cutoff: datetime.datetime,
+    active_since: datetime.datetime,
+    minimum_weight: float = MINIMUM_WEIGHT,
+) -> list[tuple[Voter, float]]:
+    """
+    Return the batting average since `cutoff` of everyone who has voted since
+    `active_since` and asked for at least `minimum_weight` tracks, best
+    first.
+    """
+
+    ended = Q(show__end__gt=cutoff, show__end__lt=timezone.now())
+    rows = list(
+        VoterShowStats.objects.filter(show__end__gt=min(cutoff, active_since))
+        .values_list('user_id', 'twitter_user_id')
+        .annotate(
+            recent=Count('pk', filter=Q(show__end__gt=active_since)),
+            successes=Sum('successes', filter=ended),
+            weight=Sum('weight', filter=ended),
+        )
+        .order_by()
+    )
+    voters = _Voters((row[0] for row in rows), (row[1] for row in rows))
+    totals: defaultdict[Voter, list[int]] = defaultdict(lambda: [0, 0, 0])
+
+    for user_id, twitter_user_id, recent, successes, weight in rows:
+        voter = voters.get((user_id, twitter_user_id))
+        if voter is None:
+            continue
+
+        total = totals[voter]
+        total[0] += recent
+        total[1] += successes or 0
+        total[2] += weight or 0
+
+    return sorted(
+        (
+            (voter, successes / weight)
+            for voter, (recent, successes, weight) in totals.items()
+            if recent and weight and weight >= minimum_weight and successes
+        ),
+        key=lambda va: va[1],
+        reverse=True,
+    )
+
+
+def streaks(current: Show) -> list[tuple[Voter, int]]:
+    """
+    Return everyone who voted during the last show before `current` that we
+    could vote during, along with how many of those shows in a row they've
+    voted during, longest streak first.
+    """
+
+    votable = list(
+        Show.objects.filter(end__lt=current.end, voting_allowed=True)
+        .order_by('-end')
+        .values_list('pk', flat=True)
+    )
+
+    if not votable:
+        return []
+
+    last_voters = list(
+        VoterShowStats.objects.filter(show_id=votable[0]).values_list(
+            'user_id', 'twitter_user_id'
+        )
+    )
+    voters = _Voters((k[0] for k in last_voters), (k[1] for k in last_voters))
+    streaking = {v for v in map(voters.get, last_voters) if v is not None}
+    counts = dict.fromkeys(streaking, 0)
+
+    for start in range(0, len(votable), STREAK_CHUNK_SIZE):
+        chunk = votable[start : start + STREAK_CHUNK_SIZE]
+        user_ids: set[int] = set()
+        twitter_user_ids: set[int] = set()
+
+        for voter in streaking:
+            twu, prf = voter._twitter_user_and_profile()
+            if prf is not None:
+                user_ids.add(prf.user_id)
+            if twu is not None:
+                twitter_user_ids.add(twu.pk)
+
+        voted: defaultdict[int, set[Voter]] = defaultdict(set)
+
+        for show_id, user_id, twitter_user_id in VoterShowStats.objects.filter(
+            Q(user_id__in=user_ids) | Q(twitter_user_id__in=twitter_user_ids),
+            show_id__in=chunk,
+        ).values_list('show_id', 'user_id', 'twitter_user_id'):
+            voted_by = voters.get((user_id, twitter_user_id))
+            if voted_by is not None:
+                voted[show_id].add(voted_by)
+
+        for show_id in chunk:
+            streaking &= voted[show_id]
+            for voter in streaking:
+                counts[voter] += 1
+
+        if not streaking:
+            break
+
+    return sorted(counts.items(), key=lambda vs: vs[1], reverse=True)
+
+
+def popular_tracks(
+    cutoff: datetime.datetime, count: int = POPULAR_TRACK_COUNT
+) -> list[tuple[Track, int]]:
+    """
+    Return the `count` public tracks with the most votes since `cutoff`,
+    along with how many votes they got.
+    """
+
+    return [
+        (track, track.vote_count)
+        for track in (
+            Track.objects.public()
+            .filter(vote__date__gt=cutoff)
+            .annotate(vote_count=Count('vote'))
+            .order_by('-vote_count', 'pk')[:count]
+        )
+    ]
+
+
+def build_context(current: Show) -> dict[str, Any]:
+    times = cutoffs()
+    return {
+        'streaks': streaks(current),
+        'batting_averages': batting_averages(
+            cutoff=times['six_months'], active_since=times['active_voters']
+        ),
+        'popular_tracks': popular_tracks(times['six_months']),
+    }
+
+
+def _voter_ref(voter: Voter) -> list[JsonEncodable]:
+    return ['profile' if isinstance(voter, Profile) else 'twitter_user', voter.pk]
+
+
+def serialize(context: dict[str, Any]) -> JsonDict:
+    """
+    Turn what :func:`build_context` returns into something we can store in a
+    :class:`.StatsSnapshot`.
+    """
+
+    return {
+        'streaks': [[*_voter_ref(v), value] for v, value in context['streaks']],
+        'batting_averages': [
+            [*_voter_ref(v), value] for v, value in context['batting_averages']
+        ],
+        'popular_tracks': [
+            [track.pk, value] for track, value in context['popular_tracks']
+        ],
+    }
+
+
+def deserialize(payload: dict[str, Any]) -> dict[str, Any]:
+    """
+    Turn a :class:`.StatsSnapshot`'s payload back into what
+    :func:`build_context` returned, leaving out anyone or anything that's
+    been deleted since.
+    """
+
+    refs = payload['streaks'] + payload['batting_averages']
+    voters: dict[str, dict[Any, Voter]] = {
+        'profile': (
+            Profile.objects.select_related('user', 'twitter_user').in_bulk(
+                [pk for kind, pk, value in refs if kind == 'profile']
+            )
+        ),
+        'twitter_user': TwitterUser.objects.in_bulk(
+            [pk for kind, pk, value in refs if kind == 'twitter_user']
+        ),
+    }
+    tracks = Track.objects.in_bulk([pk for pk, value in payload['popular_tracks']])
+
+    def voter_values(entries: list[list[Any]]) -> list[tuple[Voter, Any]]:
+        return [
+            (voters[kind][pk], value)
+            for kind, pk, value in entries
+            if pk in voters[kind]
+        ]
+
+    return {
+        'streaks': voter_values(payload['streaks']),
+        'batting_averages': voter_values(payload['batting_averages']),
+        'popular_tracks': [
+            (tracks[pk], value)
+            for pk, value in payload['popular_tracks']
+            if pk in tracks
+        ],
+    }
+
+
+def _remember(snapshot: StatsSnapshot, context: dict[str, Any]) -> None:
+    cache.set(
+        CACHE_KEY,
+        {'snapshot': snapshot.pk, 'show': snapshot.show_id, 'context': context},
+        settings.STATS_SNAPSHOT_INTERVAL,
+    )
+
+
+def snapshot_is_due() -> bool:
+    """
+    Return :data:`True` if the latest :class:`.StatsSnapshot` is from before
+    the current show, or more than
+    :data:`~nkdsu.settings.STATS_SNAPSHOT_INTERVAL` seconds old.
+    """
+
+    latest = StatsSnapshot.objects.first()
+
+    return (
+        latest is None
+        or latest.show_id != Show.current().pk
+        or timezone.now() - latest.created_at
+        >= datetime.timedelta(seconds=settings.STATS_SNAPSHOT_INTERVAL)
+    )
+
+
+def _take_snapshot(current: Show) -> tuple[StatsSnapshot, dict[str, Any]]:
+    context = build_context(current)
+    snapshot = StatsSnapshot.objects.create(show=current, payload=serialize(context))
+    StatsSnapshot.objects.filter(
+        pk__in=StatsSnapshot.objects.values('pk')[SNAPSHOTS_TO_KEEP:]
+    ).delete()
+    _remember(snapshot, context)
+    return snapshot, context
+
+
+def take_snapshot() -> StatsSnapshot:
+    """
+    Work everything on the stats page out and save it as a new
+    :class:`.StatsSnapshot`, forgetting all but the last few.
+    """
+
+    snapshot, context = _take_snapshot(Show.current())
+    return snapshot
+
+
+def context() -> dict[str, Any]:
+    """
+    Return the stats page's context, as of the latest snapshot. Until
+    ``snapshot_stats`` has taken one for the current show, that'll be one
+    from an earlier show. If there are no snapshots at all, take one.
+    """
+
+    current = Show.current()
+    cached = cache.get(CACHE_KEY)
+
+    if cached is not None and cached['show'] == current.pk:
+        return cached['context']
+
+    snapshot = StatsSnapshot.objects.only('pk', 'show').first()
+
+    if snapshot is None:
+        if not cache.add(LOCK_KEY, True, 60 * 5):
+            # someone else is already taking the first snapshot, so rather
+            # than taking another, just show them what we work out
+            return build_context(current)
+
+        try:
+            snapshot, stats_context = _take_snapshot(current)
+        finally:
+            cache.delete(LOCK_KEY)
+
+        return stats_context
+
+    if cached is not None and cached['snapshot'] == snapshot.pk:
+        return cached['context']
+
+    stats_context = deserialize(snapshot.payload)
+    _remember(snapshot, stats_context)
+    return stats_context
@@ -0,0 +1,264 @@
+import json
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Iterator
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+import musicbrainzngs
+
+from ..background_art import BackgroundArtFetcher, TRACKS_IN_FLIGHT_PER_THREAD
+from ..models import Track
+from ..utils import lastfm, musicbrainz_releases
+
+
+def png(colour: str) -> bytes:
+    output = BytesIO()
+    Image.new('RGBA', (260, 260), colour).save(output, 'PNG')
+    return output.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Enough of last.fm, MusicBrainz and last.fm's image server for us to fetch
+    art from.
+    """
+
+    server: 'StubServer'
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        with self.server.lock:
+            self.server.requests[(url.path, params.get('method'))] += 1
+
+        if url.path == '/2.0/':
+            self.respond('application/json', json.dumps(self.lastfm(params)).encode())
+        elif url.path.startswith('/ws/2/release'):
+            self.respond(
+                'application/xml',
+                b'<?xml version="1.0" encoding="UTF-8"?>'
+                b'<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+                b'<release-list count="0" offset="0"/></metadata>',
+            )
+        elif url.path == '/art/broken.png':
+            self.respond('image/png', b'not a png')
+        elif url.path.startswith('/art/'):
+            self.respond('image/png', png(url.path.split('/')[-1].split('.')[0]))
+        else:
+            self.send_error(404)
+
+    def lastfm(self, params: dict[str, str]) -> dict:
+        if params.get('album') == 'flaky album':
+            return {'error': 29, 'message': 'Rate limit exceeded'}
+
+        if params.get('method') == 'album.getInfo':
+            image = self.server.album_art.get(params['album'])
+            if image is None:
+                return {'error': 6, 'message': 'Album not found'}
+            return {
+                'album': {
+                    'image': [{'#text': f'{self.server.url}/art/{image}', 'size': 'mega'}]
+                }
+            }
+
+        return {'error': 6, 'message': 'not found'}
+
+    def respond(self, content_type: str, body: bytes) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.url = f'http://127.0.0.1:{self.server_address[1]}'
+        self.requests: Counter[tuple[str, str | None]] = Counter()
+        self.lock = threading.Lock()
+        self.album_art = {
+            'red album': 'red.png',
+            'blue album': 'blue.png',
+            'broken album': 'broken.png',
+        }
+
+
+class StubServerTestCase(TestCase):
+    def setUp(self) -> None:
+        self.server = StubServer()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        musicbrainzngs.set_hostname(self.server.url.removeprefix('http://'))
+        self.addCleanup(musicbrainzngs.set_hostname, 'musicbrainz.org')
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+
+        settings = override_settings(
+            LASTFM_API_URL=f'{self.server.url}/2.0/', MEDIA_ROOT=media_root.name
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class BackgroundArtFetcherTest(StubServerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        for i, album in enumerate(
+            ['red album', 'red album', 'red album', 'blue album', 'broken album', 'nothing']
+        ):
+            Track.objects.create(
+                id=f'art{i}',
+                id3_title=f'song {i}',
+                id3_artist='someone',
+                id3_album=album,
+                hidden=False,
+                inudesu=False,
+                added=timezone.now(),
+                revealed=timezone.now(),
+            )
+
+    def fetch(self, **kwargs) -> None:
+        self.results = BackgroundArtFetcher(rate_limits={}, **kwargs).fetch(
+            Track.objects.order_by('pk')
+        )
+
+    def test_art_is_fetched_once_per_source(self) -> None:
+        self.fetch(threads=4, processes=0)
+        self.assertEqual(
+            (self.results.updated, self.results.missing, self.results.failed),
+            (4, 2, 0),
+        )
+
+        for pk in ['art0', 'art1', 'art2', 'art3']:
+            track = Track.objects.get(pk=pk)
+            self.assertTrue(track.background_art)
+            self.assertTrue(track.background_art_source.endswith('.png'))
+            with Image.open(track.background_art.path) as art:
+                self.assertEqual(art.format, 'JPEG')
+
+        for pk in ['art4', 'art5']:
+            self.assertFalse(Track.objects.get(pk=pk).background_art)
+
+        # each album is only looked up and downloaded once, however many
+        # tracks are on it
+        self.assertEqual(self.server.requests[('/2.0/', 'album.getInfo')], 4)
+        self.assertEqual(self.server.requests[('/art/red.png', None)], 1)
+
+    def test_unchanged_art_is_not_fetched_again(self) -> None:
+        self.fetch(threads=2, processes=0)
+        self.server.requests.clear()
+
+        self.fetch(threads=2, processes=0)
+        self.assertEqual((self.results.updated, self.results.unchanged), (0, 4))
+        self.assertEqual(
+            [path for path, method in self.server.requests if path.startswith('/art/')],
+            ['/art/broken.png'],
+        )
+
+        self.server.album_art['blue album'] = 'green.png'
+        self.fetch(threads=2, processes=0)
+        self.assertEqual((self.results.updated, self.results.unchanged), (1, 3))
+        self.assertTrue(
+            Track.objects.get(pk='art3').background_art_source.endswith('/green.png')
+        )
+
+    def test_only_a_few_tracks_are_in_flight_at_once(self) -> None:
+        taken = 0
+        most_in_flight = 0
+
+        def tracks() -> Iterator[Track]:
+            nonlocal taken
+            for track in Track.objects.order_by('pk'):
+                taken += 1
+                yield track
+
+        def progress(done: int) -> None:
+            nonlocal most_in_flight
+            most_in_flight = max(most_in_flight, taken - done + 1)
+
+        results = BackgroundArtFetcher(rate_limits={}, threads=1, processes=0).fetch(
+            tracks(), progress=progress
+        )
+        self.assertEqual(taken, 6)
+        self.assertEqual(results.updated + results.missing, 6)
+        self.assertLessEqual(most_in_flight, TRACKS_IN_FLIGHT_PER_THREAD)
+
+    def test_blurring_in_a_process_pool(self) -> None:
+        self.fetch(threads=2, processes=1)
+        self.assertEqual((self.results.updated, self.results.failed), (4, 0))
+
+
+class CachedLookupTest(StubServerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        settings = override_settings(
+            CACHES={
+                **django_settings.CACHES,
+                'lookups': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': 'lookup-test',
+                },
+            }
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(caches['lookups'].clear)
+
+    def lookups(self) -> int:
+        return self.server.requests[('/2.0/', 'album.getInfo')]
+
+    def test_lookups_are_remembered(self) -> None:
+        found = lastfm(method='album.getInfo', artist='someone', album='red album')
+        self.assertIn('album', found)
+        self.assertEqual(
+            lastfm(method='album.getInfo', artist='someone', album='red album'), found
+        )
+        self.assertEqual(self.lookups(), 1)
+
+    def test_things_that_do_not_exist_are_remembered(self) -> None:
+        for i in range(2):
+            self.assertNotIn(
+                'album', lastfm(method='album.getInfo', artist='someone', album='nope')
+            )
+        self.assertEqual(self.lookups(), 1)
+
+    def test_temporary_errors_are_not_remembered(self) -> None:
+        for i in range(2):
+            self.assertEqual(
+                lastfm(method='album.getInfo', artist='someone', album='flaky album')[
+                    'error'
+                ],
+                29,
+            )
+        self.assertEqual(self.lookups(), 2)
+
+    def test_musicbrainz_searches_are_remembered(self) -> None:
+        for i in range(2):
+            self.assertEqual(musicbrainz_releases(release='nothing'), [])
+        self.assertEqual(
+            sum(
+                count
+                for (path, method), count in self.server.requests.items()
+                if path.startswith('/ws/2/release')
+            ),
+            1,
+        )
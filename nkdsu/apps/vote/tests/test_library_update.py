@@ -1,11 +1,29 @@
+import os
 import plistlib
+import random
+import tempfile
 from collections import namedtuple
+from io import BytesIO
 from typing import Any, Iterable, Optional
+from unittest.mock import patch
 
+from Levenshtein import ratio
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
-from ..models import Track
-from ..update_library import metadata_consistency_checks, update_library
+from .. import update_library as update_library_module
+from ..jobs import run_queued_jobs
+from ..library_plist import iter_library_tracks
+from ..models import Job, Track
+from ..update_library import (
+    SimilarityIndex,
+    discard_library_file,
+    metadata_consistency_checks,
+    plan_library_file,
+    update_library,
+)
 
 
 SINGLE_TRACK_XML = '''
@@ -209,6 +227,14 @@ class LibraryUpdateTest(TestCase):
 
 
 class LibraryUpdateDryRunTest(LibraryUpdateTest):
+    def test_streamed_tracks_match_plistlib(self) -> None:
+        library_xml = self.get_library_xml(DEFAULT_TRACKS)
+
+        self.assertEqual(
+            list(iter_library_tracks(BytesIO(library_xml))),
+            list(plistlib.loads(library_xml)['Tracks'].values()),
+        )
+
     def test_new_track_matching_artist(self) -> None:
         tree = self.library_plus_one_track(
             "Koi Hana (Kaichou wa Maid-sama! Character Song)",
@@ -450,6 +476,34 @@ class LibraryUpdateWetRunTest(LibraryUpdateTest):
         self.assertEqual(db_track.role, "Kaichou wa Maid-sama! Character Song")
         self.assertEqual(db_track.msec, 254000)
 
+    def test_duplicated_tracks(self) -> None:
+        def duplicate(key: int, name: str) -> TrackMeta:
+            return TrackMeta(
+                key,
+                name,
+                "Hanazawa Kana and Kobayashi Yuu",
+                None,
+                "I.R.I.S.",
+                "2021",
+                "254000",
+                "2010-09-02T02:00:00Z",
+                "ADDD70C2D748ECC7",
+            )
+
+        tree = plistlib.loads(
+            self.get_library_xml(
+                DEFAULT_TRACKS
+                + [
+                    duplicate(len(DEFAULT_TRACKS) + 1, "Koi Hana (Some Anime OP)"),
+                    duplicate(len(DEFAULT_TRACKS) + 2, "Koi Hana (Some Anime ED)"),
+                ]
+            )
+        )
+        changes = update_library(tree, dry_run=False)
+
+        self.assertEqual([c['type'] for c in changes], ['new'])
+        self.assertEqual(Track.objects.get(id="ADDD70C2D748ECC7").role, "Some Anime ED")
+
     def test_change_locked_track(self) -> None:
         hex_id = "00555AF6AC71CB70"
         Track.objects.filter(id=hex_id).update(metadata_locked=True)
@@ -458,6 +512,190 @@ class LibraryUpdateWetRunTest(LibraryUpdateTest):
         db_track = Track.objects.get(id=hex_id)
         self.assertEqual(db_track.artist, 'Death in Vegas')
 
+    def test_change_track_updates_derived_metadata(self) -> None:
+        hex_id = "00555AF6AC71CB70"
+        tree = self.library_change_one_track(hex_id, {'artist': "Death in Reno"})
+        update_library(tree, dry_run=False)
+
+        self.assertEqual(
+            [t.pk for t in Track.objects.by_artist('Death in Reno')], [hex_id]
+        )
+        self.assertEqual(Track.objects.by_artist('Death in Vegas'), [])
+
+    def test_missing_tracks_are_hidden(self) -> None:
+        hex_id = "00555AF6AC71CB70"
+        tree = self.library_change_one_track(hex_id, {})
+        del tree['Tracks'][
+            next(k for k, t in tree['Tracks'].items() if t['Persistent ID'] == hex_id)
+        ]
+
+        changes = update_library(tree, dry_run=False)
+
+        self.assertEqual([c['type'] for c in changes], ['hide'])
+        self.assertTrue(Track.objects.get(id=hex_id).hidden)
+        self.assertFalse(Track.objects.get(id="89EE2CEBC58E2CAE").hidden)
+
+
+class LibraryUploadViewTest(LibraryUpdateTest):
+    def setUp(self) -> None:
+        self.client.force_login(
+            get_user_model().objects.create_user(username='staff', is_staff=True)
+        )
+
+    def test_upload_is_kept_on_disk_until_confirmed(self) -> None:
+        library_xml = self.get_library_xml(DEFAULT_TRACKS[:-1])
+        self.client.post(
+            '/vote-admin/upload/',
+            {'library_xml': SimpleUploadedFile('library.xml', library_xml)},
+        )
+
+        library_update = self.client.session['library_update']
+        self.assertEqual(
+            os.path.dirname(library_update['library_path']), settings.JOB_FILE_DIR
+        )
+        with open(library_update['library_path'], 'rb') as library_file:
+            self.assertEqual(library_file.read(), library_xml)
+
+        # the dry run happens in the background, not within the request
+        with patch.object(
+            update_library_module, 'plan_library_update', side_effect=AssertionError
+        ):
+            response = self.client.get('/vote-admin/upload/confirm/')
+        self.assertContains(response, 'Working out what this would change')
+        self.assertNotContains(response, 'confirm=true')
+
+        self.assertEqual(run_queued_jobs(), 1)
+        with patch.object(
+            update_library_module, 'plan_library_update', side_effect=AssertionError
+        ):
+            self.assertContains(
+                self.client.get('/vote-admin/upload/confirm/'), 'Cat&#x27;s Eye'
+            )
+        self.assertFalse(Track.objects.get(id="89EE2CEBC58E2CAE").hidden)
+
+        response = self.client.get('/vote-admin/upload/confirm/?confirm=true')
+        job = Job.objects.get(name='update_library')
+        self.assertRedirects(response, job.get_absolute_url())
+        self.assertNotIn('library_update', self.client.session)
+        self.assertFalse(Track.objects.get(id="89EE2CEBC58E2CAE").hidden)
+
+        self.assertEqual(run_queued_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED, job.message)
+        self.assertTrue(Track.objects.get(id="89EE2CEBC58E2CAE").hidden)
+        self.assertFalse(os.path.exists(library_update['library_path']))
+
+    def test_failed_updates_can_be_tried_again(self) -> None:
+        self.client.post(
+            '/vote-admin/upload/',
+            {
+                'library_xml': SimpleUploadedFile(
+                    'library.xml', self.get_library_xml(DEFAULT_TRACKS[:-1])
+                )
+            },
+        )
+        library_path = self.client.session['library_update']['library_path']
+        run_queued_jobs()
+        self.client.get('/vote-admin/upload/confirm/?confirm=true')
+
+        with patch.object(
+            update_library_module,
+            'apply_library_update',
+            side_effect=RuntimeError('kaboom'),
+        ):
+            run_queued_jobs()
+        failed = Job.objects.get(name='update_library')
+        self.assertEqual(failed.status, Job.FAILED)
+        self.assertTrue(os.path.exists(library_path))
+        self.assertContains(
+            self.client.get(failed.get_absolute_url()),
+            f'/vote-admin/jobs/{failed.pk}/retry/',
+        )
+
+        response = self.client.get(f'/vote-admin/jobs/{failed.pk}/retry/?confirm=true')
+        retried = Job.objects.get(name='update_library', status=Job.QUEUED)
+        self.assertRedirects(response, retried.get_absolute_url())
+        self.assertEqual(retried.arguments, failed.arguments)
+
+        self.assertEqual(run_queued_jobs(), 1)
+        retried.refresh_from_db()
+        self.assertEqual(retried.status, Job.SUCCEEDED, retried.message)
+        self.assertTrue(Track.objects.get(id="89EE2CEBC58E2CAE").hidden)
+        self.assertFalse(os.path.exists(library_path))
+
+    def test_plan_is_worked_out_again_if_tracks_change(self) -> None:
+        self.client.post(
+            '/vote-admin/upload/',
+            {
+                'library_xml': SimpleUploadedFile(
+                    'library.xml', self.get_library_xml(DEFAULT_TRACKS[:-1])
+                )
+            },
+        )
+        run_queued_jobs()
+        Track.objects.filter(id="89EE2CEBC58E2CAE").update(metadata_locked=True)
+
+        self.assertContains(
+            self.client.get('/vote-admin/upload/confirm/'),
+            'Working out what this would change',
+        )
+        self.assertEqual(run_queued_jobs(), 1)
+        self.assertContains(
+            self.client.get('/vote-admin/upload/confirm/'),
+            'metadata is locked',
+        )
+
+    def test_expired_uploads_are_forgotten(self) -> None:
+        self.client.post(
+            '/vote-admin/upload/',
+            {
+                'library_xml': SimpleUploadedFile(
+                    'library.xml', self.get_library_xml(DEFAULT_TRACKS)
+                )
+            },
+        )
+        discard_library_file(self.client.session['library_update']['library_path'])
+
+        self.assertRedirects(
+            self.client.get('/vote-admin/upload/confirm/'), '/vote-admin/upload/'
+        )
+        self.assertNotIn('library_update', self.client.session)
+
+
+class SavedLibraryUpdatePlanTest(LibraryUpdateTest):
+    def setUp(self) -> None:
+        with tempfile.NamedTemporaryFile(suffix='.xml', delete=False) as library_file:
+            library_file.write(self.get_library_xml(DEFAULT_TRACKS[:-1]))
+
+        self.library_path = library_file.name
+        self.addCleanup(discard_library_file, self.library_path)
+
+    def test_plans_are_reused(self) -> None:
+        changes = plan_library_file(self.library_path).changes
+        self.assertEqual([c['type'] for c in changes], ['hide'])
+
+        with patch.object(
+            update_library_module, 'plan_library_update', side_effect=AssertionError
+        ):
+            self.assertEqual(plan_library_file(self.library_path).changes, changes)
+
+    def test_plans_are_not_reused_if_tracks_change(self) -> None:
+        plan_library_file(self.library_path)
+        Track.objects.filter(id="89EE2CEBC58E2CAE").update(metadata_locked=True)
+
+        self.assertEqual(
+            [c['type'] for c in plan_library_file(self.library_path).changes],
+            ['locked'],
+        )
+
+    def test_plans_are_not_reused_for_other_libraries(self) -> None:
+        plan_library_file(self.library_path)
+
+        with open(self.library_path, 'wb') as library_file:
+            library_file.write(self.get_library_xml(DEFAULT_TRACKS))
+
+        self.assertEqual(plan_library_file(self.library_path).changes, [])
+
 
 class MetadataConsistencyCheckTest(TestCase):
     def test_anime_and_role_required_if_inudesu_false(self) -> None:
@@ -655,3 +893,45 @@ class MetadataConsistencyCheckTest(TestCase):
                 },
             ],
         )
+
+
+def closest_by_brute_force(
+    name: str, canonical_names: list[str], reverse: bool
+) -> Optional[str]:
+    if not name or name in canonical_names:
+        return None
+
+    reversed_name = ' '.join(reversed(name.split()))
+    if reverse and reversed_name in canonical_names:
+        return reversed_name
+
+    best_closeness, best_match = 0.7, None
+    for canonical_name in canonical_names:
+        for check_name in (name, reversed_name) if reverse else (name,):
+            closeness = ratio(check_name.lower(), canonical_name.lower())
+            if closeness > best_closeness:
+                best_closeness, best_match = closeness, canonical_name
+
+    return best_match
+
+
+class SimilarityIndexTest(TestCase):
+    def test_matches_brute_force(self) -> None:
+        rng = random.Random(0)
+
+        def word() -> str:
+            return ''.join(rng.choice('abcdeABCDE') for i in range(rng.randint(1, 6)))
+
+        canonical_names = list(
+            {' '.join(word() for i in range(rng.randint(1, 4))) for i in range(300)}
+        )
+        index = SimilarityIndex(canonical_names)
+
+        for i in range(300):
+            name = ' '.join(word() for i in range(rng.randint(1, 4)))
+            for reverse in (False, True):
+                self.assertEqual(
+                    index.closest(name, reverse=reverse),
+                    closest_by_brute_force(name, canonical_names, reverse),
+                    msg=(name, reverse),
+                )
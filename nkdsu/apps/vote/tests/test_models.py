@@ -1,6 +1,8 @@
+from typing import Any
+
 from django.test import TestCase
 
-from ..models import Track
+from ..models import Role, Track
 
 
 class TrackTest(TestCase):
@@ -19,3 +21,73 @@ class TrackTest(TestCase):
             track_with_multiple_roles.play_tweet_content(),
             "Now playing on #usedoken: ‘CAT'S EYE’ (Cat's Eye OP1) - Anri",
         )
+
+    def test_roles_are_stored_when_tracks_are_saved(self) -> None:
+        track = Track.objects.get(id3_album="Cat's Eye")
+
+        self.assertEqual(
+            list(track.trackrole_set.values_list('anime', 'kind', 'specifics')),
+            [("Cat's Eye", 'OP', '1'), ('Gintama', 'Insert Song', 'EP84')],
+        )
+        self.assertEqual(Track.objects.by_anime('Gintama'), [track])
+
+        track.id3_title = "CAT'S EYE (Cat's Eye OP1)"
+        track.save()
+
+        self.assertEqual(
+            list(track.trackrole_set.values_list('full_tag', flat=True)),
+            ["Cat's Eye OP1"],
+        )
+        self.assertEqual(Track.objects.by_anime('Gintama'), [])
+
+    def test_stored_roles_match_parsed_roles(self) -> None:
+        def describe(role: Role) -> tuple[Any, ...]:
+            return (
+                role.full_tag,
+                role.anime,
+                role.full_role,
+                role.caveat,
+                role.kind,
+                role.specifics,
+                role.sortkey(),
+                role.verbose,
+                role.plural,
+            )
+
+        for track in Track.objects.prefetch_related('trackrole_set'):
+            self.assertEqual(
+                [describe(role) for role in track.role_details],
+                [describe(role) for role in Track.objects.get(pk=track.pk).role_details],
+            )
+
+    def test_artists_are_stored_when_tracks_are_saved(self) -> None:
+        track = Track.objects.get(id3_artist='Girls Dead Monster (LiSA Singing)')
+
+        self.assertEqual(
+            list(track.trackartist_set.values_list('role', 'name')),
+            [('artist', 'Girls Dead Monster'), ('artist', 'LiSA Singing')],
+        )
+        self.assertEqual(Track.objects.by_artist('LiSA Singing'), [track])
+
+        track.id3_artist = 'Girls Dead Monster'
+        track.composer = 'Maeda Jun'
+        track.save()
+
+        self.assertEqual(Track.objects.by_artist('LiSA Singing'), [])
+        self.assertEqual(Track.objects.by_composer('Maeda Jun'), [track])
+        self.assertIn('Maeda Jun', Track.all_composers())
+
+    def test_stored_artists_match_parsed_artists(self) -> None:
+        public_tracks = list(Track.objects.public())
+        artists = {a for t in public_tracks for a in t.artist_names()}
+
+        self.assertEqual(Track.all_artists(), artists)
+
+        for artist in artists:
+            self.assertEqual(
+                Track.objects.by_artist(artist),
+                sorted(
+                    (t for t in public_tracks if artist in t.artist_names()),
+                    key=lambda t: t.id3_title,
+                ),
+            )
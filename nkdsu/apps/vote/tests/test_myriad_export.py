@@ -0,0 +1,97 @@
+from typing import Optional
+
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import Track
+from ..myriad_export import PlayoutEntry, update_matched_tracks
+
+
+def entry(
+    media_id: int, title: str, artists: str, has_hook: bool = True
+) -> PlayoutEntry:
+    return PlayoutEntry(
+        item_type='Song',
+        media_id=media_id,
+        title=title,
+        artists=artists,
+        has_hook=has_hook,
+    )
+
+
+class UpdateMatchedTracksTest(TestCase):
+    def setUp(self) -> None:
+        for pk, title, artist, media_id, hidden in [
+            ('withid', 'song', 'someone', 1, False),
+            ('same1', 'same', 'Gamma', None, False),
+            ('same2', 'same', 'Gamma Ray', None, False),
+            ('lonely', 'lonely', 'Delta', None, False),
+            ('hidden', 'hidden', 'Epsilon', None, True),
+            ('swap1', 'swap one', 'Zeta', 20, False),
+            ('swap2', 'swap two', 'Eta', 21, False),
+        ]:
+            self.make_track(pk, title, artist, media_id, hidden)
+
+        self.entries = [
+            entry(1, 'something else', 'someone else'),
+            entry(10, 'same', 'Gamma Ray'),
+            # ambiguous, because both 'same' tracks are by artists whose names
+            # start with 'Gamma'
+            entry(11, 'same', 'Gamma'),
+            entry(12, 'lonely', 'delta'),
+            entry(13, 'hidden', 'Epsilon'),
+            entry(14, 'unknown', 'nobody'),
+            # the two swap tracks end up with each other's media ids
+            entry(99, 'swap one', 'Zeta'),
+            entry(20, 'swap two', 'Eta', has_hook=False),
+            entry(21, 'swap one', 'Zeta'),
+            # this now refers to the second 'same' track
+            entry(10, 'irrelevant', 'irrelevant', has_hook=False),
+        ]
+
+    def make_track(
+        self, pk: str, title: str, artist: str, media_id: Optional[int], hidden: bool
+    ) -> None:
+        Track.objects.create(
+            id=pk,
+            id3_title=title,
+            id3_artist=artist,
+            media_id=media_id,
+            hidden=hidden,
+            inudesu=False,
+            added=timezone.now(),
+            revealed=timezone.now(),
+        )
+
+    def state(self) -> list[tuple[str, Optional[int], bool]]:
+        return list(
+            Track.objects.order_by('pk').values_list('pk', 'media_id', 'has_hook')
+        )
+
+    def test_matches_what_updating_one_at_a_time_would(self) -> None:
+        with transaction.atomic():
+            expected_counts = [0, 0]
+            for e in self.entries:
+                expected_counts[0 if e.update_matched_track() else 1] += 1
+            expected_state = self.state()
+            transaction.set_rollback(True)
+
+        self.assertEqual(expected_counts, [7, 3])
+        self.assertNotEqual(self.state(), expected_state)
+
+        self.assertEqual(update_matched_tracks(self.entries), tuple(expected_counts))
+        self.assertEqual(self.state(), expected_state)
+        self.assertEqual(Track.objects.get(pk='swap1').media_id, 21)
+        self.assertEqual(Track.objects.get(pk='swap2').media_id, 20)
+        self.assertEqual(Track.objects.get(pk='same2').media_id, 10)
+        self.assertFalse(Track.objects.get(pk='same2').has_hook)
+        self.assertIsNone(Track.objects.get(pk='same1').media_id)
+
+    def test_query_count_does_not_depend_on_export_size(self) -> None:
+        entries = self.entries + [
+            entry(1000 + i, f'unknown {i}', 'nobody') for i in range(200)
+        ]
+
+        with self.assertNumQueries(6):
+            self.assertEqual(update_matched_tracks(entries), (7, 203))
@@ -3,7 +3,7 @@ from typing import Optional
 from django.test import TestCase
 
 from ..models import Role
-from ..parsers import parse_artist
+from ..parsers import parse_artist, parse_artist_cache_info
 
 
 PART_EXAMPLES: list[tuple[str, list[tuple[bool, str]]]] = [
@@ -266,6 +266,16 @@ class ArtistParserTests(TestCase):
             else:
                 self.assertFalse(parsed.should_collapse, msg=string)
 
+    def test_parsed_artists_are_cached(self) -> None:
+        string = 'Kisida Kyodan & The Akebosi Rockets feat. someone new'
+        parsed = parse_artist(string)
+        hits = parse_artist_cache_info().hits
+
+        self.assertIs(parse_artist(string), parsed)
+        self.assertIs(parse_artist(string, fail_silently=True), parsed)
+        self.assertEqual(parse_artist_cache_info().hits, hits + 2)
+        self.assertIsInstance(parsed.chunks, tuple)
+
 
 ROLE_EXAMPLES: dict[str, tuple[Optional[str], Optional[str], str, str, str]] = {
     '': (None, None, '', '', ''),
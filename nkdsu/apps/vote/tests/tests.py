@@ -1,11 +1,68 @@
 import datetime
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from time import sleep
+from typing import Any, Optional
+from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from ..models import Play, Show, Track
+from .. import jobs, stats
+from ..anime import (
+    ANIME_DATABASE_PATH,
+    AnimeCatalog,
+    MAX_ANIME_SUGGESTIONS,
+    _alias_index,
+    _index_is_current,
+    anime_relations,
+    build_anime_index,
+    fuzzy_nkdsu_aliases,
+    get_anime,
+    suggest_anime,
+)
+from ..jobs import (
+    claim_job,
+    discard_abandoned_files,
+    enqueue,
+    job,
+    job_file,
+    run_job,
+    run_queued_jobs,
+)
+from ..linkable_artists import linkable_artists
+from ..models import (
+    Job,
+    Play,
+    Profile,
+    Role,
+    Show,
+    StatsSnapshot,
+    Track,
+    TwitterUser,
+    Vote,
+    VoterShowStats,
+)
+from ..parsers import parse_artist
+from ..show_index import show_index
+from ..show_registry import show_registry
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 
 
 def mkutc(*args, **kwargs) -> datetime.datetime:
@@ -94,6 +151,42 @@ class ShowTest(TestCase):
             else:
                 func()
 
+    def test_at_many(self) -> None:
+        first = Show.at(mkutc(2020, 1, 1))
+        times = [
+            first.end + datetime.timedelta(days=days, hours=hours)
+            for days in range(-10, 120, 5)
+            for hours in (0, 13)
+        ]
+
+        shows = Show.at_many(times)
+        self.assertEqual(set(shows), set(times))
+
+        for time, show in shows.items():
+            self.assertEqual(
+                show, Show.objects.filter(end__gt=time).order_by('showtime').first()
+            )
+            self.assertEqual(show, Show.at(time))
+
+    def test_at_many_creates_intervening_shows_at_once(self) -> None:
+        Show.at(mkutc(2020, 1, 1))
+
+        # one to find out we don't have the show we want, one to find the last
+        # show we do have, one to create every show after it, and one to fetch
+        # the show we're looking for
+        with self.assertNumQueries(4):
+            ours = Show.at_many([mkutc(2021, 1, 1)])[mkutc(2021, 1, 1)]
+
+        self.assertEqual(ours.end.date(), datetime.date(2021, 1, 2))
+        self.assertEqual(Show.objects.count(), 53)
+        self.assertEqual(
+            [
+                (show.end - show.showtime, show.showtime.weekday())
+                for show in Show.objects.all()
+            ],
+            [(datetime.timedelta(hours=2), 5)] * 53,
+        )
+
     def test_calling_next_or_prev_on_only_show_returns_none(self) -> None:
         self.assertIs(None, Show.current().next())
         self.assertIs(None, Show.current().prev())
@@ -158,3 +251,966 @@ class PlayTest(TestCase):
         play = Track.objects.all()[0].play()
         play.date = mkutc(2009, 1, 1)
         play.save()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PkCachedTest(TestCase):
+    fixtures = ['vote.json']
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_vote_weight_is_cached_until_its_tracks_change(self) -> None:
+        self.assertEqual(Vote.objects.get(pk=1).weight(), 1)
+
+        vote = Vote.objects.get(pk=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(vote.weight(), 1)
+
+        vote.tracks.add(Track.objects.exclude(vote=vote)[0])
+        self.assertEqual(Vote.objects.get(pk=1).weight(), 2)
+
+    def test_votes_for_is_invalidated_by_new_votes(self) -> None:
+        show = Show.objects.get(pk=78)
+        track = Track.objects.get(pk='0007C3F2760E0541')
+        vote_count = len(track.votes_for(show))
+
+        vote = Vote.objects.create(
+            date=show.end - datetime.timedelta(hours=1), name='someone', kind='email'
+        )
+        vote.tracks.add(track)
+
+        track = Track.objects.get(pk='0007C3F2760E0541')
+        self.assertEqual(len(track.votes_for(show)), vote_count + 1)
+
+    def test_revealed_tracks_reflect_reveals_and_hides(self) -> None:
+        show = Show.objects.get(pk=78)
+        first, second, third = Track.objects.public().order_by('pk')[:3]
+        Track.objects.filter(pk__in=[first.pk, second.pk]).update(
+            revealed=show.end - datetime.timedelta(hours=1)
+        )
+        self.assertEqual(list(show.revealed().order_by('pk')), [first, second])
+
+        # library updates hide tracks without sending any signals
+        Track.objects.filter(pk=first.pk).update(hidden=True)
+        self.assertEqual(list(Show.objects.get(pk=78).revealed()), [second])
+
+        third.revealed = show.end - datetime.timedelta(hours=1)
+        third.save()
+        self.assertEqual(
+            list(Show.objects.get(pk=78).revealed().order_by('pk')), [second, third]
+        )
+
+    def test_prev_is_invalidated_by_new_shows(self) -> None:
+        show = Show.objects.get(pk=77)
+        self.assertIsNone(show.prev())
+
+        earlier = Show.objects.create(
+            showtime=show.showtime - datetime.timedelta(days=7),
+            end=show.end - datetime.timedelta(days=7),
+        )
+        self.assertEqual(Show.objects.get(pk=77).prev(), earlier)
+
+
+class VotingHistoryTestCase(TestCase):
+    """
+    A voter with a local account and a linked Twitter account, who has voted
+    during most of the last six shows.
+    """
+
+    fixtures = ['vote.json']
+
+    def setUp(self) -> None:
+        Show.objects.all().delete()
+        cache.clear()
+        now = timezone.now()
+
+        # a show from before every cutoff that stats care about
+        Show.at(now - datetime.timedelta(days=7 * 30))
+
+        # the six shows before this one, oldest first
+        self.shows = [
+            Show.at(now - datetime.timedelta(days=7 * weeks))
+            for weeks in range(6, 0, -1)
+        ]
+        self.tracks = list(Track.objects.order_by('pk')[:4])
+        self.tweet_ids = iter(range(1, 100))
+
+        self.user = get_user_model().objects.create_user(username='voter')
+        self.twitter_user = TwitterUser.objects.create(
+            screen_name='voter', user_id=1, name='voter', updated=now
+        )
+        Profile.objects.filter(user=self.user).update(twitter_user=self.twitter_user)
+
+        t0, t1, t2, t3 = self.tracks
+        s0, s1, s2, s3, s4, s5 = self.shows
+
+        self.vote(s0, [t0, t1])
+        self.play(s0, t0)
+        self.vote(s1, [t2], twitter=True)
+        self.play(s1, t2)
+        # nothing during s2
+        s3.voting_allowed = False
+        s3.save()
+        self.vote(s4, [t0])
+        self.vote(s5, [t1])
+        self.vote(s5, [t1, t3], twitter=True)
+        self.play(s5, t3)
+
+        # the current show hasn't finished yet, so this shouldn't count
+        self.vote(Show.current(), [t0])
+        self.play(Show.current(), t0)
+
+    def vote(self, show: Show, tracks: list[Track], twitter: bool = False) -> Vote:
+        vote = Vote.objects.create(
+            date=show.showtime - datetime.timedelta(hours=1),
+            **(
+                {'twitter_user': self.twitter_user, 'tweet_id': next(self.tweet_ids)}
+                if twitter
+                else {'user': self.user}
+            ),
+        )
+        vote.tracks.set(tracks)
+        return vote
+
+    def play(self, show: Show, track: Track) -> Play:
+        return Play.objects.create(
+            date=show.showtime + datetime.timedelta(hours=1), track=track
+        )
+
+    def voter(self) -> Profile:
+        return Profile.objects.select_related('twitter_user').get(user=self.user)
+
+
+class VoterShowStatsTest(VotingHistoryTestCase):
+    def assert_stats_are_current(self) -> None:
+        def rows() -> list[tuple]:
+            return list(
+                VoterShowStats.objects.order_by(
+                    'show__end', 'user', 'twitter_user'
+                ).values_list(
+                    'show_id',
+                    'user_id',
+                    'twitter_user_id',
+                    'votes',
+                    'weight',
+                    'successes',
+                )
+            )
+
+        incremental = rows()
+        VoterShowStats.rebuild()
+        self.assertEqual(incremental, rows())
+
+    def assert_batting_average_matches_votes(self) -> None:
+        voter = self.voter()
+        score: float = 0
+        weight: float = 0
+
+        for vote in voter.votes():
+            success = vote.success()
+            if success is not None:
+                score += success * vote.weight()
+                weight += vote.weight()
+
+        self.assertAlmostEqual(voter.all_time_batting_average(), score / weight)
+
+    def test_stats_are_kept_up_to_date(self) -> None:
+        self.assertEqual(
+            list(
+                VoterShowStats.objects.filter(show=self.shows[5])
+                .order_by('user')
+                .values_list('votes', 'weight', 'successes')
+            ),
+            [(1, 2, 1), (1, 1, 0)],
+        )
+        self.assert_stats_are_current()
+
+    def test_batting_average_and_streak(self) -> None:
+        voter = self.voter()
+        self.assertAlmostEqual(voter.all_time_batting_average(), 3 / 7)
+        self.assert_batting_average_matches_votes()
+        self.assertIsNone(voter.all_time_batting_average(minimum_weight=8))
+
+        # s5 and s4; s3 doesn't count, since voting wasn't allowed
+        self.assertEqual(voter.streak(), 2)
+
+        voter = self.voter()
+        with self.assertNumQueries(1):
+            voter._batting_average()
+
+    def test_changes_to_votes_and_plays(self) -> None:
+        t0, t1, t2, t3 = self.tracks
+        s0, s1, s2, s3, s4, s5 = self.shows
+
+        play = Play.objects.get(show=s0, track=t0)
+        play.date = s4.showtime + datetime.timedelta(hours=1)
+        play.save()
+        self.assert_stats_are_current()
+
+        vote = Vote.objects.get(show=s4)
+        vote.date = s2.showtime - datetime.timedelta(hours=1)
+        vote.save()
+        self.assert_stats_are_current()
+        self.assertEqual(self.voter().streak(), 1)
+
+        Vote.objects.get(show=s1).delete()
+        Vote.objects.get(show=s5, user=self.user).tracks.add(t3)
+        t1.vote_set.remove(Vote.objects.get(show=s0))
+        Play.objects.get(show=s5).delete()
+        self.assert_stats_are_current()
+        self.assert_batting_average_matches_votes()
+
+        t0.delete()
+        self.assert_stats_are_current()
+
+    def test_votes_for_no_tracks_keep_a_streak_going(self) -> None:
+        s0, s1, s2, s3, s4, s5 = self.shows
+        Vote.objects.get(show=s4).tracks.clear()
+
+        self.assertEqual(
+            VoterShowStats.objects.filter(show=s4).values_list(
+                'votes', 'weight', 'successes'
+            )[0],
+            (1, 0, 0),
+        )
+        self.assert_stats_are_current()
+        self.assertEqual(self.voter().streak(), 2)
+        self.assertEqual(
+            [(voter.pk, streak) for voter, streak in stats.streaks(Show.current())],
+            [(self.voter().pk, 2)],
+        )
+
+    def test_migrating_away_from_a_track(self) -> None:
+        t0, t1, t2, t3 = self.tracks
+        target = Track.objects.create(
+            id='migration-target',
+            id3_title='somewhere new',
+            id3_artist='someone',
+            hidden=False,
+            inudesu=False,
+            added=timezone.now(),
+            revealed=timezone.now(),
+        )
+
+        call_command('migrate_away_from', t3.pk, target.pk)
+        self.assertEqual(
+            VoterShowStats.objects.get(
+                show=self.shows[5], twitter_user=self.twitter_user
+            ).successes,
+            1,
+        )
+        self.assert_stats_are_current()
+        self.assertEqual(
+            Vote.objects.get(
+                show=self.shows[5], twitter_user=self.twitter_user
+            ).success(),
+            0.5,
+        )
+
+    def final_values(self) -> list[tuple[Optional[int], Optional[float]]]:
+        return list(
+            Vote.objects.filter(user=self.user)
+            .order_by('date')
+            .values_list('final_weight', 'final_success')
+        )
+
+    def test_votes_are_finalized_as_they_change(self) -> None:
+        t0, t1, t2, t3 = self.tracks
+        s0, s1, s2, s3, s4, s5 = self.shows
+
+        self.assertEqual(
+            self.final_values(), [(2, 0.5), (1, 0.0), (1, 0.0), (None, None)]
+        )
+
+        vote = Vote.objects.get(show=s0)
+        with self.assertNumQueries(0):
+            self.assertEqual(vote.success(), 0.5)
+            self.assertEqual(vote.weight(), 2)
+
+        play = Play.objects.get(show=s0, track=t0)
+        play.date = s4.showtime + datetime.timedelta(hours=1)
+        play.save()
+        Vote.objects.get(show=s5, user=self.user).tracks.add(t0)
+
+        vote = Vote.objects.get(show=s0)
+        vote.date = Show.current().showtime - datetime.timedelta(hours=1)
+        vote.save()
+
+        self.assertEqual(
+            self.final_values(), [(1, 1.0), (2, 0.0), (None, None), (None, None)]
+        )
+
+    def test_votes_without_tracks_are_not_finalized(self) -> None:
+        Vote.objects.get(show=self.shows[0]).tracks.clear()
+        self.assertEqual(self.final_values()[0], (None, None))
+
+        call_command('finalize_votes', all=True, verbosity=0)
+        self.assertEqual(self.final_values()[0], (None, None))
+
+    def test_finalize_votes_command(self) -> None:
+        expected = self.final_values()
+        Vote.objects.update(final_weight=None, final_success=None)
+        self.assertIsNone(Vote.objects.get(show=self.shows[0]).final_success)
+
+        call_command('finalize_votes', verbosity=0)
+        self.assertEqual(self.final_values(), expected)
+
+        for vote in Vote.objects.filter(show__in=self.shows):
+            self.assertEqual(vote.final_success, vote._success())
+            self.assertEqual(vote.final_weight, vote._weight())
+
+
+class StatsTest(VotingHistoryTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        t0, t1, t2, t3 = self.tracks
+        s0, s1, s2, s3, s4, s5 = self.shows
+
+        self.busy = self.make_user('busy')
+        self.vote(s5, [t0, t1, t2, t3], user=self.busy)
+        self.tweeter = TwitterUser.objects.create(
+            screen_name='tweeter', user_id=2, name='tweeter', updated=timezone.now()
+        )
+        self.vote(s5, [t2], twitter_user=self.tweeter)
+
+    def make_user(self, username: str) -> Any:
+        return get_user_model().objects.create_user(username=username)
+
+    def vote(
+        self,
+        show: Show,
+        tracks: list[Track],
+        twitter: bool = False,
+        user: Any = None,
+        twitter_user: Optional[TwitterUser] = None,
+    ) -> Vote:
+        if user is None and twitter_user is None:
+            return super().vote(show, tracks, twitter=twitter)
+
+        vote = Vote.objects.create(
+            date=show.showtime - datetime.timedelta(hours=1),
+            user=user,
+            twitter_user=twitter_user,
+            tweet_id=None if twitter_user is None else next(self.tweet_ids),
+        )
+        vote.tracks.set(tracks)
+        return vote
+
+    def test_stats_match_what_voters_say_about_themselves(self) -> None:
+        context = stats.build_context(Show.current())
+
+        self.assertEqual(
+            [(voter.pk, value) for voter, value in context['batting_averages']],
+            [(self.voter().pk, 3 / 7), (self.busy.profile.pk, 1 / 4)],
+        )
+        for voter, value in context['batting_averages']:
+            self.assertEqual(value, voter.batting_average(minimum_weight=4))
+
+        self.assertEqual(
+            {voter: value for voter, value in context['streaks']},
+            {self.voter(): 2, self.busy.profile: 1, self.tweeter: 1},
+        )
+        for voter, value in context['streaks']:
+            self.assertEqual(value, voter.streak())
+
+        cutoff = stats.cutoffs()['six_months']
+        expected = sorted(
+            (
+                (track, track.vote_set.filter(date__gt=cutoff).count())
+                for track in Track.objects.public()
+            ),
+            key=lambda tc: tc[1],
+            reverse=True,
+        )
+        self.assertEqual(
+            [count for track, count in context['popular_tracks']],
+            [count for track, count in expected if count][:10],
+        )
+
+    def test_voters_without_profiles_are_left_out(self) -> None:
+        Profile.objects.filter(user=self.busy).delete()
+        context = stats.build_context(Show.current())
+
+        self.assertEqual(
+            [voter.pk for voter, value in context['batting_averages']],
+            [self.voter().pk],
+        )
+        self.assertEqual(
+            {voter for voter, value in context['streaks']},
+            {self.voter(), self.tweeter},
+        )
+
+    def test_query_count_does_not_depend_on_voter_count(self) -> None:
+        current = Show.current()
+
+        with CaptureQueriesContext(connection) as before:
+            stats.build_context(current)
+
+        for i in range(10):
+            user = self.make_user(f'voter{i}')
+            for show in self.shows[-3:]:
+                self.vote(show, self.tracks[: i % 4 + 1], user=user)
+
+        with CaptureQueriesContext(connection) as after:
+            stats.build_context(current)
+
+        self.assertEqual(len(after), len(before))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_stats_page_is_cached(self) -> None:
+        cache.clear()
+        self.client.force_login(self.make_user('staff'))
+        get_user_model().objects.filter(username='staff').update(is_staff=True)
+
+        self.assertContains(self.client.get('/stats/'), '@busy')
+        self.assertIsNotNone(cache.get(stats.CACHE_KEY))
+
+        with patch.object(stats, 'build_context', side_effect=AssertionError):
+            self.assertContains(self.client.get('/stats/'), '@busy')
+
+            # even once the cache is gone, we still have the snapshot
+            cache.clear()
+            self.assertContains(self.client.get('/stats/'), '@busy')
+
+    def test_snapshots_from_earlier_shows_are_shown_until_replaced(self) -> None:
+        snapshot = StatsSnapshot.objects.create(
+            show=self.shows[-1],
+            payload=stats.serialize(stats.build_context(self.shows[-1])),
+        )
+
+        with patch.object(stats, 'build_context', side_effect=AssertionError):
+            self.assertEqual(stats.context(), stats.deserialize(snapshot.payload))
+        self.assertEqual(StatsSnapshot.objects.count(), 1)
+
+        call_command('snapshot_stats', verbosity=0)
+        self.assertEqual(StatsSnapshot.objects.first().show, Show.current())
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_only_one_visitor_takes_the_first_snapshot(self) -> None:
+        cache.clear()
+        cache.add(stats.LOCK_KEY, True)
+        self.assertEqual(stats.context(), stats.build_context(Show.current()))
+        self.assertFalse(StatsSnapshot.objects.exists())
+
+        cache.delete(stats.LOCK_KEY)
+        stats.context()
+        self.assertEqual(StatsSnapshot.objects.count(), 1)
+        self.assertIsNone(cache.get(stats.LOCK_KEY))
+
+    def test_snapshots_survive_a_round_trip(self) -> None:
+        context = stats.build_context(Show.current())
+        payload = json.loads(json.dumps(stats.serialize(context)))
+        self.assertEqual(stats.deserialize(payload), context)
+
+        self.busy.delete()
+        self.assertNotIn(
+            self.busy.profile,
+            [voter for voter, value in stats.deserialize(payload)['streaks']],
+        )
+
+    def test_snapshots_are_taken_when_due(self) -> None:
+        call_command('snapshot_stats', verbosity=0)
+        self.assertEqual(StatsSnapshot.objects.count(), 1)
+        self.assertEqual(StatsSnapshot.objects.get().show, Show.current())
+
+        call_command('snapshot_stats', verbosity=0)
+        self.assertEqual(StatsSnapshot.objects.count(), 1)
+
+        call_command('snapshot_stats', force=True, verbosity=0)
+        self.assertEqual(StatsSnapshot.objects.count(), 2)
+
+        with override_settings(STATS_SNAPSHOT_INTERVAL=0):
+            call_command('snapshot_stats', verbosity=0)
+        self.assertEqual(StatsSnapshot.objects.count(), 3)
+
+        for i in range(stats.SNAPSHOTS_TO_KEEP):
+            stats.take_snapshot()
+        self.assertEqual(StatsSnapshot.objects.count(), stats.SNAPSHOTS_TO_KEEP)
+
+
+class MemoizeTest(TestCase):
+    fixtures = ['vote.json']
+
+    def test_memoized_methods_only_query_once_per_instance(self) -> None:
+        track = Track.objects.get(pk='0007C3F2760E0541')
+        last_play = track.last_play()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(track.last_play(), last_play)
+
+        # but a fresh instance should not see what the old one remembered
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                Track.objects.get(pk='0007C3F2760E0541').last_play(), last_play
+            )
+
+    def test_saving_forgets_memoized_values(self) -> None:
+        track = Track.objects.get(pk='0007C3F2760E0541')
+        reason = track.ineligible()
+        self.assertNotEqual(reason, 'hidden')
+
+        track.hidden = True
+        self.assertEqual(track.ineligible(), reason)
+
+        track.save()
+        self.assertEqual(track.ineligible(), 'hidden')
+
+    def test_refreshing_forgets_memoized_values(self) -> None:
+        track = Track.objects.get(pk='0007C3F2760E0541')
+        reason = track.ineligible()
+        self.assertNotEqual(reason, 'hidden')
+
+        Track.objects.filter(pk=track.pk).update(hidden=True)
+        self.assertEqual(track.ineligible(), reason)
+
+        track.refresh_from_db()
+        self.assertEqual(track.ineligible(), 'hidden')
+
+
+class ShowRegistryTest(TestCase):
+    fixtures = ['vote.json']
+
+    def test_shows_are_resolved_once_per_registry(self) -> None:
+        with show_registry():
+            current = Show.current()
+
+            with self.assertNumQueries(0):
+                self.assertIs(Show.current(), current)
+                self.assertIs(Show.at(current.showtime), current)
+
+            prev = current.prev()
+            self.assertIsNotNone(prev)
+            assert prev is not None
+
+            with self.assertNumQueries(0):
+                self.assertIs(Show.at(prev.showtime), prev)
+
+            self.assertIs(prev.next(), current)
+
+        self.assertIsNot(Show.current(), current)
+        self.assertEqual(Show.current(), current)
+
+    def test_saving_a_show_clears_the_registry(self) -> None:
+        with show_registry():
+            current = Show.current()
+            current.message = 'hello'
+            current.save()
+            self.assertIsNot(Show.current(), current)
+            self.assertEqual(Show.current().message, 'hello')
+
+
+class ShowIndexTest(TestCase):
+    def setUp(self) -> None:
+        Show.objects.all().delete()
+        self.first = Show.at(mkutc(2020, 1, 1))
+        self.last = Show.at(mkutc(2020, 3, 1))
+
+        # the first lookup after a change goes to the database, so that we
+        # don't rebuild the index for every show we create
+        self.assertIsNone(show_index.at(self.first.showtime))
+
+    def test_lookups_match_the_database(self) -> None:
+        for show in Show.objects.all():
+            for time in (
+                show.showtime - datetime.timedelta(days=3),
+                show.showtime,
+                show.end - datetime.timedelta(microseconds=1),
+            ):
+                self.assertEqual(show_index.at(time), show)
+
+        self.assertIsNone(show_index.at(self.last.end))
+
+    def test_lookups_do_not_query(self) -> None:
+        self.assertEqual(show_index.at(self.first.showtime), self.first)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Show.at(self.first.showtime), self.first)
+            self.assertEqual(Show.at(self.last.showtime), self.last)
+
+    def test_rolled_back_shows_are_forgotten(self) -> None:
+        after_last = self.last.end + datetime.timedelta(days=1)
+
+        try:
+            with transaction.atomic():
+                later = Show.at(after_last)
+                self.assertIsNone(show_index.at(after_last))
+                self.assertEqual(show_index.at(after_last), later)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        self.assertIsNone(show_index.at(after_last))
+        self.assertIsNone(show_index.at(after_last))
+        self.assertEqual(show_index.at(self.last.showtime), self.last)
+
+
+class LinkableArtistsTest(TransactionTestCase):
+    fixtures = ['vote.json']
+
+    def setUp(self) -> None:
+        linkable_artists.invalidate()
+        self.track = Track.objects.get(id3_artist='Anri')
+
+    def test_artists_are_resolved_in_one_query(self) -> None:
+        names = {'Anri', 'FUNKIST', 'LiSA Singing', 'nobody'}
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                linkable_artists.resolve(names), {'Anri', 'FUNKIST', 'LiSA Singing'}
+            )
+            self.assertEqual(
+                [chunk.worth_linking_to for chunk in parse_artist('Anri x nobody')],
+                [True, False, False],
+            )
+
+    def test_hidden_artists_are_not_linkable(self) -> None:
+        self.assertIn('Anri', linkable_artists)
+
+        self.track.hidden = True
+        self.track.save()
+        self.assertNotIn('Anri', linkable_artists)
+
+    def test_uncommitted_changes_are_only_visible_locally(self) -> None:
+        self.assertIn('Anri', linkable_artists)
+
+        try:
+            with transaction.atomic():
+                self.track.hidden = True
+                self.track.save()
+                self.assertNotIn('Anri', linkable_artists)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        self.assertIn('Anri', linkable_artists)
+
+
+class AnimeIndexTest(TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.source = os.path.join(directory, 'anime-offline-database.json')
+        self.index = os.path.join(directory, 'anime-index.sqlite3')
+        shutil.copy(ANIME_DATABASE_PATH, self.source)
+
+    def test_index_maps_every_title(self) -> None:
+        build_anime_index(self.source, self.index)
+
+        with sqlite3.connect(self.index) as db:
+            titles = dict(db.execute('SELECT title, anime_id FROM title'))
+
+        self.assertIn('The Demon Girl Next Door', titles)
+        self.assertEqual(titles['The Demon Girl Next Door'], titles['Machikado Mazoku'])
+        self.assertEqual(
+            get_anime('The Demon Girl Next Door'), get_anime('Machikado Mazoku')
+        )
+
+    def test_index_is_rebuilt_when_the_source_changes(self) -> None:
+        self.assertFalse(_index_is_current(self.source, self.index))
+        build_anime_index(self.source, self.index)
+        self.assertTrue(_index_is_current(self.source, self.index))
+
+        stat = os.stat(self.source)
+        os.utime(self.source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertFalse(_index_is_current(self.source, self.index))
+
+    def test_catalog_matches_index(self) -> None:
+        build_anime_index(self.source, self.index)
+        catalog = AnimeCatalog.load(self.index)
+
+        with sqlite3.connect(self.index) as db:
+            rows = db.execute(
+                'SELECT title.title, anime.data FROM title '
+                'JOIN anime ON anime.id = title.anime_id'
+            ).fetchall()
+
+        self.assertTrue(rows)
+
+        for title, data in rows:
+            self.assertEqual(catalog.data_for(title), data)
+
+        self.assertIsNone(catalog.data_for('shamiko'))
+        self.assertIsNone(catalog.data_for(''))
+
+
+class AnimeSuggestionTest(TestCase):
+    fixtures = ['vote.json']
+
+    def test_suggestions_match_a_linear_scan(self) -> None:
+        aliases = fuzzy_nkdsu_aliases()
+        self.assertTrue(aliases)
+
+        queries = {'', 'x', 'nothing like any anime'} | {
+            alias[start:end]
+            for alias in aliases
+            for start, end in ((0, 2), (1, 4), (0, None), (-3, None))
+        }
+
+        for query in queries:
+            expected = {title for alias, title in aliases.items() if query in alias}
+            if len(expected) > MAX_ANIME_SUGGESTIONS:
+                expected = set()
+            self.assertEqual(suggest_anime(query.upper()), expected, msg=query)
+
+    def test_index_is_rebuilt_when_anime_change(self) -> None:
+        index = _alias_index()
+        self.assertIs(_alias_index(), index)
+
+        track = Track.objects.get(id3_album="Cat's Eye")
+        track.id3_title = 'CAT\'S EYE (Machikado Mazoku OP1)'
+        track.save()
+
+        self.assertIsNot(_alias_index(), index)
+        self.assertEqual(suggest_anime('demon girl'), {'Machikado Mazoku'})
+
+
+class AnimeRelationsTest(TestCase):
+    fixtures = ['vote.json']
+
+    def setUp(self) -> None:
+        for pk, title in (('mzk1', 'Machikado Mazoku'), ('mzk2', 'Machikado Mazoku 2')):
+            Track.objects.create(
+                id=pk,
+                id3_title=f'song ({title} OP1)',
+                id3_artist='someone',
+                hidden=False,
+                inudesu=False,
+                added=timezone.now(),
+                revealed=timezone.now(),
+            )
+
+    def test_relations_match_a_linear_scan(self) -> None:
+        titles = Track.all_anime_titles()
+
+        for title in titles:
+            role = Role(f'{title} OP1')
+            self.assertEqual(
+                sorted(role.related_anime()),
+                sorted(a for a in titles if a != title and role.anime_is_related(a)),
+            )
+
+            anime = get_anime(title)
+            if anime is None:
+                continue
+
+            related_titles = {
+                a
+                for a in titles
+                if (related := get_anime(a)) is not None
+                and any(source in anime.relations for source in related.sources)
+            }
+            self.assertEqual(set(anime.related_anime()), related_titles)
+
+        self.assertIn(
+            'Machikado Mazoku 2',
+            Role('Machikado Mazoku OP1').related_anime(),
+        )
+
+    def test_relations_are_rebuilt_when_anime_change(self) -> None:
+        relations = anime_relations()
+        self.assertIs(anime_relations(), relations)
+
+        Track.objects.get(id='mzk2').delete()
+        self.assertIsNot(anime_relations(), relations)
+        self.assertEqual(Role('Machikado Mazoku OP1').related_anime(), [])
+
+
+class JobTest(TestCase):
+    fixtures = ['vote.json']
+
+    def setUp(self) -> None:
+        registry = patch.dict(jobs._jobs)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+        @job('count')
+        def count(job: Job, up_to: int) -> str:
+            for i in range(1, up_to + 1):
+                job.report_progress(i, up_to)
+            return f'counted to {up_to}'
+
+        @job('explode')
+        def explode(job: Job) -> None:
+            raise RuntimeError('kaboom')
+
+        @job('read')
+        def read(job: Job, path: str) -> str:
+            with open(path) as f:
+                return f.read()
+
+        self.staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True
+        )
+
+    def test_unknown_jobs_cannot_be_queued(self) -> None:
+        with self.assertRaises(ValueError):
+            enqueue('nonexistent')
+
+    def test_jobs_are_claimed_oldest_first_and_only_once(self) -> None:
+        first = enqueue('count', up_to=1)
+        second = enqueue('count', up_to=2)
+
+        self.assertEqual(claim_job(), first)
+        self.assertEqual(claim_job(), second)
+        self.assertIsNone(claim_job())
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, Job.RUNNING)
+        self.assertIsNotNone(first.started_at)
+
+    def test_stale_jobs_are_queued_again(self) -> None:
+        abandoned = enqueue('count', up_to=2)
+        self.assertEqual(claim_job(), abandoned)
+        abandoned.refresh_from_db()
+        abandoned.report_progress(1, 2)
+
+        self.assertIsNone(claim_job())
+
+        Job.objects.filter(pk=abandoned.pk).update(
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=2)
+        )
+        self.assertEqual(claim_job(), abandoned)
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.progress, 0)
+
+        run_job(abandoned)
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.status, Job.SUCCEEDED)
+
+    def test_runs_that_were_queued_again_do_not_record_results(self) -> None:
+        enqueue('explode')
+        first_run = claim_job()
+        assert first_run is not None
+        Job.objects.filter(pk=first_run.pk).update(
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=2)
+        )
+        second_run = claim_job()
+        assert second_run is not None
+
+        run_job(first_run)
+        second_run.refresh_from_db()
+        self.assertEqual(second_run.status, Job.RUNNING)
+        self.assertEqual(second_run.message, '')
+
+        run_job(second_run)
+        second_run.refresh_from_db()
+        self.assertEqual(second_run.status, Job.FAILED)
+
+    def test_progress_and_results_are_recorded(self) -> None:
+        queued = enqueue('count', created_by=self.staff, up_to=4)
+        run_job(claim_job())
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.SUCCEEDED)
+        self.assertEqual(queued.message, 'counted to 4')
+        self.assertEqual(queued.percent_complete(), 100)
+        self.assertEqual(queued.created_by, self.staff)
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_failures_are_recorded(self) -> None:
+        queued = enqueue('explode')
+        self.assertEqual(run_queued_jobs(), 1)
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertIn('RuntimeError: kaboom', queued.message)
+
+    def test_status_pages(self) -> None:
+        queued = enqueue('count', up_to=3)
+        self.client.force_login(self.staff)
+
+        self.assertContains(self.client.get('/vote-admin/jobs/'), 'count')
+        self.assertContains(self.client.get(queued.get_absolute_url()), 'queued')
+
+        run_queued_jobs()
+        self.assertContains(self.client.get(queued.get_absolute_url()), 'counted to 3')
+
+    def test_abandoned_files_are_discarded(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(JOB_FILE_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        def make_file(age: float) -> str:
+            with job_file(prefix='test-', suffix='.txt') as f:
+                f.write(b'hello')
+            os.utime(f.name, (0, timezone.now().timestamp() - age))
+            return f.name
+
+        waiting = make_file(age=60 * 60 * 48)
+        waiting_plan = f'{waiting}.plan'
+        shutil.copy(waiting, waiting_plan)
+        os.utime(waiting_plan, (0, 0))
+        enqueue('read', path=waiting)
+        abandoned = make_file(age=60 * 60 * 48)
+        recent = make_file(age=60)
+
+        self.assertEqual(discard_abandoned_files(), 1)
+        self.assertFalse(os.path.exists(abandoned))
+        for path in (waiting, waiting_plan, recent):
+            self.assertTrue(os.path.exists(path))
+
+        run_queued_jobs()
+        self.assertEqual(discard_abandoned_files(), 2)
+        self.assertEqual(os.listdir(directory), [os.path.basename(recent)])
+
+    def test_myriad_exports_are_imported_in_the_background(self) -> None:
+        track = Track.objects.order_by('pk').first()
+        assert track is not None
+        Track.objects.filter(pk=track.pk).update(media_id=1234, has_hook=False)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(
+            '/vote-admin/upload-myriad/',
+            {
+                'myriad_csv': SimpleUploadedFile(
+                    'export.csv',
+                    b'ItemType,MediaId,Title,Artists,HasHook\r\n'
+                    b'Song,1234,whatever,whoever,YES\r\n'
+                    b'Song,5678,nothing,nobody,\r\n',
+                ),
+            },
+        )
+        queued = Job.objects.get()
+        self.assertRedirects(response, queued.get_absolute_url())
+        self.assertFalse(Track.objects.get(pk=track.pk).has_hook)
+
+        run_queued_jobs()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.SUCCEEDED, queued.message)
+        self.assertIn(
+            '1 entries matched to tracks; 1 entries unmatched', queued.message
+        )
+        self.assertTrue(Track.objects.get(pk=track.pk).has_hook)
+        self.assertEqual((queued.progress, queued.total), (2, 2))
+
+
+class JobHeartbeatTest(TransactionTestCase):
+    def setUp(self) -> None:
+        registry = patch.dict(jobs._jobs)
+        registry.start()
+        self.addCleanup(registry.stop)
+        interval = patch.object(jobs, 'HEARTBEAT_INTERVAL', 0.01)
+        interval.start()
+        self.addCleanup(interval.stop)
+
+        @job('wait_for_heartbeat')
+        def wait_for_heartbeat(job: Job) -> str:
+            # never reports progress, but should be kept alive regardless
+            for attempt in range(500):
+                if Job.objects.filter(
+                    pk=job.pk, heartbeat_at__gt=job.heartbeat_at
+                ).exists():
+                    return 'still alive'
+                sleep(0.01)
+            return 'no heartbeat'
+
+    def test_running_jobs_keep_their_heartbeat_going(self) -> None:
+        queued = enqueue('wait_for_heartbeat')
+        run_queued_jobs()
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.SUCCEEDED, queued.message)
+        self.assertEqual(queued.message, 'still alive')
@@ -1,12 +1,28 @@
 #!/usr/bin/env python
 
-from typing import Any, Iterable, Literal, NotRequired, Optional, TypedDict
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Iterable,
+    Iterator,
+    Literal,
+    NotRequired,
+    Optional,
+    TypedDict,
+)
 
 from Levenshtein import ratio
+from django.db import transaction
 from django.utils.timezone import get_default_timezone, make_aware
 from sly.lex import LexError
 
+from .library_plist import iter_library_tracks
+from .linkable_artists import linkable_artists
 from .models import Track
+from .utils import clear_memoized, invalidate_pk_cached
 
 
 UpdateFieldName = Literal[
@@ -22,34 +38,104 @@ UpdateFieldName = Literal[
 ]
 
 
-def check_closeness_against_list(
-    name, canonical_names: Iterable[str], reverse: bool = False
-) -> Optional[str]:
-    best_closeness, best_match = 0.7, None
+#: how similar two names must be for us to suspect that one is a typo
+CLOSENESS_THRESHOLD = 0.7
+
+
+class SimilarityIndex:
+    """
+    A collection of canonical names that can be efficiently searched for the
+    one most similar to some other name.
+
+    Names are lowercased once, up front, and bucketed by length. Two strings
+    whose lengths are too different can't possibly be similar enough to
+    matter, so we only ever compare against names of plausible lengths.
+    """
+
+    def __init__(self, canonical_names: Iterable[str]) -> None:
+        self.names = list(canonical_names)
+        self.name_set = set(self.names)
+        self.lowered = [name.lower() for name in self.names]
+        self.by_length: dict[int, list[int]] = {}
+
+        for i, lowered in enumerate(self.lowered):
+            self.by_length.setdefault(len(lowered), []).append(i)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.name_set
+
+    def _candidates(self, lowered_names: Iterable[str]) -> list[int]:
+        """
+        Return the indices of the names we might be similar enough to any of
+        `lowered_names`, in their original order.
+
+        :func:`.ratio` can be no higher than ``2 * shorter / (shorter +
+        longer)``, so anything longer than 13/7ths or shorter than 7/13ths of
+        a name can't pass :data:`CLOSENESS_THRESHOLD`.
+        """
+
+        candidates: set[int] = set()
+
+        for lowered in lowered_names:
+            length = len(lowered)
+            for candidate_length in range(
+                (length * 7) // 13, -((-length * 13) // 7) + 1
+            ):
+                candidates.update(self.by_length.get(candidate_length, ()))
+
+        return sorted(candidates)
+
+    def closest(self, name: str, reverse: bool = False) -> Optional[str]:
+        """
+        Return the canonical name that `name` is most similar to, if it's
+        similar enough to any of them and not one of them already. If
+        `reverse` is set, also consider `name` with its words reversed.
+        """
+
+        best_closeness, best_match = CLOSENESS_THRESHOLD, None
+
+        if not name:
+            return None
 
-    if name:
         names_to_check: tuple[str, ...]
 
-        if name in canonical_names:
+        if name in self.name_set:
             return None
 
         reversed_name = ' '.join(reversed(name.split()))
         if reverse:
-            if reversed_name in canonical_names:
+            if reversed_name in self.name_set:
                 return reversed_name
             else:
-                names_to_check = (name, reversed_name)
+                names_to_check = (name.lower(), reversed_name.lower())
         else:
-            names_to_check = (name,)
+            names_to_check = (name.lower(),)
 
-        for canonical_name in canonical_names:
+        for i in self._candidates(names_to_check):
             for check_name in names_to_check:
-                closeness = ratio(str(check_name.lower()), str(canonical_name.lower()))
+                closeness = ratio(
+                    check_name, self.lowered[i], score_cutoff=best_closeness
+                )
                 if closeness > best_closeness:
                     best_closeness = closeness
-                    best_match = canonical_name
+                    best_match = self.names[i]
+
+        return best_match
 
-    return best_match
+
+def similarity_index(canonical_names: Iterable[str]) -> SimilarityIndex:
+    if isinstance(canonical_names, SimilarityIndex):
+        return canonical_names
+    return SimilarityIndex(canonical_names)
+
+
+def check_closeness_against_list(
+    name, canonical_names: Iterable[str], reverse: bool = False
+) -> Optional[str]:
+    return similarity_index(canonical_names).closest(name, reverse=reverse)
 
 
 class MetadataWarning(TypedDict):
@@ -80,9 +166,10 @@ def check_artist_consistency(
     field: UpdateFieldName,
 ) -> list[MetadataWarning]:
     warnings: list[MetadataWarning] = []
+    artist_index = similarity_index(all_artists)
 
     for artist in track_artists:
-        match = check_closeness_against_list(artist, all_artists, reverse=True)
+        match = artist_index.closest(artist, reverse=True)
         if match:
             warnings.append(
                 {
@@ -117,8 +204,10 @@ def metadata_consistency_checks(
     if not track_roles and not db_track.inudesu:
         warnings.append({'field': 'role', 'message': 'field is missing'})
 
+    anime_index = similarity_index(all_anime_titles)
+
     for track_anime in track_animes:
-        match = check_closeness_against_list(track_anime, all_anime_titles)
+        match = anime_index.closest(track_anime)
         if match:
             warnings.append(
                 {
@@ -160,30 +249,73 @@ def metadata_consistency_checks(
     return warnings
 
 
-def update_library(
-    tree, dry_run: bool = False, inudesu: bool = False
-) -> list[MetadataChange]:
-    changes: list[MetadataChange] = []
-    alltracks = Track.objects.filter(inudesu=inudesu)
-    all_anime_titles = Track.all_anime_titles()
-    all_artists = Track.all_artists()
-    all_composers = Track.all_composers()
-    tracks_kept = []
-    for tid in tree['Tracks']:
+#: the fields of a :class:`.Track` that a library update can change
+LIBRARY_FIELDS = [
+    'id3_title',
+    'id3_artist',
+    'id3_album',
+    'msec',
+    'composer',
+    'year',
+    'added',
+    'inudesu',
+]
+
+#: how many tracks to write to the database at a time
+BATCH_SIZE = 500
+
+
+@dataclass
+class LibraryUpdatePlan:
+    """
+    Everything :func:`update_library` has worked out it would do, and the
+    report it would give about it.
+    """
+
+    changes: list[MetadataChange] = field(default_factory=list)
+    to_create: list[Track] = field(default_factory=list)
+    to_update: list[Track] = field(default_factory=list)
+    to_hide: list[Track] = field(default_factory=list)
+
+
+def plan_library_update(
+    tracks: Iterable[dict[str, Any]], inudesu: bool = False
+) -> LibraryUpdatePlan:
+    """
+    Compare `tracks` (the track dicts from an iTunes library, like the ones
+    :func:`.iter_library_tracks` yields) with the tracks in the database,
+    without changing anything.
+
+    Every track is loaded in a single query and compared in memory, so this
+    takes a roughly constant number of queries however big the library is.
+    """
+
+    plan = LibraryUpdatePlan()
+    existing_tracks: dict[str, Track] = Track.objects.in_bulk()
+    all_anime_titles = SimilarityIndex(Track.all_anime_titles())
+    all_artists = SimilarityIndex(Track.all_artists())
+    all_composers = SimilarityIndex(Track.all_composers())
+    kept_ids: set[str] = set()
+
+    # libraries can list the same track more than once, and we insert new
+    # tracks in bulk, so only keep the last of each, which is the one that
+    # would have won when we saved them one at a time
+    deduplicated = {t['Persistent ID']: t for t in tracks}
+
+    for t in deduplicated.values():
         changed = False
         new = False
         warnings: list[MetadataWarning] = []
         field_alterations: list[FieldAlteration] = []
 
-        t = tree['Tracks'][tid]
         added = make_aware(t['Date Added'], get_default_timezone())
 
         if 'Album' not in t:
             t['Album'] = ''  # to prevent future KeyErrors
 
-        try:
-            db_track = Track.objects.get(id=t['Persistent ID'])
-        except Track.DoesNotExist:
+        db_track = existing_tracks.get(t['Persistent ID'])
+
+        if db_track is None:
             # we need to make a new track
             new = True
             db_track = Track()
@@ -221,11 +353,11 @@ def update_library(
                     if db_dict[k] != track_dict[k]
                 ]
 
-            for field, value in track_dict.items():
+            for field_name, value in track_dict.items():
                 if isinstance(value, str) and (value.strip() != value):
                     warnings.append(
                         {
-                            'field': field,
+                            'field': field_name,
                             'message': 'leading or trailing whitespace',
                         }
                     )
@@ -255,7 +387,7 @@ def update_library(
             else:
                 db_track.hidden = False
 
-            changes.append(
+            plan.changes.append(
                 {
                     'type': 'new',
                     'item': str(db_track),
@@ -263,7 +395,7 @@ def update_library(
             )
 
         if changed or warnings:
-            changes.append(
+            plan.changes.append(
                 {
                     'type': 'locked' if db_track.metadata_locked else 'change',
                     'item': str(db_track),
@@ -272,32 +404,208 @@ def update_library(
                 }
             )
 
-        if (not dry_run) and (new or changed) and (not db_track.metadata_locked):
-            db_track.save()
+        if (new or changed) and (not db_track.metadata_locked):
+            (plan.to_create if new else plan.to_update).append(db_track)
 
-        tracks_kept.append(db_track)
+        kept_ids.add(db_track.pk)
+
+    for track in existing_tracks.values():
+        if (
+            track.inudesu != inudesu
+            or track.pk in kept_ids
+            or track.hidden
+            or track.archived
+        ):
+            continue
 
-    for track in [
-        tr
-        for tr in alltracks
-        if tr not in tracks_kept and not tr.hidden and not tr.archived
-    ]:
         if not track.metadata_locked:
-            changes.append(
+            plan.changes.append(
                 {
                     'type': 'hide',
                     'item': str(track),
                 }
             )
-            if not dry_run:
-                track.hidden = True
-                track.save()
+            track.hidden = True
+            plan.to_hide.append(track)
         else:
-            changes.append(
+            plan.changes.append(
                 {
                     'type': 'locked',
                     'item': str(track),
                 }
             )
 
-    return changes
+    return plan
+
+
+def apply_library_update(plan: LibraryUpdatePlan) -> None:
+    """
+    Write the changes in `plan` to the database, in batches, in a single
+    transaction.
+
+    :meth:`~django.db.models.query.QuerySet.bulk_create` and
+    :meth:`~django.db.models.query.QuerySet.bulk_update` don't call
+    :meth:`.Track.save` or send any signals, so we do what they would have
+    done ourselves.
+    """
+
+    changed_tracks = plan.to_create + plan.to_update
+
+    for track in changed_tracks + plan.to_hide:
+        # uniqueness and constraints are checked by the database, which is
+        # much quicker than asking about every track individually
+        track.full_clean(validate_unique=False, validate_constraints=False)
+
+    with transaction.atomic():
+        Track.objects.bulk_create(plan.to_create, batch_size=BATCH_SIZE)
+        Track.objects.bulk_update(plan.to_update, LIBRARY_FIELDS, batch_size=BATCH_SIZE)
+        Track.objects.bulk_update(plan.to_hide, ['hidden'], batch_size=BATCH_SIZE)
+        Track.sync_metadata_in_bulk(changed_tracks)
+
+        invalidate_pk_cached(
+            Track, *(track.pk for track in changed_tracks + plan.to_hide)
+        )
+        linkable_artists.tracks_changed()
+
+    for track in changed_tracks + plan.to_hide:
+        clear_memoized(track)
+
+
+def library_fingerprint() -> str:
+    """
+    Return a digest of everything about the tracks in the database that
+    :func:`plan_library_update` looks at, so that we can tell whether a plan
+    it made earlier is still the plan it would make now.
+    """
+
+    digest = hashlib.sha256()
+
+    for row in (
+        Track.objects.order_by('pk')
+        .values_list('pk', *LIBRARY_FIELDS, 'hidden', 'archived', 'metadata_locked')
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        digest.update(repr(row).encode())
+
+    return digest.hexdigest()
+
+
+@dataclass
+class SavedLibraryUpdatePlan:
+    """
+    A :class:`LibraryUpdatePlan`, along with what it was planned from.
+    """
+
+    file_digest: str
+    inudesu: bool
+    fingerprint: str
+    plan: LibraryUpdatePlan
+
+
+def _saved_plan_path(library_path: str) -> str:
+    return f'{library_path}.plan'
+
+
+def _plan_signature(library_path: str) -> tuple[str, str]:
+    with open(library_path, 'rb') as library_file:
+        file_digest = hashlib.file_digest(library_file, 'sha256').hexdigest()
+
+    return file_digest, library_fingerprint()
+
+
+def _load_saved_plan(
+    library_path: str, inudesu: bool, file_digest: str, fingerprint: str
+) -> Optional[LibraryUpdatePlan]:
+    try:
+        with open(_saved_plan_path(library_path), 'rb') as saved_plan_file:
+            saved = pickle.load(saved_plan_file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+    if (
+        isinstance(saved, SavedLibraryUpdatePlan)
+        and saved.file_digest == file_digest
+        and saved.inudesu == inudesu
+        and saved.fingerprint == fingerprint
+    ):
+        return saved.plan
+
+    return None
+
+
+def saved_library_plan(
+    library_path: str, inudesu: bool = False
+) -> Optional[LibraryUpdatePlan]:
+    """
+    Return the plan that :func:`plan_library_file` saved for the iTunes
+    library at `library_path`, if it's still the plan it would make now, or
+    :data:`None` if there isn't one. This never works out a plan itself.
+    """
+
+    return _load_saved_plan(library_path, inudesu, *_plan_signature(library_path))
+
+
+def plan_library_file(library_path: str, inudesu: bool = False) -> LibraryUpdatePlan:
+    """
+    Plan an update from the iTunes library at `library_path`.
+
+    The plan is saved alongside the library, and reused for as long as
+    neither the library nor the tracks in the database change, so that
+    confirming an update we've already shown a dry run of doesn't mean
+    working it all out again.
+    """
+
+    file_digest, fingerprint = _plan_signature(library_path)
+    saved = _load_saved_plan(library_path, inudesu, file_digest, fingerprint)
+
+    if saved is not None:
+        return saved
+
+    with open(library_path, 'rb') as library_file:
+        plan = plan_library_update(iter_library_tracks(library_file), inudesu=inudesu)
+
+    with open(_saved_plan_path(library_path), 'wb') as saved_plan_file:
+        pickle.dump(
+            SavedLibraryUpdatePlan(
+                file_digest=file_digest,
+                inudesu=inudesu,
+                fingerprint=fingerprint,
+                plan=plan,
+            ),
+            saved_plan_file,
+        )
+
+    return plan
+
+
+def update_library_file(
+    library_path: str, dry_run: bool = False, inudesu: bool = False
+) -> list[MetadataChange]:
+    with transaction.atomic():
+        plan = plan_library_file(library_path, inudesu=inudesu)
+
+        if not dry_run:
+            apply_library_update(plan)
+
+    return plan.changes
+
+
+def discard_library_file(library_path: str) -> None:
+    """
+    Delete the iTunes library at `library_path`, and any plan saved for it.
+    """
+
+    for path in (library_path, _saved_plan_path(library_path)):
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def update_library(
+    tree, dry_run: bool = False, inudesu: bool = False
+) -> list[MetadataChange]:
+    plan = plan_library_update(tree['Tracks'].values(), inudesu=inudesu)
+
+    if not dry_run:
+        apply_library_update(plan)
+
+    return plan.changes
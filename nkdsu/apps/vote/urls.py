@@ -61,6 +61,11 @@ admin_patterns = [
     ),
     url(r'^inudesu/$', admin.InuDesuTracks.as_view(), name='inudesu'),
     url(r'^artless/$', admin.ArtlessTracks.as_view(), name='artless'),
+    url(
+        r'^update-background-art/$',
+        admin.UpdateBackgroundArt.as_view(),
+        name='update_background_art',
+    ),
     url(r'^shortlist/(?P<pk>.+)/$', admin.MakeShortlist.as_view(), name='shortlist'),
     url(
         r'^shortlist-order/$',
@@ -105,6 +110,9 @@ admin_patterns = [
         admin.MigrateAwayFrom.as_view(),
         name='migrate_away_from',
     ),
+    url(r'^jobs/$', admin.JobList.as_view(), name='jobs'),
+    url(r'^jobs/(?P<pk>\d+)/$', admin.JobDetail.as_view(), name='job'),
+    url(r'^jobs/(?P<pk>\d+)/retry/$', admin.RetryJob.as_view(), name='retry_job'),
     url(r'^throw-500/$', admin.Throw500.as_view(), name='throw_500'),
 ]
 
@@ -4,7 +4,11 @@ import logging
 import re
 import string
 from dataclasses import dataclass
+from functools import update_wrapper, wraps
+from hashlib import md5
+from itertools import chain
 from os import environ
+from types import MethodType
 from typing import (
     Any,
     Callable,
@@ -16,15 +20,19 @@ from typing import (
     cast,
 )
 from urllib.parse import urlencode
+from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Model
 from django.urls import reverse
 import musicbrainzngs
 from mypy_extensions import KwArg, VarArg
-import requests
+
+from . import external_lookups
+from .external_lookups import cached_lookup
 
 if TYPE_CHECKING:
     from .models import Profile, Show, Track
@@ -195,17 +203,82 @@ def split_query_into_keywords(query: str) -> list[str]:
     return keywords
 
 
+_MISSING = object()
+
 T = TypeVar('T')
 C = TypeVar('C', bound=Callable[[VarArg(Any), KwArg(Any)], Any])
 
 
+MEMOIZED_ATTRIBUTE = '_memoized'
+
+
+class _MemoizedMethod:
+    """
+    The descriptor that :func:`memoize` wraps methods in.
+    """
+
+    def __init__(self, func: Callable) -> None:
+        self.func = func
+        self.name = func.__name__
+        update_wrapper(self, func)
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> Any:
+        if instance is None:
+            return self
+        return MethodType(self, instance)
+
+    def __call__(self, instance: Any, *a, **k) -> Any:
+        try:
+            key = (self.name, a, tuple(sorted(k.items())))
+            hash(key)
+        except TypeError:
+            # unhashable arguments (or an unsaved model instance); we can't
+            # remember anything about this call
+            return self.func(instance, *a, **k)
+
+        memo = instance.__dict__.setdefault(MEMOIZED_ATTRIBUTE, {})
+
+        hit = memo.get(key, _MISSING)
+        if hit is not _MISSING:
+            return hit
+
+        rv = memo[key] = self.func(instance, *a, **k)
+        return rv
+
+
 def memoize(func: C) -> C:
     """
-    Do nothing, for now; :func:`.lru_cache` does not get wiped for new instances of
-    `self`, which is a problem when we need to catch updates.
+    Remember the return value of a method on the instance it was called on,
+    keyed by the arguments it was called with.
+
+    Unlike :func:`.lru_cache`, nothing outlives the instance, so this is
+    effectively scoped to whatever request loaded the object. Memoized values
+    can be forgotten with :func:`clear_memoized`, which model instances do
+    whenever they are saved or refreshed from the database.
     """
 
-    return func
+    return cast(C, _MemoizedMethod(func))
+
+
+def clear_memoized(instance: Any, *names: str) -> None:
+    """
+    Forget the values memoized on `instance` for the methods called `names`,
+    or for every method if no names are given.
+    """
+
+    memo = instance.__dict__.get(MEMOIZED_ATTRIBUTE)
+
+    if not memo:
+        return
+
+    if names:
+        for key in [key for key in memo if key[0] in names]:
+            del memo[key]
+    else:
+        memo.clear()
 
 
 def cached(seconds: int, cache_key: str) -> Callable[[C], C]:
@@ -228,20 +301,124 @@ def cached(seconds: int, cache_key: str) -> Callable[[C], C]:
     return wrapper
 
 
+def _pk_cached_generation_key(label: str, pk: Any = None) -> str:
+    if pk is None:
+        return f'pk_cached:generation:{label}'
+    else:
+        return f'pk_cached:generation:{label}:{pk}'
+
+
+def _pk_cached_generations(*keys: str) -> list[str]:
+    """
+    Get the current generation tokens for the given generation keys, creating
+    any that are missing. Creating them (rather than assuming some default)
+    means that the eviction of a generation key can never resurrect stale
+    entries that were stored before it was last bumped.
+    """
+
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            token = uuid4().hex
+            if not cache.add(key, token, None):
+                token = cache.get(key, token)
+            generations[key] = token
+
+    return [generations[key] for key in keys]
+
+
+def _pk_cached_arg_fragment(arg: Any) -> str:
+    if isinstance(arg, Model):
+        return f'{arg._meta.label}:{arg.pk}'
+    return repr(arg)
+
+
 def pk_cached(seconds: int) -> Callable[[T], T]:
-    # does nothing (currently), but expresses a desire to cache stuff in future
+    """
+    Cache the return value of a model method in the configured cache for
+    `seconds`, keyed by the model, the pk of the instance, the method and the
+    arguments it was called with.
+
+    Entries can be invalidated with :func:`invalidate_pk_cached` (for specific
+    instances) and :func:`invalidate_pk_cached_model` (for every instance of a
+    model), which is done by the signal handlers in :mod:`.vote.signals`
+    whenever something the cached values depend on changes.
+
+    Instances that have not been saved yet are never cached.
+    """
+
     def wrapper(func: T) -> T:
-        def wrapped(obj, *a, **k):
-            def do_thing(func, pk, *a, **k):
-                return func(obj, *a, **k)
+        name = getattr(func, '__qualname__', repr(func))
 
-            return do_thing(func, obj.pk, *a, **k)
+        @wraps(cast(Callable, func))
+        def wrapped(obj, *a, **k):
+            if obj.pk is None:
+                return cast(Callable, func)(obj, *a, **k)
+
+            label = obj._meta.label
+            model_generation, instance_generation = _pk_cached_generations(
+                _pk_cached_generation_key(label),
+                _pk_cached_generation_key(label, obj.pk),
+            )
+            arg_digest = md5(
+                '|'.join(
+                    chain(
+                        (_pk_cached_arg_fragment(arg) for arg in a),
+                        (
+                            f'{kw}={_pk_cached_arg_fragment(arg)}'
+                            for kw, arg in sorted(k.items())
+                        ),
+                    )
+                ).encode()
+            ).hexdigest()
+            key = (
+                f'pk_cached:{label}:{obj.pk}:{name}:{arg_digest}:'
+                f'{model_generation}:{instance_generation}'
+            )
+
+            hit = cache.get(key, _MISSING)
+            if hit is not _MISSING:
+                return hit
+
+            rv = cast(Callable, func)(obj, *a, **k)
+            cache.set(key, rv, seconds)
+            return rv
 
         return cast(T, wrapped)
 
     return wrapper
 
 
+def invalidate_pk_cached(model: type[Model], *pks: Any) -> None:
+    """
+    Forget everything that :func:`pk_cached` has stored for the instances of
+    `model` with the given `pks`.
+    """
+
+    keys = {
+        _pk_cached_generation_key(model._meta.label, pk)
+        for pk in pks
+        if pk is not None
+    }
+
+    if keys:
+        cache.set_many({key: uuid4().hex for key in keys}, None)
+
+
+def invalidate_pk_cached_model(model: type[Model]) -> None:
+    """
+    Forget everything that :func:`pk_cached` has stored for every instance of
+    `model`.
+    """
+
+    cache.set(_pk_cached_generation_key(model._meta.label), uuid4().hex, None)
+
+
+#: the code last.fm gives errors about things it doesn't know about
+LASTFM_NOT_FOUND = 6
+
+
 def lastfm(**kwargs):
     params = {
         'api_key': settings.LASTFM_API_KEY,
@@ -251,8 +428,31 @@ def lastfm(**kwargs):
 
     params.update(kwargs)
 
-    resp = requests.get('http://ws.audioscrobbler.com/2.0/', params=params)
-    return resp.json()
+    def fetch() -> tuple[dict[str, Any], Optional[bool]]:
+        resp = external_lookups.get(settings.LASTFM_API_URL, params)
+        data = resp.json()
+
+        if 'error' not in data:
+            return data, True
+        elif data['error'] == LASTFM_NOT_FOUND:
+            return data, False
+        else:
+            return data, None
+
+    return cached_lookup('lastfm', kwargs, fetch)
+
+
+def musicbrainz_releases(**kwargs) -> list[dict[str, Any]]:
+    """
+    Search MusicBrainz for releases, with :func:`musicbrainzngs.search_releases`.
+    """
+
+    def fetch() -> tuple[list[dict[str, Any]], bool]:
+        external_lookups.throttle(f'http://{settings.MUSICBRAINZ_HOSTNAME}/')
+        releases = musicbrainzngs.search_releases(**kwargs).get('release-list', [])
+        return releases, bool(releases)
+
+    return cached_lookup('musicbrainz', kwargs, fetch)
 
 
 def assert_never(value: NoReturn) -> NoReturn:
@@ -281,3 +481,4 @@ def vote_edit_cutoff() -> Show:
 
 
 musicbrainzngs.set_useragent('nkd.su', '0', 'http://nkd.su/')
+musicbrainzngs.set_hostname(settings.MUSICBRAINZ_HOSTNAME)
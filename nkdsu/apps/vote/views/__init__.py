@@ -3,7 +3,6 @@ from __future__ import annotations
 import datetime
 from abc import abstractmethod
 from functools import cached_property
-from itertools import chain
 from random import sample
 from typing import Any, Iterable, Optional, Sequence, cast, overload
 
@@ -33,11 +32,11 @@ from django.views.generic import (
 from requests.exceptions import RequestException
 
 from nkdsu.mixins import MarkdownView
+from .. import stats
 from ..anime import get_anime, suggest_anime
 from ..forms import BadMetadataForm, DarkModeForm, RequestForm, VoteForm
 from ..models import (
     ProRouletteCommitment,
-    Profile,
     Request,
     Role,
     Show,
@@ -631,73 +630,11 @@ class Added(
 class Stats(TemplateView):
     section = 'stats'
     template_name = 'stats.html'
-    cache_key = 'stats:context'
-
-    def unique_voters(
-        self, profiles: QuerySet[Profile], twitter_users: QuerySet[TwitterUser]
-    ) -> list[Voter]:
-        seen_ids: set[tuple[Optional[int], Optional[int]]] = set()
-        voters: list[Voter] = []
-
-        for voter in chain(profiles, twitter_users):
-            vid = voter.voter_id
-            if vid not in seen_ids:
-                voters.append(voter)
-                seen_ids.add(voter.voter_id)
-
-        return voters
-
-    def streaks(self) -> list[Voter]:
-        last_votable_show = Show.current().prev()
-        while last_votable_show is not None and not last_votable_show.voting_allowed:
-            last_votable_show = last_votable_show.prev()
-
-        return sorted(
-            self.unique_voters(
-                Profile.objects.filter(user__vote__show=last_votable_show),
-                TwitterUser.objects.filter(vote__show=last_votable_show),
-            ),
-            key=lambda u: u.streak(),
-            reverse=True,
-        )
-
-    def batting_averages(self) -> list[Voter]:
-        users = []
-        minimum_weight = 4
-
-        cutoff = Show.at(timezone.now() - datetime.timedelta(days=7 * 5)).end
-
-        for user in self.unique_voters(
-            Profile.objects.filter(user__vote__date__gt=cutoff),
-            TwitterUser.objects.filter(vote__date__gt=cutoff),
-        ):
-            if user.batting_average(minimum_weight=minimum_weight):
-                users.append(user)
-
-        return sorted(
-            users,
-            key=lambda u: u.batting_average(minimum_weight=minimum_weight) or 0,
-            reverse=True,
-        )
-
-    def popular_tracks(self) -> list[tuple[Track, int]]:
-        cutoff = Show.at(timezone.now() - datetime.timedelta(days=31 * 6)).end
-        tracks = []
-
-        for track in Track.objects.public():
-            tracks.append((track, track.vote_set.filter(date__gt=cutoff).count()))
-
-        return sorted(tracks, key=lambda t: t[1], reverse=True)
+    cache_key = stats.CACHE_KEY
 
     def get_context_data(self, **kwargs) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        context.update(
-            {
-                'streaks': self.streaks,
-                'batting_averages': self.batting_averages,
-                'popular_tracks': self.popular_tracks,
-            }
-        )
+        context.update(stats.context())
         return context
 
 
@@ -1,16 +1,14 @@
 import os
-import plistlib
-from codecs import getreader
-from typing import Optional
+import shutil
+from typing import Any, Optional
 
 from django import forms
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
-from django.core.management import call_command
 from django.forms.widgets import RadioSelect
-from django.http import HttpResponse
+from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.template.response import TemplateResponse
 from django.urls import reverse, reverse_lazy
@@ -27,10 +25,14 @@ from django.views.generic.base import TemplateResponseMixin
 
 from .js import JSApiMixin
 from ..forms import LibraryUploadForm, MyriadExportUploadForm, NoteForm
+from ..jobs import enqueue, job_file
 from ..managers import TrackQuerySet
-from ..models import Block, Note, Profile, Show, Track, TwitterUser, Vote
-from ..myriad_export import entries_for_file
-from ..update_library import MetadataChange, update_library
+from ..models import Block, Job, Note, Profile, Show, Track, TwitterUser, Vote
+from ..update_library import (
+    MetadataChange,
+    discard_library_file,
+    saved_library_plan,
+)
 
 
 class AdminMixin(LoginRequiredMixin):
@@ -388,15 +390,43 @@ class ResetShortlistAndDiscard(AdminAction, DetailView):
         messages.success(self.request, u"'{}' reset".format(self.get_object().title))
 
 
+def plan_library_update(request: HttpRequest, library_update: dict[str, Any]) -> Job:
+    """
+    Queue up a dry run of the library update described by `library_update`,
+    and remember it in the session, along with the update.
+    """
+
+    plan_job = enqueue(
+        'plan_library_update',
+        created_by=request.user,
+        library_path=library_update['library_path'],
+        inudesu=library_update['inudesu'],
+    )
+    request.session['library_update'] = {**library_update, 'plan_job': plan_job.pk}
+    return plan_job
+
+
 class LibraryUploadView(AdminMixin, FormView):
     template_name = 'upload.html'
     form_class = LibraryUploadForm
 
     def form_valid(self, form):
-        self.request.session['library_update'] = {
-            'inudesu': form.cleaned_data['inudesu'],
-            'library_xml': form.cleaned_data['library_xml'].read().decode('utf-8'),
-        }
+        # libraries can be big, so rather than putting this in the session,
+        # keep it on disk until the upload is confirmed
+        with job_file(prefix='library-', suffix='.xml') as library_file:
+            shutil.copyfileobj(form.cleaned_data['library_xml'], library_file)
+
+        previous_update = self.request.session.get('library_update')
+        if previous_update is not None:
+            discard_library_file(previous_update['library_path'])
+
+        plan_library_update(
+            self.request,
+            {
+                'inudesu': form.cleaned_data['inudesu'],
+                'library_path': library_file.name,
+            },
+        )
 
         return redirect(reverse('vote:admin:confirm_upload'))
 
@@ -407,22 +437,61 @@ class LibraryUploadConfirmView(DestructiveAdminAction, TemplateView):
     """
 
     template_name = 'library_update.html'
+    job: Optional[Job] = None
+    plan_job: Optional[Job] = None
+
+    def get(self, request, *args, **kwargs):
+        library_update = request.session.get('library_update')
+
+        if library_update is None or not os.path.exists(library_update['library_path']):
+            request.session.pop('library_update', None)
+            messages.error(request, 'that library upload has expired; try again')
+            return redirect(reverse('vote:admin:upload_library'))
+
+        return super().get(request, *args, **kwargs)
 
-    def update_library(self, dry_run: bool) -> list[MetadataChange]:
+    def get_redirect_url(self):
+        if self.job is not None:
+            return self.job.get_absolute_url()
+        return super().get_redirect_url()
+
+    def get_deets(self) -> Optional[list[MetadataChange]]:
+        # working out the plan takes too long to do here, so the worker does
+        # it, and we show it once it's done
         library_update = self.request.session['library_update']
-        return update_library(
-            plistlib.loads(library_update['library_xml'].encode()),
-            inudesu=library_update['inudesu'],
-            dry_run=dry_run,
+        plan_job = Job.objects.filter(pk=library_update.get('plan_job')).first()
+
+        if plan_job is not None and plan_job.status != Job.SUCCEEDED:
+            self.plan_job = plan_job
+            return None
+
+        plan = saved_library_plan(
+            library_update['library_path'], inudesu=library_update['inudesu']
         )
 
-    def get_deets(self):
-        return self.update_library(dry_run=True)
+        if plan is None:
+            # the tracks have changed since we planned this, so plan it again
+            self.plan_job = plan_library_update(self.request, library_update)
+            return None
 
-    def do_thing(self):
-        changes = self.update_library(dry_run=False)
-        messages.success(self.request, 'library updated')
-        return changes
+        return plan.changes
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        context['plan_job'] = self.plan_job
+        return context
+
+    def do_thing(self) -> None:
+        # the plan we showed in get_deets() is saved alongside the library, so
+        # the worker won't have to work it out again
+        library_update = self.request.session.pop('library_update')
+        self.job = enqueue(
+            'update_library',
+            created_by=self.request.user,
+            library_path=library_update['library_path'],
+            inudesu=library_update['inudesu'],
+        )
+        messages.success(self.request, 'library update queued')
 
 
 class MyriadExportUploadView(AdminMixin, FormView):
@@ -430,23 +499,14 @@ class MyriadExportUploadView(AdminMixin, FormView):
     form_class = MyriadExportUploadForm
 
     def form_valid(self, form: MyriadExportUploadForm) -> HttpResponse:
-        matched = 0
-        unmatched = 0
+        with job_file(prefix='myriad-', suffix='.csv') as csv_file:
+            shutil.copyfileobj(form.cleaned_data['myriad_csv'], csv_file)
 
-        for entry in entries_for_file(
-            getreader('utf-8')(form.cleaned_data['myriad_csv'])
-        ):
-            if entry.update_matched_track():
-                matched += 1
-            else:
-                unmatched += 1
-
-        messages.success(
-            self.request,
-            'myriad export imported. '
-            f'{matched} entries matched to tracks; {unmatched} entries unmatched.',
+        job = enqueue(
+            'import_myriad_export', created_by=self.request.user, csv_path=csv_file.name
         )
-        return redirect(reverse('vote:index'))
+        messages.success(self.request, 'myriad export import queued')
+        return redirect(job.get_absolute_url())
 
 
 class ToggleAbuser(AdminAction, DetailView):
@@ -527,6 +587,21 @@ class ArtlessTracks(AdminMixin, ListView):
         return self.model.objects.filter(background_art='')
 
 
+class UpdateBackgroundArt(AdminAction, View):
+    """
+    Look for background art for every track that doesn't have any.
+    """
+
+    def do_thing(self) -> None:
+        self.url = enqueue(
+            'update_background_art', created_by=self.request.user, quick=True
+        ).get_absolute_url()
+        messages.success(self.request, 'background art update queued')
+
+    def get_redirect_url(self):
+        return self.url
+
+
 class ShortlistSelection(SelectionAdminAction):
     fmt = u'{} shortlisted'
 
@@ -640,8 +715,55 @@ class MigrateAwayFrom(TrackSpecificAdminMixin, FormView):
         target = get_object_or_404(
             self.get_possible_targets(), pk=form.cleaned_data['migration_target']
         )
-        call_command('migrate_away_from', self.get_track().pk, target.pk)
-        return redirect(target.get_absolute_url())
+        job = enqueue(
+            'migrate_away_from',
+            created_by=self.request.user,
+            to_remove_id=self.get_track().pk,
+            target_id=target.pk,
+        )
+        messages.success(self.request, f'migration to {target} queued')
+        return redirect(job.get_absolute_url())
+
+
+class JobList(AdminMixin, ListView):
+    model = Job
+    template_name = 'jobs.html'
+    context_object_name = 'jobs'
+    paginate_by = 20
+
+
+class JobDetail(AdminMixin, DetailView):
+    model = Job
+    template_name = 'job.html'
+    context_object_name = 'job'
+
+
+class RetryJob(DestructiveAdminAction, DetailView):
+    """
+    Run this job again.
+    """
+
+    model = Job
+    job: Optional[Job] = None
+
+    def get_deets(self) -> str:
+        return str(self.get_object())
+
+    def do_thing(self) -> None:
+        failed = self.get_object()
+
+        if failed.status != Job.FAILED:
+            raise ValidationError({'status': ['only failed jobs can be run again']})
+
+        self.job = enqueue(
+            failed.name, created_by=self.request.user, **failed.arguments
+        )
+        messages.success(self.request, f'{failed.name} queued again')
+
+    def get_redirect_url(self):
+        if self.job is not None:
+            return self.job.get_absolute_url()
+        return super().get_redirect_url()
 
 
 class Throw500(AdminMixin, DetailView):
@@ -49,7 +49,7 @@ class TrackAPI(DetailAPIView):
 
 class SearchAPI(APIView, Search):
     def get_api_stuff(self, *a, **k) -> JsonList:
-        return [t.api_dict() for t in self.get_queryset()]
+        return Track.api_dicts(self.get_queryset())
 
 
 class TwitterUserAPI(TwitterUserDetailMixin, DetailAPIView):
@@ -3,7 +3,7 @@ from __future__ import annotations
 import datetime
 from typing import Iterable, Optional, Protocol, TYPE_CHECKING, _ProtocolMeta
 
-from django.db.models import BooleanField, CharField, QuerySet
+from django.db.models import BooleanField, CharField, Exists, Q, QuerySet, Subquery, Sum
 from django.db.models.base import ModelBase
 from django.utils import timezone
 from .utils import memoize
@@ -125,32 +125,23 @@ class Voter(Protocol, metaclass=ModelVoterMeta):
         cutoff: Optional[datetime.datetime] = None,
         minimum_weight: float = 1,
     ) -> Optional[float]:
-        from .models import Show
-
-        def ba(
-            pk: int, current_show_pk: int, cutoff: Optional[datetime.datetime]
-        ) -> tuple[float, float]:
-            score: float = 0
-            weight: float = 0
+        from .models import VoterShowStats
 
-            for vote in self.votes().filter(date__gt=cutoff).prefetch_related('tracks'):
-                success = vote.success()
-                if success is not None:
-                    score += success * vote.weight()
-                    weight += vote.weight()
+        # we only know how successful votes were once their show has ended
+        stats = VoterShowStats.for_voter(self).filter(show__end__lt=timezone.now())
 
-            return (score, weight)
+        if cutoff is not None:
+            stats = stats.filter(show__end__gt=cutoff)
 
-        score, weight = ba(self.pk, Show.current().pk, cutoff)
+        totals = stats.aggregate(successes=Sum('successes'), weight=Sum('weight'))
+        weight = totals['weight'] or 0
 
-        if weight >= minimum_weight:
-            return score / weight
+        if weight and weight >= minimum_weight:
+            return totals['successes'] / weight
         else:
             # there were no worthwhile votes
             return None
 
-        return score
-
     @memoize
     def batting_average(self, minimum_weight: float = 1) -> Optional[float]:
         """
@@ -164,33 +155,25 @@ class Voter(Protocol, metaclass=ModelVoterMeta):
             minimum_weight=minimum_weight,
         )
 
-    def _streak(self, ls=[]) -> int:
-        from .models import Show
-
-        show = Show.current().prev()
-        streak = 0
+    def _streak(self) -> int:
+        from .models import Show, VoterShowStats
 
-        while True:
-            if show is None:
-                return streak
-            elif not show.voting_allowed:
-                show = show.prev()
-            elif self.votes().filter(show=show).exists():
-                streak += 1
-                show = show.prev()
-            else:
-                break
+        # the most recent show before this one that we could have voted
+        # during, but didn't
+        earlier = Show.objects.filter(end__lt=Show.current().end, voting_allowed=True)
+        last_missed = (
+            earlier.exclude(pk__in=VoterShowStats.for_voter(self).values('show_id'))
+            .order_by('-end')
+            .values('end')[:1]
+        )
 
-        return streak
+        return earlier.filter(
+            Q(end__gt=Subquery(last_missed)) | Q(~Exists(last_missed))
+        ).count()
 
     @memoize
     def streak(self) -> int:
-        from .models import Show
-
-        def streak(pk, current_show):
-            return self._streak()
-
-        return streak(self.pk, Show.current())
+        return self._streak()
 
     def all_time_batting_average(self, minimum_weight: float = 1) -> Optional[float]:
         return self._batting_average(minimum_weight=minimum_weight)
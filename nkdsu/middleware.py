@@ -6,6 +6,7 @@ from django.shortcuts import redirect
 from django.urls import reverse
 from social_core.exceptions import NotAllowedToDisconnect
 
+from .apps.vote.show_registry import show_registry
 from .apps.vote.twitter_auth import DoNotAuthThroughTwitterPlease
 
 
@@ -66,3 +67,19 @@ class SocialAuthHandlingMiddleware:
             )
         else:
             return redirect(reverse('login'))
+
+
+class ShowRegistryMiddleware:
+    """
+    Resolve each :class:`.Show` at most once per request, by handling every
+    request within a :func:`.show_registry`.
+    """
+
+    get_response: Callable[[HttpRequest], HttpResponse]
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        with show_registry():
+            return self.get_response(request)
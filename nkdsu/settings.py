@@ -60,6 +60,22 @@ TWEET_LENGTH = 280
 #: The maximum number of tracks that can be associated with a single Vote object
 MAX_REQUEST_TRACKS = 6
 
+#: How many distinct artist strings to keep parsed artists in memory for
+PARSE_ARTIST_CACHE_SIZE = 4096
+
+#: Whether to load the whole anime index into memory when the WSGI
+#: application is loaded, so that forked workers can share it
+ANIME_CATALOG_PRELOAD = False
+
+#: How many anime to keep in memory once they've been looked up by title
+ANIME_CACHE_SIZE = 1024
+
+#: Where to keep the index that ``build_anime_index`` compiles the anime offline
+#: database into. Whatever builds it needs to be able to write here.
+ANIME_INDEX_PATH = os.path.join(
+    PROJECT_DIR, 'apps', 'vote', 'data', 'anime-index.sqlite3'
+)
+
 OPTIONS = {'timeout': 20}
 
 # social-auth
@@ -72,6 +88,42 @@ MIXCLOUD_USERNAME = 'NekoDesu'
 
 LASTFM_API_KEY = ''  # secret
 LASTFM_API_SECRET = ''  # secret
+LASTFM_API_URL = 'http://ws.audioscrobbler.com/2.0/'
+MUSICBRAINZ_HOSTNAME = 'musicbrainz.org'
+
+#: How long to wait for last.fm, MusicBrainz or an image host to respond
+LOOKUP_TIMEOUT = 15
+
+#: How long to remember what last.fm and MusicBrainz tell us, in seconds
+LOOKUP_CACHE_TTL = 60 * 60 * 24 * 30
+
+#: How long to remember that last.fm or MusicBrainz didn't know about
+#: something, in seconds
+LOOKUP_NOT_FOUND_TTL = 60 * 60 * 24 * 3
+
+#: How many requests per second we let ourselves make to each host when
+#: fetching background art for lots of tracks at once
+BACKGROUND_ART_RATE_LIMITS = {
+    'ws.audioscrobbler.com': 5,
+    'musicbrainz.org': 1,
+}
+
+#: Where uploaded files wait for the ``run_jobs`` worker to deal with them. The
+#: website and the worker both need to be able to see the same directory here,
+#: so don't use one that's private to a single service.
+JOB_FILE_DIR = os.path.join(PROJECT_DIR, 'job-files')
+
+#: How long to keep files in JOB_FILE_DIR that no unfinished job is waiting
+#: for, like libraries that were uploaded but never confirmed, in seconds
+JOB_FILE_MAX_AGE = 60 * 60 * 24
+
+#: How long a job can go without hearing from the worker running it before we
+#: assume that worker has died and queue the job up again, in seconds
+JOB_STALE_AFTER = 60 * 60
+
+#: How often ``snapshot_stats`` works the stats page's numbers out again, in
+#: seconds. It always does once a show ends.
+STATS_SNAPSHOT_INTERVAL = 60 * 60
 
 DEBUG = False
 TEMPLATE_DEBUG = DEBUG
@@ -113,7 +165,14 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
         'LOCATION': '127.0.0.1:11211',
-    }
+    },
+    # what last.fm and musicbrainz have told us, which is worth keeping
+    # around for longer than memcached would
+    'lookups': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(PROJECT_DIR, 'lookup-cache'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
 
 TIME_ZONE = 'Europe/London'
@@ -141,6 +200,7 @@ STATICFILES_FINDERS = (
 SECRET_KEY = 'please replace me with something decent in production'  # secret
 
 MIDDLEWARE = [
+    'nkdsu.middleware.ShowRegistryMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -23,7 +23,13 @@ CACHES = {
         # manage.py createcachetable` after you've uncommented these:
         # 'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         # 'LOCATION': 'nk_cache_table',
-    }
+    },
+    # what last.fm and musicbrainz have told us; if you leave this out, it'll
+    # go in the default cache
+    'lookups': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(PROJECT_DIR, 'lookup-cache'),
+    },
 }
 
 DATABASES = {
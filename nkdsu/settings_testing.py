@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from nkdsu.settings import *  # noqa
 
 DEBUG = False
@@ -9,5 +12,10 @@ STATIC_URL = '/static/'
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
+    },
+    'lookups': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
 }
+
+JOB_FILE_DIR = os.path.join(tempfile.gettempdir(), 'nkdsu-test-job-files')
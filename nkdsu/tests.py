@@ -45,6 +45,8 @@ class EverythingTest(
         '/vote-admin/no-media-id/',
         '/vote-admin/inudesu/',
         '/vote-admin/artless/',
+        '/vote-admin/update-background-art/',
+        '/vote-admin/jobs/',
         '/vote-admin/add-manual-vote/0007C3F2760E0541/',
         '/vote-admin/upload/',
         '/vote-admin/upload-myriad/',
@@ -144,6 +146,9 @@ class EverythingTest(
         # can only be accessed by particular users
         '/update-request/1/',
         '/vote-admin/unmatched-anime/',
+        # needs a job to have been queued (or, to retry, to have failed)
+        '/vote-admin/jobs/1/',
+        '/vote-admin/jobs/1/retry/',
         # is intentionally broken
         '/vote-admin/throw-500/',
     ]
@@ -1,7 +1,18 @@
+import gc
 import os
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nkdsu.settings")
 
+from django.conf import settings  # noqa
 from django.core.wsgi import get_wsgi_application  # noqa
 
 application = get_wsgi_application()
+
+if settings.ANIME_CATALOG_PRELOAD:
+    from nkdsu.apps.vote.anime import preload_anime_catalog
+
+    preload_anime_catalog()
+
+    # keep the garbage collector from touching (and therefore copying into
+    # every worker) everything we've loaded so far
+    gc.freeze()